@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class BoardConfig(AppConfig):
     name = 'board'
+
+    def ready(self):
+        from . import authentication, cache, events, replicas, stats  # noqa: F401, connects the receivers
+        replicas.check_settings()
@@ -0,0 +1,74 @@
+"""
+the task archive: done tasks of closed sprints are moved to the archive table in batches, off the hot task table,
+and read back with it by the task list of their sprint, the task detail, the sprint board and the sprint stats
+"""
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import cache
+from .models import ArchivedTask, CollectionVersion, Sprint, Task
+
+BATCH_SIZE = 1000  # tasks moved per transaction
+
+
+def archivable(before):
+    """the done tasks of the sprints ended before the given day, never edited again"""
+    return Task.objects.filter(status=Task.STATUS_DONE, sprint__in=Sprint.objects.filter(end__lt=before).values('pk'))
+
+
+def archive_batch(before, batch_size=BATCH_SIZE):
+    """move the next batch of archivable tasks, the oldest ids first, in one transaction.
+    Returns the number of tasks moved and their sprints"""
+    with transaction.atomic():
+        rows = list(archivable(before).select_for_update().order_by('pk').values_list(
+            'pk', 'sprint_id')[:batch_size])  # locked, a concurrent edit waits for the move, then updates no row
+        if not rows:
+            return 0, set()
+        move(rows[0][0], rows[-1][0], before)
+        CollectionVersion.bump(CollectionVersion.TASKS)  # the task lists and their validators change
+    cache.invalidate(CollectionVersion.TASKS)  # the lists by sprint stay the same, the archive is read with them
+    return len(rows), set(sprint_id for pk, sprint_id in rows)
+
+
+def move(first, last, before):
+    """copy the archivable tasks with ids from first to last into the archive and delete them, in SQL
+    without loading the rows or sending the delete signals: the tasks are not deleted for the API"""
+    connection = connections[Task.objects.db]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in Task._meta.concrete_fields)
+    pk = quote(Task._meta.pk.column)
+    task_table, archive_table = quote(Task._meta.db_table), quote(ArchivedTask._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {archive} ({columns}, {archived_at}) SELECT {columns}, %s FROM {task} '
+            'WHERE {pk} BETWEEN %s AND %s AND {status} = %s AND {sprint} IN (SELECT {sprint_pk} FROM {sprints} '
+            'WHERE {end} < %s)'.format(
+                archive=archive_table, columns=columns, archived_at=quote('archived_at'), task=task_table, pk=pk,
+                status=quote('status'), sprint=quote(Task._meta.get_field('sprint').column),
+                sprint_pk=quote(Sprint._meta.pk.column), sprints=quote(Sprint._meta.db_table), end=quote('end')),
+            [connection.ops.adapt_datetimefield_value(timezone.now()), first, last, Task.STATUS_DONE,
+             connection.ops.adapt_datefield_value(before)])
+        cursor.execute(
+            'DELETE FROM {task} WHERE {pk} IN (SELECT {pk} FROM {archive} WHERE {pk} BETWEEN %s AND %s)'.format(
+                task=task_table, archive=archive_table, pk=pk),
+            [first, last])
+
+
+def restore():
+    """move every archived task back to the task table, in one transaction. Returns the number of tasks moved"""
+    connection = connections[Task.objects.db]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in Task._meta.concrete_fields)
+    task_table, archive_table = quote(Task._meta.db_table), quote(ArchivedTask._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('INSERT INTO {task} ({columns}) SELECT {columns} FROM {archive}'.format(
+            task=task_table, columns=columns, archive=archive_table))
+        cursor.execute('DELETE FROM {archive}'.format(archive=archive_table))
+        count = cursor.rowcount
+        CollectionVersion.bump(CollectionVersion.TASKS)
+    cache.invalidate(CollectionVersion.TASKS)
+    return count
+
+
+def has_archived_tasks(sprint_id):
+    return ArchivedTask.objects.filter(sprint_id=sprint_id).exists()
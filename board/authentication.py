@@ -0,0 +1,170 @@
+"""
+authentication classes that remember the credentials they checked, so an API call does not pay a token query
+or a password hash
+"""
+import hashlib  # for digests of the basic auth credentials
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model  # for a uniformed user model
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework import authentication
+from rest_framework.authtoken.models import Token
+
+from scrum.processes import is_shared_cache
+
+from .models import is_login_save
+
+User = get_user_model()  # the uniformed user model
+
+TTL = getattr(settings, 'BOARD_AUTH_CACHE_TTL', 60)  # seconds a checked credential is trusted without the database
+MAX_ENTRIES = getattr(settings, 'BOARD_AUTH_CACHE_SIZE', 10000)  # per process
+SHARED_CACHE_ALIAS = getattr(settings, 'BOARD_AUTH_SHARED_CACHE', None)  # a cache alias shared by the workers, optional
+# a change to a token or user clears the remembered credentials of this process only, unless the shared cache carries
+# it to the others: with several workers and no shared cache nothing is remembered
+ENABLED = is_shared_cache(SHARED_CACHE_ALIAS) or getattr(settings, 'WEB_CONCURRENCY', 1) == 1
+PREFIX = 'board:auth'
+GENERATION = PREFIX + ':generation'
+
+
+class LocalCache(object):
+    """Bounded in-process LRU with expiry, safe to share between threads."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.epoch = 0  # bumped by every clear, results read from the database before a clear are not kept
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():  # expired
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)  # most recently used
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)  # least recently used
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.epoch += 1
+
+
+local_cache = LocalCache(MAX_ENTRIES, TTL)
+
+
+def get_shared_cache():
+    return caches[SHARED_CACHE_ALIAS] if SHARED_CACHE_ALIAS else None
+
+
+def get_generation():
+    """the tag entries must carry to be trusted: the local epoch and the shared generation,
+    which any worker that sees a token or user change rotates"""
+    shared = get_shared_cache()
+    if shared is None:
+        return (local_cache.epoch, None)
+    generation = shared.get(GENERATION)
+    if generation is None:  # evicted or never set, start a new one so no old entry matches
+        generation = hashlib.md5(str(time.time()).encode('ascii')).hexdigest()
+        if not shared.add(GENERATION, generation, None):
+            generation = shared.get(GENERATION, generation)
+    return (local_cache.epoch, generation)
+
+
+def lookup(key, generation):
+    """the remembered result for a credential key, from this process first, then from the shared tier"""
+    if not ENABLED:
+        return None
+    entry = local_cache.get(key)
+    if entry is not None and entry[0] == generation:
+        return entry[1]
+    shared = get_shared_cache()
+    if shared is not None:
+        entry = shared.get(PREFIX + ':' + key)
+        if entry is not None and entry[0][1] == generation[1]:
+            local_cache.set(key, (generation, entry[1]))
+            return entry[1]
+    return None
+
+
+def remember(key, generation, result):
+    """keep a result under the generation read before the database was asked,
+    so a change made while asking leaves it untrusted"""
+    if not ENABLED:
+        return
+    local_cache.set(key, (generation, result))
+    shared = get_shared_cache()
+    if shared is not None:
+        shared.set(PREFIX + ':' + key, (generation, result), TTL)
+
+
+def invalidate():
+    """forget every remembered credential, here and in the workers sharing the cache"""
+    local_cache.clear()
+    shared = get_shared_cache()
+    if shared is not None:
+        shared.delete(GENERATION)  # the next lookup starts a new generation
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_credentials(sender, **kwargs):
+    """a deleted or rotated token, a new password or a deactivated user takes effect on the next request"""
+    if not is_login_save(sender, **kwargs):
+        invalidate()
+
+
+class CachedTokenAuthentication(authentication.TokenAuthentication):
+    """Token authentication remembering the token and its user instead of querying them on every call."""
+
+    def authenticate_credentials(self, key):
+        cache_key = 'token:' + hashlib.sha256(key.encode('utf-8')).hexdigest()
+        generation = get_generation()
+        result = lookup(cache_key, generation)
+        if result is None:
+            result = super(CachedTokenAuthentication, self).authenticate_credentials(key)
+            remember(cache_key, generation, result)
+        return result
+
+
+class CachedBasicAuthentication(authentication.BasicAuthentication):
+    """Basic authentication remembering valid credentials, so the password is hashed once per TTL, not per call."""
+
+    def authenticate_credentials(self, userid, password):
+        credentials = '{}:{}'.format(userid, password).encode('utf-8')
+        digest = hmac.new(settings.SECRET_KEY.encode('utf-8'), credentials, hashlib.sha256).hexdigest()
+        cache_key = 'basic:' + digest  # never the password itself
+        generation = get_generation()
+        result = lookup(cache_key, generation)
+        if result is None:
+            result = super(CachedBasicAuthentication, self).authenticate_credentials(userid, password)
+            remember(cache_key, generation, result)
+        return result
+
+
+class QueryTokenAuthentication(CachedTokenAuthentication):
+    """The token in ?token=, for EventSource streams, which cannot send an Authorization header."""
+
+    def authenticate(self, request):
+        key = request.query_params.get('token')
+        if not key:
+            return None
+        return self.authenticate_credentials(key)
@@ -0,0 +1,501 @@
+"""
+API benchmark: a seeded dataset, scenarios driving the viewsets in process with DRF's test client
+or over HTTP against a running server, and latency, query and throughput figures that can be saved
+and compared between commits or server setups. The list serializers can also be timed alone, full against
+the values() fast path, in rows per second, and the task end points as the closed sprint history grows,
+with that history in the task table and archived
+"""
+import datetime
+import http.client
+import json
+import math
+import platform
+import random
+import subprocess
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model  # for a uniformed user model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder  # dates in the compared payloads
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import archive
+from .models import COLLECTIONS, ArchivedTask, CollectionVersion, Profile, Sprint, Task
+
+User = get_user_model()  # the uniformed user model
+
+WORDS = ('fix', 'add', 'login', 'page', 'report', 'export', 'api', 'cache', 'search', 'board', 'sprint', 'user',
+         'profile', 'email', 'token', 'layout', 'mobile', 'error', 'upload', 'review', 'test', 'deploy', 'index')
+BATCH_SIZE = 1000  # rows per insert while seeding
+
+
+def words(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def seed(users=50, sprints=20, tasks=5000, random_seed=0):
+    """fill an empty database with a reproducible board, rows are bulk inserted without the model signals.
+
+    Assignment follows a Zipf-like skew (a few users own most of the tasks, a fifth is unassigned),
+    a third of the tasks sit in the backlog, tasks of past sprints are mostly done and those of future ones
+    not started. Every user has the password "benchmark". Returns the username of the staff user."""
+    rng = random.Random(random_seed)
+    today = datetime.date.today()
+    password_hash = make_password('benchmark')  # hashed once, not per user
+
+    User.objects.bulk_create([
+        User(username='user{}'.format(index), password=password_hash, is_staff=index == 0)
+        for index in range(max(users, 1))
+    ], batch_size=BATCH_SIZE)
+    user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+    Profile.objects.bulk_create([
+        Profile(user_id=pk, first_name=words(rng, 1), last_name=words(rng, 1), city=words(rng, 1))
+        for pk in user_ids
+    ], batch_size=BATCH_SIZE)
+    weights = [1.0 / rank for rank in range(1, len(user_ids) + 1)]
+
+    current = sprints // 2  # half the sprints are over
+    Sprint.objects.bulk_create([
+        Sprint(name='Sprint {}'.format(index), description=words(rng, 10),
+               end=today + datetime.timedelta(days=14 * (index - current) + 7))
+        for index in range(sprints)
+    ], batch_size=BATCH_SIZE)
+    sprint_rows = list(Sprint.objects.order_by('pk').values_list('pk', 'end'))
+
+    batch = []
+    for index in range(tasks):
+        task = Task(name=words(rng, rng.randint(2, 6)), description=words(rng, rng.choice((0, 5, 20, 200))),
+                    order=index, status=Task.STATUS_TODO)
+        if sprint_rows and rng.random() > 0.33:
+            task.sprint_id, end = rng.choice(sprint_rows)
+            if end < today:
+                task.status = rng.choice((Task.STATUS_DONE, ) * 8 + (Task.STATUS_IN_PROGRESS, Task.STATUS_TESTING))
+            elif end - today < datetime.timedelta(days=14):
+                task.status = rng.choice((Task.STATUS_TODO, Task.STATUS_IN_PROGRESS, Task.STATUS_TESTING,
+                                          Task.STATUS_DONE))
+            if task.status != Task.STATUS_TODO:
+                task.started = end - datetime.timedelta(days=rng.randint(5, 14))
+            if task.status == Task.STATUS_DONE:
+                task.completed = task.started + datetime.timedelta(days=rng.randint(0, 4))
+        if rng.random() > 0.2:
+            task.assigned_id = rng.choices(user_ids, weights)[0]
+        batch.append(task)
+        if len(batch) == BATCH_SIZE:
+            Task.objects.bulk_create(batch)
+            batch = []
+    Task.objects.bulk_create(batch)
+    touch_collections()
+    return 'user0'
+
+
+def seed_history(sprints=20, tasks=10000, random_seed=0):
+    """add sprints ended before any other, their tasks all done, as the board of a team would after years"""
+    rng = random.Random(random_seed)
+    oldest = Sprint.objects.order_by('end').values_list('end', flat=True).first() or datetime.date.today()
+    Sprint.objects.bulk_create([
+        Sprint(name='Past sprint {}'.format(index), description=words(rng, 10),
+               end=oldest - datetime.timedelta(days=14 * (index + 1)))
+        for index in range(max(sprints, 1))
+    ], batch_size=BATCH_SIZE)
+    sprint_rows = list(Sprint.objects.filter(end__lt=oldest).values_list('pk', 'end'))
+    user_ids = list(User.objects.values_list('pk', flat=True))
+
+    batch = []
+    for index in range(tasks):
+        sprint_id, end = rng.choice(sprint_rows)
+        started = end - datetime.timedelta(days=rng.randint(5, 14))
+        batch.append(Task(
+            name=words(rng, rng.randint(2, 6)), description=words(rng, rng.choice((0, 5, 20, 200))), order=index,
+            status=Task.STATUS_DONE, sprint_id=sprint_id, started=started,
+            completed=started + datetime.timedelta(days=rng.randint(0, 4)),
+            assigned_id=rng.choice(user_ids) if user_ids and rng.random() > 0.2 else None))
+        if len(batch) == BATCH_SIZE:
+            Task.objects.bulk_create(batch)
+            batch = []
+    Task.objects.bulk_create(batch)
+    touch_collections()
+
+
+def touch_collections():
+    """what the signals would have done for rows bulk inserted"""
+    now = timezone.now()
+    for name in set(COLLECTIONS.values()):
+        CollectionVersion.bump(name, now)
+    caches['default'].clear()
+
+
+class Scenario(object):
+    """One kind of API call, with the arguments drawn for each request."""
+
+    def __init__(self, name, method, path, data=None):
+        self.name = name
+        self.method = method
+        self.path = path  # a format string filled in with the drawn arguments
+        self.data = data  # a function of the drawn arguments, for writes
+
+    def request(self, client, arguments):
+        path = self.path.format(**arguments)
+        if self.method == 'get':
+            return client.get(path)
+        return getattr(client, self.method)(path, self.data(arguments), format='json')
+
+
+SCENARIOS = (
+    Scenario('sprint-list', 'get', '/api/sprints'),
+    Scenario('sprint-detail', 'get', '/api/sprints/{sprint}'),
+    Scenario('sprint-board', 'get', '/api/sprints/{sprint}/board'),
+    Scenario('task-list', 'get', '/api/tasks'),
+    Scenario('task-list-sprint', 'get', '/api/tasks?sprint={sprint}'),
+    Scenario('task-list-backlog', 'get', '/api/tasks?backlog=True'),
+    Scenario('task-search', 'get', '/api/tasks?search={word}'),
+    Scenario('task-detail', 'get', '/api/tasks/{task}'),
+    Scenario('task-update', 'patch', '/api/tasks/{task}', lambda arguments: {'order': arguments['order']}),
+    Scenario('user-list', 'get', '/api/users'),
+    Scenario('user-detail', 'get', '/api/users/{username}'),
+)
+
+
+def percentile(values, percent):
+    """nearest rank percentile of sorted values"""
+    if not values:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def get_token(username):
+    user = User.objects.get(username=username)
+    return Token.objects.get_or_create(user=user)[0].key
+
+
+class Arguments(object):
+    """Draws the arguments of the requests from the seeded rows."""
+
+    def __init__(self, random_seed, sprint_ids=None):
+        self.rng = random.Random(random_seed)
+        self.sprint_ids = list(sprint_ids or Sprint.objects.values_list('pk', flat=True)) or [0]
+        self.task_ids = list(Task.objects.values_list('pk', flat=True)) or [0]
+        self.usernames = list(User.objects.values_list('username', flat=True))
+
+    def draw(self):
+        rng = self.rng
+        return {'sprint': rng.choice(self.sprint_ids), 'task': rng.choice(self.task_ids), 'word': rng.choice(WORDS),
+                'username': rng.choice(self.usernames), 'order': rng.randint(0, 1000)}
+
+
+def summarize(latencies, queries, statuses, requests, total):
+    """the figures of one scenario, queries is None when they cannot be counted"""
+    latencies.sort()
+    result = OrderedDict([('requests', requests)])
+    if latencies:
+        result.update([
+            ('p50_ms', round(percentile(latencies, 50), 3)),
+            ('p90_ms', round(percentile(latencies, 90), 3)),
+            ('p99_ms', round(percentile(latencies, 99), 3)),
+            ('mean_ms', round(sum(latencies) / len(latencies), 3)),
+            ('max_ms', round(latencies[-1], 3)),
+        ])
+    if queries is not None:
+        result.update([
+            ('queries_per_request', round(float(sum(queries)) / len(queries), 2)),
+            ('max_queries', max(queries)),
+        ])
+    result['throughput_rps'] = round(len(latencies) / total, 1)
+    result['statuses'] = dict(sorted((str(code), count) for code, count in statuses.items()))  # codes or error
+    return result
+
+
+def run(scenarios=SCENARIOS, requests=200, warmup=20, cold=False, random_seed=0, username='user0', sprint_ids=None):
+    """time every scenario, each on the same sequence of drawn arguments for a given seed, the sprints
+    drawn among sprint_ids when given"""
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + get_token(username))
+    arguments = Arguments(random_seed, sprint_ids)
+
+    results = OrderedDict()
+    for scenario in scenarios:
+        latencies, queries, statuses = [], [], Counter()
+        started = time.perf_counter()
+        for index in range(warmup + requests):
+            drawn = arguments.draw()
+            if cold:
+                caches['default'].clear()  # every list misses the response cache
+            if index == warmup:
+                started = time.perf_counter()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = scenario.request(client, drawn)
+                elapsed = time.perf_counter() - start
+            if index >= warmup:
+                latencies.append(elapsed * 1000)
+                queries.append(len(context.captured_queries))
+                statuses[response.status_code] += 1
+        results[scenario.name] = summarize(latencies, queries, statuses, requests, time.perf_counter() - started)
+    return results
+
+
+HISTORY_SCENARIOS = ('sprint-board', 'task-list', 'task-list-sprint', 'task-list-backlog', 'task-search')
+
+
+def analyze():
+    """refresh the planner statistics after rows moved, PostgreSQL also reclaims the deleted ones"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for model in (Task, ArchivedTask):
+                cursor.execute('VACUUM ANALYZE {}'.format(connection.ops.quote_name(model._meta.db_table)))
+        else:
+            cursor.execute('ANALYZE')
+
+
+def run_history(steps=3, sprints=20, tasks=10000, requests=200, warmup=20, random_seed=0):
+    """grow the closed sprint history by the given sprints and done tasks steps times, and time the task
+    end points at each step twice on the same rows: with the history in the task table, then archived.
+
+    Every request misses the response cache, the task table is read each time. The sprints are drawn among
+    those of the board before the history was added, the history is only in the task table's way."""
+    scenarios = [scenario for scenario in SCENARIOS if scenario.name in HISTORY_SCENARIOS]
+    sprint_ids = list(Sprint.objects.values_list('pk', flat=True))
+    today = datetime.date.today()
+    results = []
+    for step in range(1, steps + 1):
+        seed_history(sprints, tasks, random_seed + step)
+        archive.restore()
+        analyze()
+        hot = OrderedDict([('task_rows', Task.objects.count())])
+        hot['scenarios'] = run(scenarios, requests, warmup, True, random_seed, sprint_ids=sprint_ids)
+        while archive.archive_batch(today)[0]:
+            pass
+        analyze()
+        archived = OrderedDict([('task_rows', Task.objects.count())])
+        archived['scenarios'] = run(scenarios, requests, warmup, True, random_seed, sprint_ids=sprint_ids)
+        results.append(OrderedDict([('history_tasks', step * tasks), ('hot', hot), ('archived', archived)]))
+    return results
+
+
+def list_pages(viewset, page_size):
+    """the page of a list end point read for the full serializer and for the values() fast path,
+    each a function of the request context returning the representations"""
+    queryset = viewset.queryset.all()
+    serializer_class = viewset.serializer_class
+
+    def full(context):
+        return serializer_class(list(queryset[:page_size]), many=True, context=context).data
+
+    def values(context):
+        columns, represent = serializer_class.get_row_reader(context)
+        return represent(queryset.values(*columns)[:page_size])
+    return full, values
+
+
+def rows_per_second(function, repeat):
+    """(rows per second, the last result) of calling function repeat times, each call returning a list of rows"""
+    function()  # warm up, url patterns and compiled fields
+    rows = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+        rows += len(result)
+    return round(rows / (time.perf_counter() - started), 1), result
+
+
+def to_json(data):
+    return json.dumps(data, cls=DjangoJSONEncoder)
+
+
+def run_serializers(page_size=100, repeat=200):
+    """rows per second of the sprint, task and user list pages on the full serializers and on the values()
+    fast path, with the page query ('page') and for the representation alone ('serialize', rows already read)"""
+    from .views import SprintViewSet, TaskViewSet, UserViewSet  # the querysets and serializers the lists use
+    request = Request(APIRequestFactory().get('/api/'))
+    results = OrderedDict()
+    for name, viewset in (('sprints', SprintViewSet), ('tasks', TaskViewSet), ('users', UserViewSet)):
+        full, values = list_pages(viewset, page_size)
+        full_page, full_data = rows_per_second(lambda: full({'request': request}), repeat)
+        values_page, values_data = rows_per_second(lambda: values({'request': request}), repeat)
+
+        serializer_class = viewset.serializer_class
+        instances = list(viewset.queryset.all()[:page_size])
+        columns, represent = serializer_class.get_row_reader({'request': request})
+        rows = list(viewset.queryset.values(*columns)[:page_size])
+        full_serialize, _ = rows_per_second(
+            lambda: serializer_class(instances, many=True, context={'request': request}).data, repeat)
+        values_serialize, _ = rows_per_second(
+            lambda: serializer_class.get_row_reader({'request': request})[1](rows), repeat)
+        results[name] = OrderedDict([
+            ('rows', len(full_data)),
+            ('full_page_rows_per_s', full_page),
+            ('values_page_rows_per_s', values_page),
+            ('full_serialize_rows_per_s', full_serialize),
+            ('values_serialize_rows_per_s', values_serialize),
+            ('speedup', round(values_page / full_page, 2) if full_page else None),  # of the page, as the list reads it
+            ('identical', to_json(full_data) == to_json(values_data)),  # the fast path must not change the output
+        ])
+    return results
+
+
+HTTPResponse = namedtuple('HTTPResponse', 'status_code server')
+
+
+class HTTPClient(object):
+    """A keep-alive connection to the server under test, with the calls of DRF's test client the scenarios use."""
+    timeout = 60  # seconds
+
+    def __init__(self, url, token):
+        parts = urlsplit(url)
+        self.host, self.port, self.prefix = parts.hostname, parts.port or 80, parts.path.rstrip('/')
+        self.headers = {'Authorization': 'Token ' + token, 'Accept': 'application/json'}
+        self.connection = None
+
+    def get(self, path):
+        return self.request('GET', path)
+
+    def patch(self, path, data, format=None):
+        return self.request('PATCH', path, json.dumps(data))
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(self.headers, **(headers or {}))
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        for retry in (False, True):  # once more on a new connection when the server closed the idle one
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.connection.request(method, self.prefix + path, body, headers)
+                response = self.connection.getresponse()
+                response.read()
+                return HTTPResponse(response.status, response.getheader('Server'))
+            except (http.client.HTTPException, OSError):
+                self.close()
+                if retry:
+                    raise
+
+    def listen(self, path):
+        """open an event stream and leave it open, the response is returned once its headers are in"""
+        self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        self.connection.request('GET', self.prefix + path, headers={'Accept': 'text/event-stream'})
+        return self.connection.getresponse()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def open_listeners(url, token, sprint_ids, count, timeout=10):
+    """count idle board event streams, as open board tabs keep them; the clients of the streams that opened"""
+    def open_one(sprint_id):
+        client = HTTPClient(url, token)
+        client.timeout = timeout
+        try:
+            response = client.listen('/api/sprints/{}/events?token={}'.format(sprint_id, token))
+            if response.status == 200:
+                return client
+        except (http.client.HTTPException, OSError):  # the server had no room for it
+            pass
+        client.close()
+        return None
+    with ThreadPoolExecutor(max_workers=min(max(count, 1), 100)) as executor:
+        clients = list(executor.map(open_one, [sprint_ids[index % len(sprint_ids)] for index in range(count)]))
+    return [client for client in clients if client is not None]
+
+
+def run_http(url, scenarios=SCENARIOS, requests=200, warmup=20, concurrency=10, listeners=0, random_seed=0,
+             username='user0'):
+    """time every scenario against a running server, concurrency clients sending the requests at once
+    while listeners board event streams stay open. Returns the results and the server's Server header"""
+    token = get_token(username)
+    arguments = Arguments(random_seed)
+    local = threading.local()  # one connection per client thread
+    clients = []
+    servers = Counter()
+
+    def call(scenario, drawn):
+        """(milliseconds, status, Server header) of one request"""
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = HTTPClient(url, token)
+            clients.append(client)
+        start = time.perf_counter()
+        try:
+            response = scenario.request(client, drawn)
+        except (http.client.HTTPException, OSError):
+            return None, 'error', None
+        return (time.perf_counter() - start) * 1000, response.status_code, response.server
+
+    open_streams = open_listeners(url, token, arguments.sprint_ids, listeners) if listeners else []
+    results = OrderedDict()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for scenario in scenarios:
+                drawn = [arguments.draw() for _ in range(warmup + requests)]
+                list(executor.map(lambda item: call(scenario, item), drawn[:warmup]))
+                started = time.perf_counter()
+                timed = list(executor.map(lambda item: call(scenario, item), drawn[warmup:]))
+                total = time.perf_counter() - started
+                latencies = [elapsed for elapsed, status, server in timed if elapsed is not None]
+                statuses = Counter(status for elapsed, status, server in timed)
+                servers.update(server for elapsed, status, server in timed if server)
+                results[scenario.name] = summarize(latencies, None, statuses, requests, total)
+                results[scenario.name]['listeners'] = len(open_streams)
+    finally:
+        for client in clients + open_streams:
+            client.close()
+    server = servers.most_common(1)[0][0] if servers else None
+    return results, server
+
+
+def environment(server=None):
+    """what the figures were taken on, to tell apart runs that cannot be compared"""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return OrderedDict([
+        ('commit', commit),
+        ('date', timezone.now().isoformat()),
+        ('python', platform.python_version()),
+        ('django', django.get_version()),
+        ('database', connection.vendor),
+        ('server', server),  # the Server header, for runs over HTTP
+    ])
+
+
+def compare(previous, current, metrics=('p50_ms', 'p99_ms', 'queries_per_request', 'throughput_rps'),
+            section='scenarios'):
+    """(scenario, metric, before, after, change in percent) for the scenarios of both runs"""
+    rows = []
+    for name, result in current.get(section, {}).items():
+        before = previous.get(section, {}).get(name)
+        if before is None:
+            continue
+        for metric in metrics:
+            old, new = before.get(metric), result.get(metric)
+            if old is None and new is None:  # queries are not counted over HTTP
+                continue
+            change = (new - old) * 100.0 / old if old and new is not None else None
+            rows.append((name, metric, old, new, change))
+    return rows
+
+
+def save(path, results):
+    with open(path, 'w') as output:
+        json.dump(results, output, indent=2)
+        output.write('\n')
+
+
+def load(path):
+    with open(path) as source:
+        return json.load(source, object_pairs_hook=OrderedDict)
@@ -0,0 +1,67 @@
+"""
+batch writes for the API, one statement per batch and the bookkeeping the model signals would have done
+"""
+from django.db import connections
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from . import cache, events, stats  # the response cache, the live board events and the materialized sprint stats
+from .models import Change, CollectionVersion, Task
+
+
+def bulk_update(objs, fields):
+    """write the given fields of every object with one UPDATE ... SET field = CASE pk WHEN ... END"""
+    if not objs or not fields:
+        return 0
+    model = type(objs[0])
+    updates = {}
+    for name in fields:
+        field = model._meta.get_field(name)
+        updates[field.attname] = Case(
+            *[When(pk=obj.pk, then=Value(getattr(obj, field.attname))) for obj in objs],
+            default=F(field.attname),
+            output_field=field
+        )
+    return model._default_manager.filter(pk__in=[obj.pk for obj in objs]).update(**updates)
+
+
+def returns_ids(model):
+    """whether bulk inserts hand back the new primary keys, otherwise bulk_create saves one by one with signals"""
+    return connections[model._default_manager.db].features.can_return_ids_from_bulk_insert
+
+
+def bulk_create(objs):
+    """insert the objects, in one statement where the database hands back the new primary keys"""
+    if not objs:
+        return objs
+    model = type(objs[0])
+    if returns_ids(model):
+        return model._default_manager.bulk_create(objs)
+    for obj in objs:  # SQLite and friends, save one by one to learn the keys
+        obj.save()
+    return objs
+
+
+def record_task_writes(created, updated, sprint_ids):
+    """the collection version, the change log, the cache generations and the board events,
+    for tasks written without signals"""
+    if created and returns_ids(Task):
+        Change.record(CollectionVersion.TASKS, [task.pk for task in created], Change.ACTION_CREATED)
+    else:
+        created = []  # saved one by one, the signals did the bookkeeping
+    if updated:
+        Change.record(CollectionVersion.TASKS, [task.pk for task in updated], Change.ACTION_UPDATED)
+    if created or updated:
+        CollectionVersion.bump(CollectionVersion.TASKS, timezone.now())
+        cache.invalidate(CollectionVersion.TASKS, *[cache.sprint_scope(sprint_id) for sprint_id in sprint_ids])
+        stats.forget_sprint_stats(*sprint_ids)
+        events.publish_tasks(created + updated)
+
+
+def record_created(collection, created):
+    """the collection version, the change log and the cache generation, for rows inserted by bulk_create"""
+    if not created or not returns_ids(type(created[0])):
+        return  # saved one by one, the signals did the bookkeeping
+    Change.record(collection, [obj.pk for obj in created], Change.ACTION_CREATED)
+    CollectionVersion.bump(collection, timezone.now())
+    cache.invalidate(collection)
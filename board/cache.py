@@ -0,0 +1,122 @@
+"""
+response cache for the list end points, entries are dropped by rotating the generation of the collections they show
+once the write commits. Only a cache shared by every process writing to the database (the workers, import_board,
+archive_sprints) hears of all the writes: with a process local one, nothing is cached
+"""
+import hashlib  # for building cache keys
+import uuid  # for generation tokens
+
+from django.conf import settings
+from django.contrib.auth import get_user_model  # for a uniformed user model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from scrum.processes import is_shared_cache
+
+from .models import CollectionVersion, Profile, Sprint, Task, is_login_save
+
+User = get_user_model()  # the uniformed user model
+
+CACHE_ALIAS = getattr(settings, 'BOARD_CACHE_ALIAS', 'default')  # a shared backend in production, locmem in tests
+ENABLED = is_shared_cache(CACHE_ALIAS)
+TIMEOUT = getattr(settings, 'BOARD_RESPONSE_CACHE_TIMEOUT', 300)  # upper bound, writes invalidate sooner
+PREFIX = 'board:response'
+HITS = PREFIX + ':hits'
+MISSES = PREFIX + ':misses'
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def sprint_scope(sprint_id):
+    """the generation of the tasks in one sprint, None is the backlog"""
+    return '{}:sprint:{}'.format(CollectionVersion.TASKS, sprint_id)
+
+
+def get_generations(names):
+    """current generation token of each scope, a missing one starts a new generation"""
+    cache = get_cache()
+    keys = ['{}:gen:{}'.format(PREFIX, name) for name in names]
+    found = cache.get_many(keys)
+    generations = []
+    for key in keys:
+        generation = found.get(key)
+        if generation is None:  # evicted or never set, a fresh token can never match an old entry
+            generation = uuid.uuid4().hex
+            if not cache.add(key, generation, None):
+                generation = cache.get(key, generation)
+        generations.append(generation)
+    return generations
+
+
+def invalidate(*names):
+    """drop every cached response that shows one of the scopes once the transaction commits, for writes that bypass
+    the model signals too. Rotated before, a list read in between would cache the rows the write replaces under the
+    new generation"""
+    if ENABLED:
+        transaction.on_commit(lambda: rotate(names))
+
+
+def rotate(names):
+    get_cache().set_many(dict(('{}:gen:{}'.format(PREFIX, name), uuid.uuid4().hex) for name in names), None)
+
+
+def get_key(request, endpoint, scope, names):
+    """key of a response: the end point, the permission scope, the generations it depends on
+    and the normalized query (host included, the links are absolute)"""
+    query = sorted((key, value) for key in request.query_params for value in request.query_params.getlist(key))
+    digest = hashlib.md5('|'.join(
+        [request.build_absolute_uri('/')] + ['{}={}'.format(key, value) for key, value in query]
+    ).encode('utf-8')).hexdigest()
+    return ':'.join([PREFIX, endpoint, scope] + get_generations(names) + [digest])
+
+
+def get_response(key):
+    """the cached response data, or None"""
+    data = get_cache().get(key)
+    count(HITS if data is not None else MISSES)
+    return data
+
+
+def set_response(key, data, timeout=TIMEOUT):
+    get_cache().set(key, data, timeout)
+
+
+def count(counter):
+    cache = get_cache()
+    try:
+        cache.incr(counter)
+    except ValueError:  # first count, or the counter was evicted
+        if not cache.add(counter, 1, None):
+            cache.incr(counter)
+
+
+def get_stats():
+    """hit and miss counts, shared by every process using the cache"""
+    counts = get_cache().get_many([HITS, MISSES])
+    return {'hits': counts.get(HITS, 0), 'misses': counts.get(MISSES, 0)}
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def invalidate_task(sender, instance, **kwargs):
+    sprints = set([instance.sprint_id, instance.previous_sprint_id])  # a move changes the old sprint's list too
+    invalidate(CollectionVersion.TASKS, *[sprint_scope(sprint_id) for sprint_id in sprints])
+
+
+@receiver(post_save, sender=Sprint)
+@receiver(post_delete, sender=Sprint)
+def invalidate_sprint(sender, instance, **kwargs):
+    invalidate(CollectionVersion.SPRINTS)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_user(sender, instance, **kwargs):
+    if not is_login_save(sender, **kwargs):
+        invalidate(CollectionVersion.USERS)
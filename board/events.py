@@ -0,0 +1,233 @@
+"""
+live board events: the model signals publish the changed task or sprint to a broker,
+the listeners of a sprint get them as Server-Sent Events
+"""
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder  # dates in the payloads
+from django.db import connections, transaction
+from django.db.models import prefetch_related_objects
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+from rest_framework import exceptions
+from rest_framework.request import Request
+
+from .authentication import CachedBasicAuthentication, CachedTokenAuthentication, QueryTokenAuthentication
+from .models import Sprint, Task
+from .serializers import SprintSerializer, TaskSerializer
+
+logger = logging.getLogger(__name__)
+
+BACKEND = getattr(settings, 'BOARD_EVENTS_BACKEND', 'board.events.LocalBackend')
+HEARTBEAT = getattr(settings, 'BOARD_EVENTS_HEARTBEAT', 15)  # seconds between keep-alive comments
+RETRY = 3000  # milliseconds the browser waits before reconnecting a dropped stream
+SYNC_TIMEOUT = getattr(settings, 'BOARD_EVENTS_SYNC_TIMEOUT', 300)  # seconds a sync worker serves a stream
+AUTHENTICATORS = (QueryTokenAuthentication, CachedBasicAuthentication, CachedTokenAuthentication)
+
+
+class LocalBackend(object):
+    """Delivers in this process only, for tests, runserver and a single worker."""
+    local = True  # every listener subscribes to this process's broker
+
+    def __init__(self, deliver):
+        self.deliver = deliver
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+    def listen(self):
+        pass  # nothing to start
+
+
+class PostgresBackend(object):
+    """NOTIFY on publish and one LISTEN connection per process, so the listeners of every worker get every event."""
+    local = False  # the listeners of the other workers are not known here
+    notify_channel = 'board_events'
+    max_payload = 7900  # bytes, PostgreSQL refuses payloads of 8000 and more
+    reconnect_delay = 1  # seconds, after the listening connection is lost
+
+    def __init__(self, deliver, alias='default'):
+        self.deliver = deliver
+        self.alias = alias
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def publish(self, channel, message):
+        payload = json.dumps([channel, message], cls=DjangoJSONEncoder)
+        if len(payload.encode('utf-8')) > self.max_payload:  # a long description, the client fetches the rest
+            data = message['data']
+            message = dict(message, data={'id': data['id'], 'partial': True})
+            payload = json.dumps([channel, message], cls=DjangoJSONEncoder)
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.notify_channel, payload])
+
+    def listen(self):
+        """start the listening thread, after the fork of a preloading server"""
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='board-events', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        connection = connections[self.alias]  # this thread's own connection
+        while True:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('LISTEN {}'.format(self.notify_channel))
+                raw = connection.connection
+                while True:
+                    if select.select([raw], [], [], HEARTBEAT) == ([], [], []):
+                        continue
+                    raw.poll()
+                    while raw.notifies:
+                        channel, message = json.loads(raw.notifies.pop(0).payload)
+                        self.deliver(channel, message)
+            except Exception:
+                logger.exception('Lost the board events connection, reconnecting.')
+                connection.close()
+                time.sleep(self.reconnect_delay)
+
+
+class Broker(object):
+    """Hands the published messages of a channel to its subscribers in this process,
+    the backend carries them between processes."""
+
+    def __init__(self, backend=BACKEND):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)  # channel -> callbacks
+        self.backend = import_string(backend)(self.deliver)
+
+    def publish(self, channel, event, data):
+        self.backend.publish(channel, {'event': event, 'data': data})
+
+    def is_listened(self, channels):
+        """False when no listener can get a message of the channels, the payload needs no building"""
+        if not getattr(self.backend, 'local', False):
+            return True
+        with self.lock:
+            return any(channel in self.subscribers for channel in channels)
+
+    def subscribe(self, channel, callback):
+        """call callback(message) for every message of the channel until the returned function is called.
+
+        Callbacks run in the publishing or the listening thread, they should only hand the message over."""
+        self.backend.listen()
+        with self.lock:
+            self.subscribers[channel].add(callback)
+
+        def unsubscribe():
+            with self.lock:
+                self.subscribers[channel].discard(callback)
+                if not self.subscribers[channel]:
+                    del self.subscribers[channel]
+        return unsubscribe
+
+    def deliver(self, channel, message):
+        with self.lock:
+            callbacks = list(self.subscribers.get(channel, ()))
+        for callback in callbacks:
+            try:
+                callback(message)
+            except Exception:
+                logger.exception('Board event subscriber failed.')
+
+
+broker = Broker()
+
+
+def sprint_channel(sprint_id):
+    return 'sprint:{}'.format(sprint_id)
+
+
+def format_event(message):
+    """a message as one Server-Sent Event"""
+    return 'event: {}\ndata: {}\n\n'.format(message['event'], json.dumps(message['data'], cls=DjangoJSONEncoder))
+
+
+def stream(channel, timeout=SYNC_TIMEOUT):
+    """the event stream of a channel for a sync worker, which is held until the stream ends:
+    it is closed after timeout and EventSource reconnects"""
+    messages = queue.Queue()
+    unsubscribe = broker.subscribe(channel, messages.put)
+    try:
+        yield 'retry: {}\n\n'.format(RETRY)
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                yield format_event(messages.get(timeout=max(min(HEARTBEAT, deadline - time.time()), 0)))
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+    finally:
+        unsubscribe()
+
+
+def authorize(http_request, sprint_id):
+    """None when the request may listen to the sprint, with the checks of the sprint end points,
+    otherwise the error response. It queries the database, the async server runs it in a thread."""
+    request = Request(http_request, authenticators=[authenticator() for authenticator in AUTHENTICATORS])
+    try:
+        authenticated = request.user.is_authenticated
+    except exceptions.AuthenticationFailed as exc:
+        return error_response(exc)
+    if not authenticated:
+        return error_response(exceptions.NotAuthenticated())
+    if not Sprint.objects.filter(pk=sprint_id).exists():
+        return error_response(exceptions.NotFound())
+    return None
+
+
+def error_response(exc):
+    return HttpResponse(json.dumps({'detail': str(exc.detail)}), status=exc.status_code,
+                        content_type='application/json')
+
+
+def sprint_channels(sprint_ids):
+    return [sprint_channel(sprint_id) for sprint_id in set(sprint_ids) if sprint_id is not None]
+
+
+def publish(sprint_ids, event, data):
+    """publish to the sprints once the transaction commits, so listeners never see a change rolled back"""
+    channels = sprint_channels(sprint_ids)
+    if channels:
+        transaction.on_commit(lambda: [broker.publish(channel, event, data) for channel in channels])
+
+
+def publish_tasks(tasks):
+    """the saved tasks to their sprints and to the sprints they moved out of, for writes made without signals"""
+    tasks = [task for task in tasks if broker.is_listened(sprint_channels([task.sprint_id, task.previous_sprint_id]))]
+    if not tasks:
+        return
+    prefetch_related_objects(tasks, 'assigned')  # the usernames in one query
+    payloads = TaskSerializer(tasks, many=True, omit=['links']).data  # one serializer for the batch
+    for task, data in zip(tasks, payloads):
+        publish([task.sprint_id, task.previous_sprint_id], 'task.saved', data)
+
+
+@receiver(post_save, sender=Task)
+def publish_task(sender, instance, **kwargs):
+    publish_tasks([instance])
+
+
+@receiver(post_delete, sender=Task)
+def publish_task_deleted(sender, instance, **kwargs):
+    publish([instance.sprint_id, instance.previous_sprint_id], 'task.deleted', {'id': instance.pk})
+
+
+@receiver(post_save, sender=Sprint)
+def publish_sprint(sender, instance, **kwargs):
+    if broker.is_listened(sprint_channels([instance.pk])):
+        publish([instance.pk], 'sprint.saved', SprintSerializer(instance, omit=['links']).data)
+
+
+@receiver(post_delete, sender=Sprint)
+def publish_sprint_deleted(sender, instance, **kwargs):
+    publish([instance.pk], 'sprint.deleted', {'id': instance.pk})
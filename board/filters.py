@@ -0,0 +1,94 @@
+"""
+filter sets for the API end points, the query parameters the front-end and the resource links use
+"""
+import django_filters  # filters from django-filter, used by rest-framework's DjangoFilterBackend
+
+from django.contrib.auth import get_user_model  # for a uniformed user model
+from django.contrib.postgres.search import SearchQuery, SearchRank  # full text search on PostgreSQL
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import F, IntegerField, Value
+from django.db.models.functions import Cast
+from rest_framework import exceptions, filters
+from .models import ArchivedTask, Sprint, Task
+
+User = get_user_model()  # the uniformed user model
+
+
+class NullFilter(django_filters.BooleanFilter):
+    """Filter on a field being set or not."""
+
+    def filter(self, qs, value):
+        if value is not None:
+            return qs.filter(**{'%s__isnull' % self.name: value})
+        return qs
+
+
+class SprintFilter(django_filters.FilterSet):
+    end_min = django_filters.DateFilter(name='end', lookup_expr='gte')  # sprints ending on or after
+    end_max = django_filters.DateFilter(name='end', lookup_expr='lte')  # sprints ending on or before
+
+    class Meta:
+        model = Sprint
+        fields = ('end_min', 'end_max', )
+
+
+class TaskFilter(django_filters.FilterSet):
+    backlog = NullFilter(name='sprint')  # tasks without a sprint
+    assigned = django_filters.CharFilter(name='assigned__' + User.USERNAME_FIELD)  # by username, as in the links
+
+    class Meta:
+        model = Task
+        fields = ('sprint', 'status', 'assigned', 'backlog', )
+
+
+class ArchivedTaskFilter(TaskFilter):
+    """the task filters on the archive, for the task list of a sprint with archived tasks"""
+
+    class Meta(TaskFilter.Meta):
+        model = ArchivedTask
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """?search= against the search_vector column, best matches first.
+
+    Models without a search_vector, and databases other than PostgreSQL,
+    keep the icontains search over the view's search_fields."""
+    search_config = 'english'  # same text search config as the trigger maintaining search_vector
+    rank_scale = 1000000  # ranks are kept as integers so the keyset pagination can compare them exactly
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms or not self.use_full_text(queryset):
+            return super(FullTextSearchFilter, self).filter_queryset(request, queryset, view)
+        return self.search(queryset, search_terms)
+
+    def search(self, queryset, search_terms):
+        """the rows matching the terms in search_vector, annotated with their rank and best first"""
+        query = SearchQuery(' '.join(search_terms), config=self.search_config)
+        rank = Cast(SearchRank(F('search_vector'), query) * Value(self.rank_scale), IntegerField())
+        return queryset.annotate(search_rank=rank).filter(search_vector=query).order_by('-search_rank', '-id')
+
+    @staticmethod
+    def use_full_text(queryset):
+        if connections[queryset.db].vendor != 'postgresql':
+            return False
+        try:
+            queryset.model._meta.get_field('search_vector')
+        except FieldDoesNotExist:
+            return False
+        return True
+
+
+class KeysetOrderingFilter(filters.OrderingFilter):
+    """?ordering= on the view's ordering_fields, a field outside them is refused (400) instead of being dropped
+    in silence. The keyset pages compare the ordering values, so a view only offers fields that are never null."""
+
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        valid = super(KeysetOrderingFilter, self).remove_invalid_fields(queryset, fields, view, request)
+        invalid = [term for term in fields if term not in valid]
+        if invalid:
+            raise exceptions.ValidationError({self.ordering_param: [
+                'Cannot order by {}, use one of: {}.'.format(', '.join(invalid), ', '.join(
+                    name for name, label in self.get_valid_fields(queryset, view, {'request': request})))]})
+        return valid
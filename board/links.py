@@ -0,0 +1,53 @@
+"""
+hyperlink builder for the serializers, each route is reversed once per request and then filled in by string formatting
+"""
+import re
+
+from rest_framework.reverse import reverse  # for producing the route templates
+
+SAFE_VALUE = re.compile(r'^[A-Za-z0-9_@+-]+$')  # values that reverse() would leave untouched
+PLACEHOLDER = 'LINKPLACEHOLDER'  # stands in for the url kwarg when reversing a template
+
+
+class LinkBuilder(object):
+    """Builds the absolute urls of the resource links for one request.
+
+    The first call for a route runs the full reverse() with a placeholder value,
+    later calls only join the cached prefix and suffix around the value,
+    so the result is the same string reverse() would have produced."""
+
+    def __init__(self, request):
+        self.request = request
+        self.templates = {}  # (route name, kwarg name) -> (prefix, suffix)
+
+    @classmethod
+    def for_context(cls, context):
+        """one builder shared by every object serialized with the same context"""
+        builder = context.get('link_builder')
+        if builder is None:
+            builder = context['link_builder'] = cls(context['request'])
+        return builder
+
+    def url(self, name, kwarg=None, value=None):
+        """absolute url of the route, with the kwarg filled in when the route takes one"""
+        if kwarg is None:
+            key = (name, None)
+            if key not in self.templates:
+                self.templates[key] = (reverse(name, request=self.request), '')
+            return self.templates[key][0]
+        value = str(value)
+        if not SAFE_VALUE.match(value):  # quoting or matching would differ, let reverse() handle it
+            return reverse(name, kwargs={kwarg: value}, request=self.request)
+        key = (name, kwarg)
+        if key not in self.templates:
+            url = reverse(name, kwargs={kwarg: PLACEHOLDER}, request=self.request)
+            prefix, _, suffix = url.partition(PLACEHOLDER)
+            self.templates[key] = (prefix, suffix)
+        prefix, suffix = self.templates[key]
+        return prefix + value + suffix
+
+    def template(self, name, kwarg, placeholder):
+        """the url of the route with a placeholder, such as {id}, where the kwarg goes, for clients filling it in"""
+        self.url(name, kwarg, PLACEHOLDER)  # builds the prefix and suffix once
+        prefix, suffix = self.templates[(name, kwarg)]
+        return prefix + placeholder + suffix
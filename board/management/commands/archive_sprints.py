@@ -0,0 +1,43 @@
+"""
+move the done tasks of closed sprints to the archive table, in batches, keeping the task table to the work in progress
+"""
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from board import archive
+
+
+def day(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class Command(BaseCommand):
+    help = 'Archive the done tasks of the sprints ended before the given day.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', type=day, default=None, help='YYYY-MM-DD, today by default')
+        parser.add_argument('--batch-size', type=int, default=archive.BATCH_SIZE, help='tasks moved per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='only count the tasks to archive')
+        parser.add_argument('--restore', action='store_true', help='move every archived task back to the task table')
+
+    def handle(self, *args, **options):
+        today = datetime.date.today()
+        before = options['before'] or today
+        if before > today:
+            raise CommandError('--before cannot be in the future, the sprints must be closed.')
+        if options['restore']:
+            self.stdout.write('Restored {} tasks.'.format(archive.restore()))
+            return
+        if options['dry_run']:
+            self.stdout.write('{} tasks to archive.'.format(archive.archivable(before).count()))
+            return
+        moved, sprints = 0, set()
+        while True:
+            count, sprint_ids = archive.archive_batch(before, options['batch_size'])
+            if not count:
+                break
+            moved += count
+            sprints |= sprint_ids
+            self.stdout.write('Archived {} tasks.'.format(moved))
+        self.stdout.write('Archived {} tasks of {} sprints ended before {}.'.format(moved, len(sprints), before))
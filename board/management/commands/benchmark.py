@@ -0,0 +1,164 @@
+"""
+run the API benchmark on a seeded test database, or over HTTP against a running server, and save the figures as JSON
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases
+
+from board import benchmark
+from board.models import Task
+
+
+class Command(BaseCommand):
+    help = ('Seed a test database with a reproducible board, time the sprint, task and user end points in process '
+            'and write p50/p90/p99 latency, queries per request and throughput to a JSON file. '
+            'Give --compare a previous result file to see the changes. With --url the requests go over HTTP to a '
+            'running server instead, --concurrency at a time while --listeners board event streams stay open, '
+            'to compare server setups; the configured database must be the server\'s, it is seeded when empty. '
+            'With --serializers the sprint, task and user list serializers are timed instead, in rows per second '
+            'on the full serializers and on the values() fast path. With --history the closed sprint history grows '
+            '--history times by --history-tasks done tasks, and the task end points are timed at each step with '
+            'the history in the task table and archived.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--sprints', type=int, default=20)
+        parser.add_argument('--tasks', type=int, default=5000)
+        parser.add_argument('--requests', type=int, default=200, help='timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=20, help='untimed requests before each scenario')
+        parser.add_argument('--scenario', action='append', help='only these scenarios, may be repeated')
+        parser.add_argument('--cold', action='store_true', help='clear the response cache before every request')
+        parser.add_argument('--seed', type=int, default=0, help='seed of the dataset and the drawn arguments')
+        parser.add_argument('--output', default='benchmark.json', help='result file')
+        parser.add_argument('--compare', help='an earlier result file')
+        parser.add_argument('--keepdb', action='store_true', help='keep the test database, it is reseeded when empty')
+        parser.add_argument('--url', help='base url of a running server, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=10, help='clients sending requests at once, with --url')
+        parser.add_argument('--listeners', type=int, default=0, help='idle event streams kept open, with --url')
+        parser.add_argument('--serializers', action='store_true', help='time the list serializers, --requests pages '
+                            'of --page-size rows per resource')
+        parser.add_argument('--page-size', type=int, default=100, help='rows per page, with --serializers')
+        parser.add_argument('--history', type=int, default=0, help='steps of closed sprint history to time')
+        parser.add_argument('--history-tasks', type=int, default=10000, help='done tasks per step, with --history')
+        parser.add_argument('--history-sprints', type=int, default=20, help='sprints added per step, with --history')
+
+    def handle(self, *args, **options):
+        scenarios = benchmark.SCENARIOS
+        if options['scenario']:
+            names = set(options['scenario'])
+            scenarios = [scenario for scenario in scenarios if scenario.name in names]
+            unknown = names - set(scenario.name for scenario in scenarios)
+            if unknown:
+                raise CommandError('Unknown scenarios: {}.'.format(', '.join(sorted(unknown))))
+        dataset = dict((name, options[name]) for name in ('users', 'sprints', 'tasks'))
+
+        options_results = dict(dataset, requests=options['requests'], warmup=options['warmup'],
+                               cold=options['cold'], seed=options['seed'])
+        if options['serializers']:
+            if options['url']:
+                raise CommandError('--serializers runs in process, without --url.')
+            options_results.update(page_size=options['page_size'], serializers=True)
+        if options['history']:
+            if options['url'] or options['serializers'] or options['compare']:
+                raise CommandError('--history runs in process, without --url, --serializers or --compare.')
+            options_results.update(history=options['history'], history_tasks=options['history_tasks'],
+                                   history_sprints=options['history_sprints'])
+        if options['url']:
+            if options['cold']:
+                raise CommandError('--cold clears the cache of this process, not the server\'s.')
+            if not Task.objects.exists():
+                self.stdout.write('Seeding {users} users, {sprints} sprints and {tasks} tasks...'.format(**dataset))
+                benchmark.seed(random_seed=options['seed'], **dataset)
+            scenarios_results, server = benchmark.run_http(
+                options['url'], scenarios, requests=max(options['requests'], 1), warmup=options['warmup'],
+                concurrency=max(options['concurrency'], 1), listeners=options['listeners'],
+                random_seed=options['seed'])
+            options_results.update(concurrency=options['concurrency'], listeners=options['listeners'])
+        else:
+            server = None
+            settings.DEBUG = False  # as in production, and as the test runner does
+            settings.BOARD_THROTTLE_ENABLED = False  # one user sends every request, as fast as it can
+            old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+            try:
+                if not Task.objects.exists():
+                    self.stdout.write('Seeding {users} users, {sprints} sprints and {tasks} tasks...'.format(**dataset))
+                    benchmark.seed(random_seed=options['seed'], **dataset)
+                if options['history']:
+                    scenarios_results = benchmark.run_history(
+                        options['history'], sprints=options['history_sprints'], tasks=options['history_tasks'],
+                        requests=max(options['requests'], 1), warmup=options['warmup'], random_seed=options['seed'])
+                elif options['serializers']:
+                    scenarios_results = benchmark.run_serializers(page_size=max(options['page_size'], 1),
+                                                                  repeat=max(options['requests'], 1))
+                else:
+                    scenarios_results = benchmark.run(scenarios, requests=max(options['requests'], 1),
+                                                      warmup=options['warmup'], cold=options['cold'],
+                                                      random_seed=options['seed'])
+            finally:
+                teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+
+        section = 'history' if options['history'] else 'serializers' if options['serializers'] else 'scenarios'
+        results = {
+            'environment': benchmark.environment(server),
+            'options': options_results,
+            section: scenarios_results,
+        }
+        if options['history']:
+            self.write_history_table(scenarios_results)
+        elif options['serializers']:
+            self.write_serializer_table(scenarios_results)
+        else:
+            self.write_table(scenarios_results)
+        benchmark.save(options['output'], results)
+        self.stdout.write('Saved to {}.'.format(options['output']))
+        if options['compare']:
+            self.write_comparison(benchmark.load(options['compare']), results, section)
+
+    def write_table(self, results):
+        self.stdout.write('{:<20} {:>9} {:>9} {:>9} {:>8} {:>9}'.format(
+            'scenario', 'p50 ms', 'p90 ms', 'p99 ms', 'queries', 'req/s'))
+        for name, result in results.items():
+            self.stdout.write('{:<20} {:>9} {:>9} {:>9} {:>8} {:>9.1f}'.format(
+                name, *[self.format(result.get(key)) for key in ('p50_ms', 'p90_ms', 'p99_ms', 'queries_per_request')],
+                result['throughput_rps']))
+
+    def write_serializer_table(self, results):
+        self.stdout.write('{:<10} {:>14} {:>14} {:>14} {:>14} {:>8} {:>10}'.format(  # rows per second
+            'rows/s', 'page full', 'page values', 'serialize full', 'serialize val.', 'speedup', 'identical'))
+        for name, result in results.items():
+            self.stdout.write('{:<10} {:>14.0f} {:>14.0f} {:>14.0f} {:>14.0f} {:>7.2f}x {:>10}'.format(
+                name, result['full_page_rows_per_s'], result['values_page_rows_per_s'],
+                result['full_serialize_rows_per_s'], result['values_serialize_rows_per_s'],
+                result['speedup'] or 0, 'yes' if result['identical'] else 'NO'))
+
+    def write_history_table(self, results):
+        self.stdout.write('{:>8} {:<18} {:>10} {:>10} {:>10} {:>10} {:>8}'.format(  # p50 of the task table before
+            'history', 'scenario', 'rows hot', 'p50 hot', 'rows arch.', 'p50 arch.', 'ratio'))  # and after archiving
+        for step in results:
+            hot, archived = step['hot'], step['archived']
+            for name, result in hot['scenarios'].items():
+                before, after = result.get('p50_ms'), archived['scenarios'][name].get('p50_ms')
+                self.stdout.write('{:>8} {:<18} {:>10} {:>10} {:>10} {:>10} {:>7}x'.format(
+                    step['history_tasks'], name, hot['task_rows'], self.format(before), archived['task_rows'],
+                    self.format(after), '{:.2f}'.format(before / after) if before and after else '-'))
+
+    def format(self, value):
+        return '{:.2f}'.format(value) if value is not None else '-'  # not counted over HTTP, or every request failed
+
+    def write_comparison(self, previous, current, section='scenarios'):
+        if previous.get('options') != current['options']:
+            self.stdout.write(self.style.WARNING('The runs used different options, the figures may not compare.'))
+        environment = previous.get('environment') or {}
+        self.stdout.write(self.style.MIGRATE_HEADING('Changes since {}{}:'.format(
+            environment.get('commit') or 'the earlier run',
+            ' on {}'.format(environment['server']) if environment.get('server') else '')))
+        metrics = (('full_page_rows_per_s', 'values_page_rows_per_s', 'full_serialize_rows_per_s',
+                    'values_serialize_rows_per_s') if section == 'serializers' else
+                   ('p50_ms', 'p99_ms', 'queries_per_request', 'throughput_rps'))
+        for name, metric, before, after, change in benchmark.compare(previous, current, metrics, section):
+            faster = metric == 'throughput_rps' or metric.endswith('_per_s')  # higher is better
+            worse = change is not None and (change < 0 if faster else change > 0)
+            line = '  {:<20} {:<28} {:>10} {:>10} {:>8}'.format(
+                name, metric, '-' if before is None else before, '-' if after is None else after,
+                '{:+.1f}%'.format(change) if change is not None else '')
+            self.stdout.write(self.style.WARNING(line) if worse and abs(change) >= 10 else line)
@@ -0,0 +1,78 @@
+"""
+print the query plans of the API's common queries, with and without the board indexes
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from board.filters import FullTextSearchFilter
+from board.models import Sprint, Task
+
+SEARCH_INDEXES = ('board_task_search_vector_gin', 'board_sprint_search_vector_gin')  # created in 0007_search_vector
+
+
+class Rollback(Exception):
+    """raised to undo the dropped indexes after the plans are taken"""
+
+
+class Command(BaseCommand):
+    help = 'Show the query plans of the API access patterns before (indexes dropped) and after (current schema).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true', help='run EXPLAIN ANALYZE (PostgreSQL only)')
+        parser.add_argument('--search', default='fix', help='term used for the ?search= queries')
+
+    def handle(self, *args, **options):
+        self.analyze = options['analyze'] and connection.vendor == 'postgresql'
+        queries = self.get_queries(options['search'])
+        try:
+            with transaction.atomic():  # DDL is transactional on PostgreSQL and SQLite
+                self.drop_indexes()
+                self.show_plans('before', queries)
+                raise Rollback()
+        except Rollback:
+            pass
+        self.show_plans('after', queries)
+
+    def get_queries(self, term):
+        """the querysets the viewsets run for the board, the filters, the orderings and the search"""
+        sprint = Sprint.objects.order_by('-end').values_list('pk', flat=True).first() or 0
+        user = Task.objects.exclude(assigned=None).values_list('assigned', flat=True).first() or 0
+        return [
+            ('board columns (?sprint=&status=)',
+             Task.objects.filter(sprint=sprint, status=Task.STATUS_IN_PROGRESS).order_by('order')),
+            ('user tasks (?assigned=&status=)', Task.objects.filter(assigned=user, status=Task.STATUS_IN_PROGRESS)),
+            ('task page (keyset on order, id)', Task.objects.filter(order__gt=0).order_by('order', 'id')[:25]),
+            ('task search (?search=)', self.search(
+                Task.objects.filter(Q(name__icontains=term) | Q(description__icontains=term)), term)[:25]),
+            ('sprint search (?search=)', self.search(Sprint.objects.filter(name__icontains=term), term)[:25]),
+            ('sprint ordering (?ordering=name)', Sprint.objects.order_by('name')[:25]),
+        ]
+
+    def search(self, icontains, term):
+        """the search the API runs: search_vector on PostgreSQL, the icontains queryset elsewhere"""
+        if not FullTextSearchFilter.use_full_text(icontains):
+            return icontains
+        return FullTextSearchFilter().search(icontains.model.objects.all(), [term])
+
+    def drop_indexes(self):
+        with connection.schema_editor(atomic=False) as schema_editor:
+            for model in (Sprint, Task):
+                for index in model._meta.indexes:
+                    schema_editor.remove_index(model, index)
+            if connection.vendor == 'postgresql':
+                for name in SEARCH_INDEXES:
+                    schema_editor.execute('DROP INDEX IF EXISTS {}'.format(name))
+
+    def show_plans(self, label, queries):
+        explain = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        if self.analyze:
+            explain = 'EXPLAIN ANALYZE '
+        self.stdout.write(self.style.MIGRATE_HEADING('Query plans {}:'.format(label)))
+        with connection.cursor() as cursor:
+            for name, queryset in queries:
+                sql, params = queryset.query.sql_with_params()
+                cursor.execute(explain + sql, params)
+                self.stdout.write('  ' + name)
+                for row in cursor.fetchall():
+                    self.stdout.write('    ' + ' '.join(str(column) for column in row))
@@ -0,0 +1,194 @@
+"""
+bulk import of users, sprints and tasks from NDJSON or CSV, in batches of one insert each, resumable after a failure
+"""
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+from django.contrib.auth import get_user_model  # for a uniformed user model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from board import bulk
+from board.models import CollectionVersion, ImportProgress, Profile, Sprint, Task
+from board.serializers import SprintSerializer, TaskSerializer, UserSerializer
+
+User = get_user_model()  # the uniformed user model
+
+TYPES = ('user', 'sprint', 'task')
+PROFILE_FIELDS = ('first_name', 'last_name', 'address_first', 'address_second', 'city', 'state', 'zip', 'country')
+
+
+def read_records(stream, format, default_kind):
+    """(type, record) pairs from the input, one at a time"""
+    if format == 'csv':
+        for row in csv.DictReader(stream):
+            yield default_kind, dict((key, value) for key, value in row.items() if value != '')  # empty is unset
+        return
+    for line in stream:
+        if line.strip():
+            record = json.loads(line)
+            yield record.pop('type', default_kind), record
+
+
+class Command(BaseCommand):
+    help = ('Import users, sprints and tasks from NDJSON (one object per line, with a "type" of user, sprint or task) '
+            'or CSV (one type per file, as written by the export end points). Records are checked with the API '
+            'serializers, inserted in batches and the progress is saved with each batch, so running the same '
+            'import again resumes after the last committed batch.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='input file, - for stdin')
+        parser.add_argument('--format', choices=('ndjson', 'csv'), help='input format, by default from the extension')
+        parser.add_argument('--type', choices=TYPES, help='type of records without one, required for CSV')
+        parser.add_argument('--batch-size', type=int, default=1000, help='records per insert and transaction')
+        parser.add_argument('--name', help='key of the saved progress, the path by default (required for stdin)')
+        parser.add_argument('--restart', action='store_true', help='forget the saved progress and start over')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        if format == 'csv' and not options['type']:
+            raise CommandError('CSV input needs --type.')
+        if path == '-' and not options['name']:
+            raise CommandError('Reading stdin needs --name to save the progress under.')
+        source = options['name'] or os.path.abspath(path)
+        self.batch_size = max(options['batch_size'], 1)
+
+        if options['restart']:
+            ImportProgress.objects.filter(source=source).delete()
+        self.progress, _ = ImportProgress.objects.get_or_create(source=source)
+        sprint_ids = dict((int(key), pk) for key, pk in json.loads(self.progress.sprints).items())
+        sprints = Sprint.objects.in_bulk(list(sprint_ids.values()))
+        self.sprints = dict((key, sprints[pk]) for key, pk in sprint_ids.items() if pk in sprints)  # input id -> sprint
+        self.users = dict(User.objects.values_list(User.USERNAME_FIELD, 'pk'))  # username -> pk, for assigned
+        self.serializers = {  # one per type, building a serializer costs far more than validating a record
+            'user': UserSerializer(),
+            'sprint': SprintSerializer(),
+            'task': TaskSerializer(context={'sprints': self.sprints}),
+        }
+        self.imported = self.rejected = 0
+        self.started = time.time()
+        if self.progress.records:
+            self.stdout.write('Resuming after {} records.'.format(self.progress.records))
+
+        stream = sys.stdin if path == '-' else io.open(path, encoding='utf-8', newline='')
+        try:
+            self.run(read_records(stream, format, options['type']))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        elapsed = time.time() - self.started
+        self.stdout.write('Done: {} imported, {} rejected in {:.1f}s.'.format(self.imported, self.rejected, elapsed))
+
+    def run(self, records):
+        skip = self.progress.records
+        pending, pending_kind, position = [], None, 0
+        for position, (kind, record) in enumerate(records, 1):
+            if position <= skip:  # committed by an earlier run
+                continue
+            if kind not in TYPES:
+                self.reject(position, {'type': ['Expected one of {}.'.format(', '.join(TYPES))]})
+                continue
+            if pending and (kind != pending_kind or len(pending) >= self.batch_size):
+                self.write(pending_kind, pending, position - 1)
+                pending = []
+            pending_kind = kind
+            obj = getattr(self, 'build_' + kind)(record)
+            if isinstance(obj, dict):
+                self.reject(position, obj)
+            else:
+                pending.append(obj)
+        if position > skip:  # the last batch, or rejected records after it
+            self.write(pending_kind, pending, position)
+
+    def validate(self, kind, record):
+        """the validated data or the errors, with the checks of the API serializers"""
+        try:
+            return self.serializers[kind].run_validation(record), None
+        except ValidationError as exc:
+            return None, exc.detail
+
+    def reject(self, position, errors):
+        self.rejected += 1
+        self.stderr.write('Record {}: {}'.format(position, json.dumps(errors)))
+
+    def build_user(self, record):
+        """(user, profile fields) or the errors"""
+        username = record.get(User.USERNAME_FIELD)
+        if username in self.users:  # in the database or earlier in the input
+            return {User.USERNAME_FIELD: ['A user with that username already exists.']}
+        for name in PROFILE_FIELDS:  # the profile defaults for the fields left out
+            record.setdefault(name, Profile._meta.get_field(name).get_default())
+        data, errors = self.validate('user', record)
+        if errors:
+            return errors
+        profile = data.pop('profile', {})
+        user = User(**data)
+        user.set_unusable_password()  # imported users sign in after a password reset
+        self.users[username] = None  # the pk is known once the batch is written
+        return (user, profile)
+
+    def build_sprint(self, record):
+        """(input id, sprint) or the errors"""
+        data, errors = self.validate('sprint', record)
+        if errors:
+            return errors
+        try:
+            key = int(record['id']) if 'id' in record else None  # tasks refer to the sprint by it
+        except (TypeError, ValueError):
+            return {'id': ['Sprint ids must be integers.']}
+        return (key, Sprint(**data))
+
+    def build_task(self, record):
+        """the task or the errors, the sprint is looked up in the imported sprints by its input id"""
+        data, errors = self.validate('task', record)
+        if errors:
+            return errors
+        task = Task(**data)
+        username = record.get('assigned')
+        if username:
+            if self.users.get(username) is None:
+                return {'assigned': ['User {} does not exist.'.format(username)]}
+            task.assigned_id = self.users[username]
+        return task
+
+    def write(self, kind, pending, position):
+        """insert one batch and save the position after it, in one transaction"""
+        with transaction.atomic():
+            if kind == 'user':
+                self.write_users(pending)
+            elif kind == 'sprint':
+                self.write_sprints(pending)
+            elif kind == 'task':
+                self.write_tasks(pending)
+            self.progress.records = position
+            self.progress.sprints = json.dumps(dict((key, sprint.pk) for key, sprint in self.sprints.items()))
+            self.progress.save()
+        self.imported += len(pending)
+        elapsed = max(time.time() - self.started, 0.001)
+        self.stdout.write('{} records, {} imported, {} rejected, {:.0f} records/s'.format(
+            position, self.imported, self.rejected, (self.imported + self.rejected) / elapsed))
+
+    def write_users(self, pending):
+        if not bulk.returns_ids(User):  # saved one by one, create_user_profile inserts the attached profiles
+            for user, profile in pending:
+                user.profile = Profile(**profile)
+        users = bulk.bulk_create([user for user, profile in pending])
+        if bulk.returns_ids(User):
+            bulk.bulk_create([Profile(user=user, **profile) for user, profile in pending])
+        bulk.record_created(CollectionVersion.USERS, users)
+        self.users.update((user.get_username(), user.pk) for user in users)
+
+    def write_sprints(self, pending):
+        sprints = bulk.bulk_create([sprint for key, sprint in pending])
+        bulk.record_created(CollectionVersion.SPRINTS, sprints)
+        self.sprints.update((key, sprint) for key, sprint in pending if key is not None)
+
+    def write_tasks(self, pending):
+        bulk.bulk_create(pending)
+        bulk.record_task_writes(pending, [], set(task.sprint_id for task in pending))
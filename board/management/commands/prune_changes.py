@@ -0,0 +1,21 @@
+"""
+delete old change log rows, clients with an older cursor get a 410 and fetch the collections again
+"""
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from board.models import Change
+
+
+class Command(BaseCommand):
+    help = 'Delete change log rows older than the given number of days.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='days of changes to keep')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(days=options['days'])
+        deleted, _ = Change.objects.filter(created_at__lt=cutoff).delete()
+        self.stdout.write('Deleted {} changes older than {}.'.format(deleted, cutoff))
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 17:59
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('board', '0005_auto_20170727_1755'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sprint',
+            index=models.Index(fields=['name'], name='sprint_name'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['sprint', 'status', 'order'], name='task_sprint_status_order'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['assigned', 'status'], name='task_assigned_status'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['order', 'id'], name='task_order_id'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 18:00
+from __future__ import unicode_literals
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_TABLES = ('board_task', 'board_sprint')  # both weight name over description
+
+TRIGGER_SQL = '''
+CREATE FUNCTION {table}_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('pg_catalog.english', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('pg_catalog.english', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER {table}_search_vector BEFORE INSERT OR UPDATE OF name, description ON {table}
+    FOR EACH ROW EXECUTE PROCEDURE {table}_search_vector();
+UPDATE {table} SET name = name;
+CREATE INDEX {table}_search_vector_gin ON {table} USING gin (search_vector);
+'''
+
+DROP_TRIGGER_SQL = '''
+DROP TRIGGER IF EXISTS {table}_search_vector ON {table};
+DROP FUNCTION IF EXISTS {table}_search_vector();
+DROP INDEX IF EXISTS {table}_search_vector_gin;
+'''
+
+
+def create_search_triggers(apps, schema_editor):
+    """keep search_vector up to date in the database, so saves, bulk writes and raw updates all maintain it"""
+    if schema_editor.connection.vendor != 'postgresql':  # other backends search with icontains
+        return
+    for table in SEARCH_TABLES:
+        schema_editor.execute(TRIGGER_SQL.format(table=table))
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in SEARCH_TABLES:
+        schema_editor.execute(DROP_TRIGGER_SQL.format(table=table))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('board', '0006_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sprint',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 18:09
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('board', '0009_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SprintStats',
+            fields=[
+                ('sprint', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='board.Sprint')),
+                ('data', models.TextField()),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 19:33
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# the trigram indexes the first release of 0006 created with pg_trgm, unused since ?search= matches search_vector
+# on PostgreSQL, yet kept up to date on writes. 0006 no longer creates them, nor needs the extension
+TRIGRAM_INDEXES = ('task_name_trgm', 'task_description_trgm', 'sprint_name_trgm')
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':  # never created elsewhere
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('board', '0012_archivedtask'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_trigram_indexes, migrations.RunPython.noop),
+    ]
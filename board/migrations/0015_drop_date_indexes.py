@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 20:10
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# the single column indexes on the task dates the first release of 0006 created for ?ordering=, which the keyset
+# pages refuse for these nullable fields. 0006 no longer creates them
+DATE_INDEXES = ('task_started', 'task_due', 'task_completed')
+
+
+def drop_date_indexes(apps, schema_editor):
+    for name in DATE_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(schema_editor.quote_name(name)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('board', '0014_sprint_base_manager'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_date_indexes, migrations.RunPython.noop),
+    ]
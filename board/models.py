@@ -2,8 +2,11 @@ from django.conf import settings  # for assign task to user
 from django.utils.translation import ugettext_lazy as _  # lazy text getter
 
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField  # full text search document, kept by a db trigger
 from django.contrib.auth.models import User  # for customizing user model
-from django.db.models.signals import post_save  # for Profile link
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save  # for Profile link and collection versions
+from django.utils import timezone
 from django.dispatch import receiver  # for decorating User model functions
 
 
@@ -17,17 +20,66 @@ class Profile(models.Model):
     state = models.CharField(max_length=20, blank=True)
     zip = models.CharField(max_length=10, blank=True)
     country = models.CharField(max_length=20, default='United States')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Profile, cls).from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))  # attname -> stored value, for the dirty fields
+        return instance
+
+    def get_dirty_fields(self):
+        """names of the fields changed since the profile was loaded or saved, deferred ones that were assigned too"""
+        loaded = getattr(self, '_loaded_values', None)
+        fields = [field for field in self._meta.concrete_fields if not field.primary_key]
+        if loaded is None:  # never stored
+            return [field.name for field in fields]
+        return [field.name for field in fields if
+                (field.attname in loaded and getattr(self, field.attname) != loaded[field.attname]) or
+                (field.attname not in loaded and field.attname in self.__dict__)]
+
+    def save(self, *args, **kwargs):
+        """a stored profile writes only its changed columns, and nothing at all when none changed"""
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            dirty = self.get_dirty_fields()
+            if not dirty:
+                return
+            kwargs['update_fields'] = set(dirty) | {'updated_at'}
+        super(Profile, self).save(*args, **kwargs)
+        written = kwargs.get('update_fields')
+        loaded = self.__dict__.setdefault('_loaded_values', {})
+        loaded.update((field.attname, getattr(self, field.attname)) for field in self._meta.concrete_fields
+                      if (written is None or field.name in written) and field.attname in self.__dict__)
 
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
+    """insert the profile of a new user, with the fields of one attached to the unsaved user (user.profile = ...)"""
     if created:
-        Profile.objects.create(user=instance)
+        profile = getattr(instance, User.profile.cache_name, None) or Profile()
+        profile.user = instance
+        profile.save()
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
+def save_user_profile(sender, instance, created, **kwargs):
+    """save the profile along with the user when it was loaded with it, only its changed columns.
+    Saves that never read the profile, such as the last_login update of a login, leave it alone"""
+    profile = getattr(instance, User.profile.cache_name, None)  # loaded or attached, not queried here
+    if profile is not None and not created:  # a new user's profile was just inserted
+        profile.save()
+
+
+class SearchVectorDeferredManager(models.Manager):
+    """Rows are read without their search_vector: the search filter uses it in SQL, nothing loads it.
+    A task reading its sprint in the same join leaves the sprint's out too."""
+
+    def __init__(self, *deferred):
+        super(SearchVectorDeferredManager, self).__init__()
+        self.deferred = ('search_vector', ) + deferred
+
+    def get_queryset(self):
+        return super(SearchVectorDeferredManager, self).get_queryset().defer(*self.deferred)
 
 
 class Sprint(models.Model):
@@ -36,13 +88,23 @@ class Sprint(models.Model):
     name = models.CharField(max_length=100, blank=True, default='')
     description = models.TextField(blank=True, default='')
     end = models.DateField(unique=True)  # only one spring can be ended at one moment of time
+    search_vector = SearchVectorField(null=True, editable=False)  # name and description, PostgreSQL only
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = SearchVectorDeferredManager()
+
+    class Meta:
+        base_manager_name = 'objects'  # task.sprint is read without the search_vector too
+        indexes = [
+            models.Index(fields=['name'], name='sprint_name'),  # ?ordering=name
+        ]
 
     def __str__(self):
         return self.name or _('Sprint ending %s') % self.end  # to string
 
 
-class Task(models.Model):
-    """Unit of work to be done for the sprint."""
+class AbstractTask(models.Model):
+    """The columns of a task, shared by the task table and its archive."""
 
     # status code for task
     STATUS_TODO = 1
@@ -67,7 +129,185 @@ class Task(models.Model):
     started = models.DateField(blank=True, null=True)
     due = models.DateField(blank=True, null=True)
     completed = models.DateField(blank=True, null=True)  # dates for start, due, completion
+    search_vector = SearchVectorField(null=True, editable=False)  # name and description, PostgreSQL only
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = SearchVectorDeferredManager('sprint__search_vector')
+
+    class Meta:
+        abstract = True
 
     def __str__(self):
         return self.name  # to string
 
+
+class Task(AbstractTask):
+    """Unit of work to be done for the sprint."""
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sprint', 'status', 'order'], name='task_sprint_status_order'),  # board columns
+            models.Index(fields=['assigned', 'status'], name='task_assigned_status'),  # a user's tasks
+            models.Index(fields=['order', 'id'], name='task_order_id'),  # keyset pages
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Task, cls).from_db(db, field_names, values)
+        instance._loaded_sprint_id = instance.__dict__.get('sprint_id')  # the sprint the stored row is in
+        return instance
+
+    def save(self, *args, **kwargs):
+        """a stored task is only ever updated: moved to the archive meanwhile, it is not inserted again but
+        raises DatabaseError, as no row was updated"""
+        if not self._state.adding and not kwargs.get('force_insert'):
+            kwargs.setdefault('force_update', True)
+        super(Task, self).save(*args, **kwargs)
+        self._loaded_sprint_id = self.sprint_id  # the save receivers have seen the move
+
+    @property
+    def previous_sprint_id(self):
+        """the sprint the task was in when loaded, receivers use it to update what the old sprint shows"""
+        return getattr(self, '_loaded_sprint_id', self.sprint_id)
+
+
+class ArchivedTask(AbstractTask):
+    """A done task of a closed sprint, moved out of the task table by archive_sprints with its id.
+
+    Read only: the task list of its sprint, the sprint board and stats and the task detail read it
+    along with the task table."""
+    id = models.IntegerField(primary_key=True)  # the id it had as a task, links stay valid
+    updated_at = models.DateTimeField()  # as last written, copied
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sprint', 'order', 'id'], name='archivedtask_sprint_order'),  # a sprint's tasks
+        ]
+
+
+class SprintStats(models.Model):
+    """Materialized statistics of a closed sprint, its tasks are no longer worked on."""
+
+    sprint = models.OneToOneField(Sprint, on_delete=models.CASCADE, primary_key=True)
+    data = models.TextField()  # the stats end point response, as json
+    computed_at = models.DateTimeField(auto_now=True)
+
+
+class CollectionVersion(models.Model):
+    """Change counter of an API collection, bumped on every write so validators need no table scan."""
+
+    # collections, a representation depends on each one it shows data from
+    SPRINTS = 'sprints'
+    TASKS = 'tasks'
+    USERS = 'users'
+
+    name = models.CharField(max_length=20, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return '{} v{}'.format(self.name, self.version)
+
+    @classmethod
+    def bump(cls, name, updated_at=None):
+        """count a write to the collection, for writes that bypass the model signals (bulk and queryset updates)"""
+        updated_at = updated_at or timezone.now()
+        changed = cls.objects.filter(name=name).update(version=F('version') + 1, updated_at=updated_at)
+        if not changed:
+            cls.objects.get_or_create(name=name, defaults={'version': 1, 'updated_at': updated_at})
+
+    @classmethod
+    def get_versions(cls, names):
+        """current (version, updated_at) of the collections, in one query"""
+        found = dict((v.name, v) for v in cls.objects.filter(name__in=names))
+        return [(name, found[name].version, found[name].updated_at) if name in found else (name, 0, None)
+                for name in names]
+
+
+class Change(models.Model):
+    """Log of the writes to the API collections, read by the changes end point for delta sync."""
+
+    # what happened to the row
+    ACTION_CREATED = 1
+    ACTION_UPDATED = 2
+    ACTION_DELETED = 3
+
+    ACTION_CHOICES = (
+        (ACTION_CREATED, _('Created')),
+        (ACTION_UPDATED, _('Updated')),
+        (ACTION_DELETED, _('Deleted')),
+    )
+
+    id = models.BigAutoField(primary_key=True)  # the sync cursor
+    collection = models.CharField(max_length=20)  # a CollectionVersion name
+    object_id = models.IntegerField()  # pk of the row, the user for profiles
+    action = models.SmallIntegerField(choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return '{} {} {}'.format(self.collection, self.object_id, self.get_action_display())
+
+    @classmethod
+    def record(cls, collection, object_ids, action):
+        """log writes in one insert, for writes that bypass the model signals (bulk and queryset updates)"""
+        now = timezone.now()
+        cls.objects.bulk_create([
+            cls(collection=collection, object_id=object_id, action=action, created_at=now)
+            for object_id in object_ids
+        ])
+
+
+class ImportProgress(models.Model):
+    """How far an import_board run got, saved in the transaction of each batch so a rerun resumes after it."""
+
+    source = models.CharField(max_length=255, unique=True)  # the imported file, or the name given for the run
+    records = models.PositiveIntegerField(default=0)  # input records done, imported or rejected
+    sprints = models.TextField(default='{}')  # json map of the sprint ids in the input to the imported sprints
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '{} ({} records)'.format(self.source, self.records)
+
+
+COLLECTIONS = {  # the collection each model's rows belong to, the receivers below are bound to these senders
+    Sprint: CollectionVersion.SPRINTS,
+    Task: CollectionVersion.TASKS,
+    User: CollectionVersion.USERS,
+    Profile: CollectionVersion.USERS,
+}
+
+
+def is_login_save(sender, update_fields=None, **kwargs):
+    """the last_login update of a login, which no API representation shows, so there is nothing to invalidate"""
+    return sender is User and update_fields is not None and set(update_fields) == {'last_login'}
+
+
+@receiver([post_save, post_delete], sender=Sprint)
+@receiver([post_save, post_delete], sender=Task)
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=Profile)
+def bump_collection_version(sender, instance, signal, **kwargs):
+    if is_login_save(sender, **kwargs):
+        return
+    # a deleted row's updated_at is older than the delete, Last-Modified must not go back to it
+    updated_at = getattr(instance, 'updated_at', None) if signal is post_save else None
+    CollectionVersion.bump(COLLECTIONS[sender], updated_at)
+
+
+@receiver([post_save, post_delete], sender=Sprint)
+@receiver([post_save, post_delete], sender=Task)
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=Profile)
+def record_change(sender, instance, signal, created=False, **kwargs):
+    if is_login_save(sender, **kwargs):
+        return
+    if signal is post_delete:
+        action = Change.ACTION_DELETED
+    else:
+        action = Change.ACTION_CREATED if created else Change.ACTION_UPDATED
+    if sender is Profile:  # profiles are part of the user resource
+        object_id, action = instance.user_id, Change.ACTION_UPDATED
+    else:
+        object_id = instance.pk
+    Change.objects.create(collection=COLLECTIONS[sender], object_id=object_id, action=action)
@@ -0,0 +1,198 @@
+"""
+pagination styles for the API end points, offset pages for small resources and keyset cursors for large ones
+"""
+from base64 import b64decode, b64encode
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from django.utils import six
+from django.utils.six.moves.urllib import parse as urlparse
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination, _positive_int, _reverse_ordering
+from rest_framework.utils.urls import replace_query_param
+
+
+class DefaultPagination(PageNumberPagination):
+    """Page number pagination with the page size the client may pick, up to a maximum."""
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetPagination(CursorPagination):
+    """Keyset pagination, pages are found by comparing the ordering key with the last seen row.
+
+    Unlike offset pagination there is no COUNT(*) and no OFFSET, every page is an index range scan.
+    The ordering always ends with the primary key, so each row has a unique position
+    and the cursor is just the key values of the row at the edge of the page."""
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('id', )  # overridden per resource, the pk tie-breaker is added when missing
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_querysets([queryset], request, view)
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """a page of the rows of querysets read as one, such as the tasks of a sprint in the task table and
+        in the archive: each gives its first rows past the cursor and the page is the first of them in order"""
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, querysets[0], view)
+
+        self.cursor = self.decode_cursor(request)
+        reverse, position = self.cursor if self.cursor else (False, None)
+
+        results = []
+        for queryset in querysets:
+            if reverse:  # walking backwards, read the page in reverse order then flip it
+                queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+            else:
+                queryset = queryset.order_by(*self.ordering)
+            if position is not None:  # only rows past the cursor, in the direction of travel
+                queryset = queryset.filter(self._keyset_filter(position, reverse))
+            queryset = self._load_keys(queryset)
+            results.extend(queryset[:self.page_size + 1])  # one extra row tells if there is more
+        if len(querysets) > 1:
+            results = self._sort(results, reverse)[:self.page_size + 1]
+        self.page = results[:self.page_size]
+        has_more = len(results) > len(self.page)
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        """use the ordering asked by the client, or the one the filters left on the queryset (e.g. search rank),
+        when it is a usable key, then append the pk tie-breaker"""
+        ordering = None
+        for filter_cls in getattr(view, 'filter_backends', []):
+            if hasattr(filter_cls, 'get_ordering'):
+                ordering = filter_cls().get_ordering(request, queryset, view)
+                break
+        if not ordering:
+            ordering = queryset.query.order_by
+        if not ordering or not all(self._is_key_field(queryset, field) for field in ordering):
+            ordering = self.ordering  # nullable or related fields cannot be compared by a keyset
+        ordering = tuple(ordering)
+        names = [field.lstrip('-') for field in ordering]
+        if 'id' not in names and 'pk' not in names:
+            ordering += ('-id' if ordering[-1].startswith('-') else 'id', )
+        return ordering
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor((False, self._get_position_from_instance(self.page[-1], self.ordering)))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor((True, self._get_position_from_instance(self.page[0], self.ordering)))
+
+    def decode_cursor(self, request):
+        """the cursor is a base64 query string with the direction and the key values of the edge row"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = urlparse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            position = tokens['p']
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if len(position) != len(self.ordering):  # a cursor made for another ordering
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, position
+
+    def encode_cursor(self, cursor):
+        reverse, position = cursor
+        tokens = {'p': position}
+        if reverse:
+            tokens['r'] = '1'
+        querystring = urlparse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _get_position_from_instance(self, instance, ordering):
+        position = []
+        for field in ordering:
+            name = field.lstrip('-')
+            value = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+            position.append(str(value))
+        return position
+
+    def _sort(self, rows, reverse):
+        """rows of several querysets in the order of the page, one stable sort per key field from the last"""
+        for field in reversed(self.ordering):
+            name = field.lstrip('-')
+            rows.sort(key=lambda row: row[name] if isinstance(row, dict) else getattr(row, name),
+                      reverse=field.startswith('-') != reverse)
+        return rows
+
+    def _load_keys(self, queryset):
+        """with only() in effect (sparse fieldsets) or values() rows (the list fast path), the key fields
+        still have to be loaded to build the cursors"""
+        keys = set(field.lstrip('-') for field in self.ordering)
+        if queryset._fields is not None:  # values(), where annotations are asked for by name too
+            return queryset.values(*(set(queryset._fields) | keys))
+        names, defer = queryset.query.deferred_loading
+        if defer:
+            return queryset
+        return queryset.only(*(set(names) | (keys - set(queryset.query.annotations))))
+
+    def _keyset_filter(self, position, reverse):
+        """rows strictly after the position: (a > x) or (a = x and b > y) or ..., per field direction"""
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            after = '__lt' if field.startswith('-') != reverse else '__gt'
+            term = Q(**{name + after: position[index]})
+            for previous, value in zip(self.ordering[:index], position):
+                term &= Q(**{previous.lstrip('-'): value})
+            condition |= term
+        return condition
+
+    @staticmethod
+    def _is_key_field(queryset, field):
+        if not isinstance(field, six.string_types):  # ordering expressions have no value to put in a cursor
+            return False
+        name = field.lstrip('-')
+        if name in queryset.query.annotations:  # computed per row in the query, such as the search rank
+            return True
+        try:
+            model_field = queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+        return model_field.concrete and not model_field.null and not model_field.is_relation
+
+
+class SprintPagination(KeysetPagination):
+    """sprints are paged by end date"""
+    ordering = ('end', 'id', )
+
+
+class TaskPagination(KeysetPagination):
+    """tasks are paged in board order"""
+    ordering = ('order', 'id', )
@@ -0,0 +1,158 @@
+"""
+renderers for the export end points, rows are written as they are read so the response is never held in memory,
+and the columnar formats for large list payloads
+"""
+import csv
+import json
+from collections import OrderedDict
+
+from django.core.serializers.json import DjangoJSONEncoder  # dates and decimals
+from django.utils.encoding import force_text
+from rest_framework import serializers
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack  # optional, for the MessagePack variant of the columnar format
+except ImportError:
+    msgpack = None
+
+
+class Echo(object):
+    """file-like object handing back what the csv writer writes"""
+
+    def write(self, value):
+        return value
+
+
+class StreamingRenderer(BaseRenderer):
+    """Renders rows of a fixed set of columns, one chunk of lines at a time."""
+    charset = 'utf-8'
+    chunk_size = 100  # rows per chunk handed to the server
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """a whole response at once, such as an error detail"""
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        columns = list(rows[0].keys()) if rows and isinstance(rows[0], dict) else ['detail']
+        values = [[self.detail(row.get(column)) for column in columns] if isinstance(row, dict) else [self.detail(row)]
+                  for row in rows]
+        return ''.join(self.stream(columns, values)).encode(self.charset)
+
+    def detail(self, value):
+        """a value of a whole response, as a row value"""
+        return value
+
+    def stream(self, columns, rows):
+        """generator of text chunks for the rows, each row a sequence of values in column order"""
+        chunk = self.header(columns)
+        for index, row in enumerate(rows, 1):
+            chunk.append(self.line(columns, row))
+            if index % self.chunk_size == 0:
+                yield ''.join(chunk)
+                chunk = []
+        if chunk:
+            yield ''.join(chunk)
+
+    def header(self, columns):
+        return []
+
+    def line(self, columns, row):
+        raise NotImplementedError('.line() must be implemented.')
+
+
+class NDJSONRenderer(StreamingRenderer):
+    """one JSON object per line"""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def line(self, columns, row):
+        return json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+class CSVRenderer(StreamingRenderer):
+    """comma separated values with a header line"""
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def __init__(self):
+        self.writer = csv.writer(Echo())
+
+    def header(self, columns):
+        return [self.writer.writerow(columns)]
+
+    def line(self, columns, row):
+        return self.writer.writerow(row)  # None is written as an empty field, dates in ISO format
+
+    def detail(self, value):
+        """the messages of a field error in one field, not a Python list"""
+        return ' '.join(force_text(message) for message in value) if isinstance(value, list) else value
+
+
+class EventStreamRenderer(BaseRenderer):
+    """text/event-stream, the events end point streams its own response, this renders its errors as JSON"""
+    media_type = 'text/event-stream'
+    format = 'events'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder).encode(self.charset) if data is not None else b''
+
+
+def to_columnar(data, renderer_context=None):
+    """lists of objects as the field names once and one array of values per field.
+
+    The links are sent once as templates with {field} placeholders and choice fields as their codes,
+    with the labels once in "choices". Paged lists keep their next, previous and count,
+    other payloads (details, errors) are left as they are."""
+    rows = data.get('results') if isinstance(data, dict) else data
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        return data
+    view = (renderer_context or {}).get('view')
+    serializer = view.get_serializer() if hasattr(view, 'get_serializer') else None  # with the sparse fieldset
+    fields = list(rows[0].keys()) if rows else list(getattr(serializer, 'fields', {}).keys())
+
+    payload = OrderedDict((key, value) for key, value in data.items() if key != 'results') \
+        if isinstance(data, dict) else OrderedDict()
+    choices = OrderedDict()
+    if serializer is not None:
+        for name, field in serializer.fields.items():
+            if isinstance(field, serializers.ChoiceField) and name + '_display' in fields:
+                choices[name] = [[code, force_text(label)] for code, label in field.choices.items()]
+                fields.remove(name + '_display')  # the client looks the label up
+        if 'links' in fields and hasattr(serializer, 'get_link_templates'):
+            payload['links'] = serializer.get_link_templates()
+            fields.remove('links')
+    payload['fields'] = fields
+    payload['values'] = [[row.get(name) for row in rows] for name in fields]
+    if choices:
+        payload['choices'] = choices
+    return payload
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """columnar JSON, asked for with Accept: application/vnd.scrum.columnar+json"""
+    media_type = 'application/vnd.scrum.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super(ColumnarJSONRenderer, self).render(to_columnar(data, renderer_context),
+                                                        accepted_media_type, renderer_context)
+
+
+class ColumnarMessagePackRenderer(BaseRenderer):
+    """the columnar payload in MessagePack, asked for with Accept: application/vnd.scrum.columnar+msgpack"""
+    media_type = 'application/vnd.scrum.columnar+msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(to_columnar(data, renderer_context), use_bin_type=True,
+                             default=JSONEncoder().default)  # lazy strings, decimals and the like
+
+
+COLUMNAR_RENDERERS = (ColumnarJSONRenderer, ) + ((ColumnarMessagePackRenderer, ) if msgpack is not None else ())
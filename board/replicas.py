@@ -0,0 +1,105 @@
+"""
+read replicas: the list and detail reads of the API views go to a replica, every other query to the primary.
+
+A client that just wrote reads from the primary for STICKY seconds, so it sees its own writes whatever the
+replication lag. A replica whose connection fails is left out for RETRY_AFTER seconds and the read is served
+by another one or by the primary.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from scrum.processes import is_shared_cache
+
+# where the marks of the clients that just wrote are kept, the response cache's unless set; it must be shared by
+# the workers when there are several, a mark only one worker sees sends the client's next read to a replica
+STICKY_CACHE = (getattr(settings, 'BOARD_REPLICA_STICKY_CACHE', None) or
+                getattr(settings, 'BOARD_CACHE_ALIAS', 'default'))  # no models imported here, as for the router
+REPLICAS = getattr(settings, 'BOARD_DATABASE_REPLICAS', ())  # the aliases of DATABASES holding a copy of default
+STICKY = getattr(settings, 'BOARD_REPLICA_STICKY_SECONDS', 5)  # upper bound of the replication lag
+RETRY_AFTER = getattr(settings, 'BOARD_REPLICA_RETRY_AFTER', 30)  # seconds a failed replica is left out
+PREFIX = 'board:replicas'
+
+_local = threading.local()  # the replica the current request reads from, per thread
+
+
+def check_settings():
+    """refuse to start with replicas and several workers keeping the sticky marks each to itself"""
+    if REPLICAS and getattr(settings, 'WEB_CONCURRENCY', 1) > 1 and not is_shared_cache(STICKY_CACHE):
+        raise ImproperlyConfigured(
+            'BOARD_REPLICA_STICKY_CACHE must name a cache shared by the {} workers when reads go to replicas, '
+            'the {!r} cache is kept per process.'.format(settings.WEB_CONCURRENCY, STICKY_CACHE))
+
+
+class ReplicaRouter(object):
+    """Routes the reads to the replica chosen for the current request, when there is one, everything else
+    to the primary. The alias is given explicitly, otherwise Django would follow an object read from a replica
+    back to it for its related objects and its saves."""
+
+    def db_for_read(self, model, **hints):
+        return get_replica() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = (DEFAULT_DB_ALIAS, ) + tuple(REPLICAS)
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True  # the same rows
+        return None
+
+
+class Health(object):
+    """The replicas that failed recently, shared by the threads of the process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.down_until = {}  # alias -> time it may be tried again
+
+    def available(self, aliases):
+        now = time.time()
+        with self.lock:
+            return [alias for alias in aliases if self.down_until.get(alias, 0) <= now]
+
+    def mark_down(self, alias):
+        with self.lock:
+            self.down_until[alias] = time.time() + RETRY_AFTER
+        connections[alias].close()  # this thread's broken connection, the others fail and get closed on their own
+
+
+health = Health()
+
+
+def choose_replica():
+    """a random replica among the healthy ones, None when none is left"""
+    aliases = health.available(REPLICAS)
+    return random.choice(aliases) if aliases else None
+
+
+def get_replica():
+    return getattr(_local, 'alias', None)
+
+
+def use_replica(alias):
+    """route the reads of this thread to alias, None for the primary"""
+    _local.alias = alias
+
+
+def sticky_key(user):
+    return '{}:sticky:{}'.format(PREFIX, user.pk)
+
+
+def stick(user):
+    """read from the primary for the next STICKY seconds, after a write of the user.
+
+    The mark is kept in the STICKY_CACHE backend, shared by the workers."""
+    caches[STICKY_CACHE].set(sticky_key(user), True, STICKY)
+
+
+def is_sticky(user):
+    return bool(caches[STICKY_CACHE].get(sticky_key(user)))
@@ -1,32 +1,151 @@
 from rest_framework import serializers  # serializers lib from django-rest
 
-from rest_framework.reverse import reverse  # for producing links for resource
+from collections import OrderedDict  # the field order of the representations
 from datetime import date  # for date validation
+from functools import lru_cache
+from operator import itemgetter  # plain columns of the values() rows
+from django.db import transaction
+from django.utils.encoding import force_text
 from django.utils.translation import ugettext_lazy as _  # make error message translatable
 
+from .links import LinkBuilder  # for producing links for resource
 from .models import Sprint, Task, Profile  # the board models
 from django.contrib.auth import get_user_model  # to get a clean user model
 
 User = get_user_model()  # a clean user model for Task foreign key
 
 
-class SprintSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin(object):
+    """Serializer taking fields= and omit= sets of field names to keep or to leave out.
+
+    Meta.field_columns names the model columns read by the fields that are not plain model fields,
+    so the viewsets can load only the columns of the kept fields."""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        omit = kwargs.pop('omit', None)
+        super(SparseFieldsMixin, self).__init__(*args, **kwargs)
+        if fields is not None or omit is not None:
+            kept = set(self.select_fields(self.fields.keys(), fields, omit))
+            for name in list(self.fields.keys()):
+                if name not in kept:
+                    del self.fields[name]
+
+    @staticmethod
+    def select_fields(names, fields=None, omit=None):
+        """the names kept, in their order"""
+        return [name for name in names if (fields is None or name in fields) and (omit is None or name not in omit)]
+
+    @classmethod
+    def get_columns(cls, names):
+        """the model columns, as only() takes them, read by the given fields"""
+        field_columns = getattr(cls.Meta, 'field_columns', {})
+        columns = set()
+        for name in names:
+            field = cls._declared_fields.get(name)
+            if name in field_columns:
+                columns.update(field_columns[name])
+            elif field is not None and field.source:
+                columns.add(field.source.replace('.', '__'))  # profile.city -> profile__city
+            else:
+                columns.add(name)
+        return columns
+
+
+class ValuesRowsMixin(object):
+    """Serializer with a read-only fast path for the list pages, representing values() rows instead of instances.
+
+    Plain fields are read by column, fields whose type changes the value on the way out (dates and the like)
+    through their to_representation, and the computed ones with the (columns, function of the row) pairs
+    of get_row_fields. The output is the serializer's own, writes and details keep the full serializer."""
+    plain_fields = (serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+                    serializers.ChoiceField, serializers.ReadOnlyField,
+                    serializers.PrimaryKeyRelatedField)  # the database value is sent as it is
+
+    @classmethod
+    def get_row_reader(cls, context, fields=None, omit=None):
+        """(columns, represent): the columns to ask values() for and the function turning the rows into
+        representations, for the fields kept by the fields= and omit= arguments"""
+        computed = cls.get_row_fields(context)
+        columns, names, readers = set(), [], []
+        for name, column, read in compile_fields(cls, frozen(fields), frozen(omit)):
+            field_columns, read = computed[name] if name in computed else ((column, ), read)
+            columns.update(field_columns)
+            names.append(name)
+            readers.append(read)
+
+        def represent(rows):
+            return [OrderedDict(zip(names, [read(row) for read in readers])) for row in rows]
+        return columns, represent
+
+    @classmethod
+    def get_row_fields(cls, context):
+        """{field name: (columns, function of a values() row)} for the fields not read from one column"""
+        return {}
+
+
+def frozen(names):
+    return frozenset(names) if names is not None else None
+
+
+@lru_cache(maxsize=128)  # per serializer and fieldset, binding the fields is most of the cost of a small page
+def compile_fields(serializer_class, fields, omit):
+    """(name, column, function of a values() row) for each field the serializer sends, the fields are bound
+    without a context so their to_representation must not need the request"""
+    compiled = []
+    for name, field in serializer_class(fields=fields, omit=omit).fields.items():
+        if field.write_only:
+            continue
+        column = field.source.replace('.', '__')  # profile.city -> profile__city
+        if isinstance(field, serializers.SlugRelatedField):
+            column += '__' + field.slug_field
+            read = itemgetter(column)
+        elif isinstance(field, serializer_class.plain_fields):
+            read = itemgetter(column)
+        else:
+            read = represent_column(column, field.to_representation)
+        compiled.append((name, column, read))
+    return tuple(compiled)
+
+
+def represent_column(column, to_representation):
+    def read(row):
+        value = row[column]
+        return None if value is None else to_representation(value)  # as the serializer skips null attributes
+    return read
+
+
+class SprintSerializer(SparseFieldsMixin, ValuesRowsMixin, serializers.ModelSerializer):
 
     links = serializers.SerializerMethodField()  # links to related resource
 
     class Meta:
         model = Sprint
         fields = ('id', 'name', 'description', 'end', 'links', )
+        field_columns = {'links': ('id', )}
 
     def get_links(self, obj):
         """produce links to related resource"""
-        request = self.context['request']
+        return self.make_links(LinkBuilder.for_context(self.context), obj.pk)  # route templates shared by the page
+
+    @staticmethod
+    def make_links(links, pk):
+        return {
+            'self': links.url('sprint-detail', 'pk', pk),  # link to detail page of itself
+            'tasks': links.url('task-list') + '?sprint={}'.format(pk),  # get tasks belongs to this Sprint
+        }
+
+    @classmethod
+    def get_row_fields(cls, context):
+        links = LinkBuilder.for_context(context)
+        return {'links': (('id', ), lambda row: cls.make_links(links, row['id']))}
+
+    def get_link_templates(self):
+        """the links with {field} placeholders, sent once by the columnar format"""
+        links = LinkBuilder.for_context(self.context)
         return {
-            'self': reverse('sprint-detail',  # link to detail page of itself
-                            kwargs={'pk': obj.pk},
-                            request=request),  # needed for creating the full url
-            'tasks': reverse('task-list',  # get tasks belongs to this Sprint
-                             request=request) + '?sprint={}'.format(obj.pk),
+            'self': links.template('sprint-detail', 'pk', '{id}'),
+            'tasks': links.url('task-list') + '?sprint={id}',
         }
 
     def validate_end(self, field):
@@ -41,10 +160,30 @@ class SprintSerializer(serializers.ModelSerializer):
         return field
 
 
-class TaskSerializer(serializers.ModelSerializer):
+class SprintField(serializers.PrimaryKeyRelatedField):
+    """Sprint by primary key, read from the 'sprints' map of the context when the caller looked them up already."""
+
+    def to_internal_value(self, data):
+        sprints = self.context.get('sprints')
+        if sprints is None:
+            return super(SprintField, self).to_internal_value(data)
+        try:
+            return sprints[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class TaskSerializer(SparseFieldsMixin, ValuesRowsMixin, serializers.ModelSerializer):
 
     # get text for status code, to show text instead of code
     status_display = serializers.SerializerMethodField()
+    sprint = SprintField(  # batch writes share one lookup of the sprints
+        queryset=Sprint.objects.all(),
+        required=False,
+        allow_null=True
+    )
     assigned = serializers.SlugRelatedField(  # replace assigned with user name instead of user key id
         slug_field=User.USERNAME_FIELD,
         required=False,
@@ -57,29 +196,49 @@ class TaskSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'description', 'sprint',
                   'status', 'status_display', 'order',
                   'assigned', 'started', 'due', 'completed', 'links', )
+        field_columns = {
+            'status_display': ('status', ),
+            'assigned': ('assigned__' + User.USERNAME_FIELD, ),
+            'links': ('sprint', 'assigned__' + User.USERNAME_FIELD, ),
+        }
 
     def get_status_display(self, obj):
         return obj.get_status_display()
 
     def get_links(self, obj):
         """produce links to related resource"""
-        request = self.context['request']
-        links = {
-            'self': reverse('task-detail',  # link to detail page of itself
-                            kwargs={'pk': obj.pk},
-                            request=request),  # needed for creating the full url
-            'sprint': None,  # parent sprint
-            'assigned': None  # user assigned
+        return self.make_links(LinkBuilder.for_context(self.context),  # route templates shared by the whole page
+                               obj.pk, obj.sprint_id, obj.assigned.get_username() if obj.assigned_id else None)
+
+    @staticmethod
+    def make_links(links, pk, sprint_id, username):
+        return {
+            'self': links.url('task-detail', 'pk', pk),  # link to detail page of itself
+            'sprint': links.url('sprint-detail', 'pk', sprint_id) if sprint_id else None,  # parent sprint
+            'assigned': links.url('user-detail', User.USERNAME_FIELD,  # and assigned user
+                                  username) if username is not None else None,
+        }
+
+    @classmethod
+    def get_row_fields(cls, context):
+        """the status labels are looked up in a table made once per page, in the language of the request"""
+        labels = dict((code, force_text(label)) for code, label in Task.STATUS_CHOICES)
+        links = LinkBuilder.for_context(context)
+        username = 'assigned__' + User.USERNAME_FIELD
+        return {
+            'status_display': (('status', ), lambda row: labels.get(row['status'], row['status'])),
+            'links': (('id', 'sprint', username),
+                      lambda row: cls.make_links(links, row['id'], row['sprint'], row[username])),
+        }
+
+    def get_link_templates(self):
+        """the links with {field} placeholders, sent once by the columnar format, a null field means no link"""
+        links = LinkBuilder.for_context(self.context)
+        return {
+            'self': links.template('task-detail', 'pk', '{id}'),
+            'sprint': links.template('sprint-detail', 'pk', '{sprint}'),
+            'assigned': links.template('user-detail', User.USERNAME_FIELD, '{assigned}'),
         }
-        if obj.sprint_id:
-            links['sprint'] = reverse('sprint-detail',  # link to parent sprint
-                                      kwargs={'pk': obj.sprint_id},
-                                      request=request)
-        if obj.assigned:
-            links['assigned'] = reverse('user-detail',  # and assigned user
-                                        kwargs={User.USERNAME_FIELD: obj.assigned},
-                                        request=request)
-        return links
 
     def validate_sprint(self, data):
         """make sure that:
@@ -106,10 +265,12 @@ class TaskSerializer(serializers.ModelSerializer):
         1. a task in backlog have Not Started status
         2. Started date cannot be set for not started tasks.
         3. Completed date cannot be set for uncompleted tasks."""
-        sprint = attrs.get('sprint')
-        status = int(attrs.get('status'))
-        started = attrs.get('started')
-        completed = attrs.get('completed')
+        def current(name, default=None):  # partial updates validate against the stored values
+            return attrs[name] if name in attrs else getattr(self.instance, name, default)
+        sprint = attrs['sprint'] if 'sprint' in attrs else getattr(self.instance, 'sprint_id', None)
+        status = int(current('status', Task.STATUS_TODO))
+        started = current('started')
+        completed = current('completed')
         if not sprint and status != Task.STATUS_TODO:
             msg = _('Backlog tasks must have "Not Started" status.')
             raise serializers.ValidationError(msg)
@@ -129,7 +290,7 @@ class ProfileSerializer(serializers.ModelSerializer):
                   'city', 'state', 'zip_code', 'country')
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, ValuesRowsMixin, serializers.ModelSerializer):
 
     # function from user model, an interface for user model and custom user inherited auth.models
     full_name = serializers.CharField(source='get_full_name', read_only=True)
@@ -149,32 +310,63 @@ class UserSerializer(serializers.ModelSerializer):
                   'first_name', 'last_name', 'address_first', 'address_second',
                   'city', 'state', 'zip', 'country',
                   'is_active', 'links',)
+        field_columns = {
+            'full_name': ('first_name', 'last_name', ),
+            'links': (User.USERNAME_FIELD, ),
+        }
 
-    # link Profile data with User
+    # link Profile data with User, the profile is written by the user's post_save receivers
     def create(self, validated_data):
         profile_data = validated_data.pop('profile', None)
-        user = super(UserSerializer, self).create(validated_data)
-        self.update_or_create_profile(user, profile_data)
+        user = User(**validated_data)
+        user.profile = Profile(**(profile_data or {}))  # inserted by create_user_profile, with the user
+        with transaction.atomic():
+            user.save()
         return user
 
     def update(self, instance, validated_data):
         profile_data = validated_data.pop('profile', None)
-        self.update_or_create_profile(instance, profile_data)
-        return super(UserSerializer, self).update(instance, validated_data)
+        self.set_profile(instance, profile_data)
+        with transaction.atomic():
+            return super(UserSerializer, self).update(instance, validated_data)
 
-    def update_or_create_profile(self, user, profile_data):
-        # This always creates a Profile if the User is missing one;
-        # change the logic here if that's not right for your app
-        Profile.objects.update_or_create(user=user, defaults=profile_data)
+    def set_profile(self, user, profile_data):
+        """put the fields on the user's profile, saved with the user and only the changed columns;
+        a user missing a profile gets one"""
+        try:
+            profile = user.profile
+        except Profile.DoesNotExist:
+            profile = user.profile = Profile()
+        for name, value in (profile_data or {}).items():
+            setattr(profile, name, value)
 
     def get_links(self, obj):
         """produce links to related resource"""
-        request = self.context['request']
-        username = obj.get_username()
+        return self.make_links(LinkBuilder.for_context(self.context), obj.get_username())  # templates of the page
+
+    @staticmethod
+    def make_links(links, username):
         return {
-            'self': reverse('user-detail',  # link to detail page of itself
-                            kwargs={User.USERNAME_FIELD: username},
-                            request=request),  # needed for creating the full url
+            'self': links.url('user-detail', User.USERNAME_FIELD, username),  # link to detail page of itself
             'tasks': '{}?assigned={}'.format(  # get tasks assigned to this user
-                reverse('task-list', request=request), username)
+                links.url('task-list'), username)
+        }
+
+    @classmethod
+    def get_row_fields(cls, context):
+        """the full name as AbstractUser.get_full_name builds it"""
+        links = LinkBuilder.for_context(context)
+        return {
+            'full_name': (('first_name', 'last_name'),
+                          lambda row: '{} {}'.format(row['first_name'], row['last_name']).strip()),
+            'links': ((User.USERNAME_FIELD, ), lambda row: cls.make_links(links, row[User.USERNAME_FIELD])),
+        }
+
+    def get_link_templates(self):
+        """the links with {field} placeholders, sent once by the columnar format"""
+        links = LinkBuilder.for_context(self.context)
+        placeholder = '{' + User.USERNAME_FIELD + '}'
+        return {
+            'self': links.template('user-detail', User.USERNAME_FIELD, placeholder),
+            'tasks': '{}?assigned={}'.format(links.url('task-list'), placeholder),
         }
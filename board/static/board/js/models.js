@@ -80,8 +80,168 @@
   /* apply user Session to application scope */
   app.session = new Session();
 
+  /* conditional GET: remember the ETag and body of each url read, send the ETag back with the next read
+    and answer a 304 with the remembered body, so unchanged data is neither re-sent nor re-parsed */
+  let validated = {};
+
+  function conditionalSync(method, model, options) {
+    if (method === 'read') {
+      if (options.columnar) {
+        columnarOptions(options);
+      }
+      let url = options.url || _.result(model, 'url'),
+        success = options.success,
+        cached;
+      if (options.data) {  /* query parameters are part of the resource */
+        url += (url.indexOf('?') === -1 ? '?' : '&') + $.param(options.data);
+      }
+      cached = validated[url];
+      options.headers = _.extend({}, options.headers, cached ? {'If-None-Match': cached.etag} : {});
+      options.success = function (response, status, xhr) {
+        let etag = xhr.getResponseHeader('ETag');
+        if (xhr.status === 304 && cached) {
+          response = cached.response;
+        } else if (etag) {
+          validated[url] = {etag: etag, response: response};
+        }
+        if (success) {
+          success(response, status, xhr);
+        }
+      };
+    }
+    return Backbone.sync.apply(this, arguments);
+  }
+
+  /* columnar list payloads (Accept: application/vnd.scrum.columnar+json or +msgpack): the field names once,
+    an array of values per field, link templates with {field} placeholders and the labels of choice fields */
+  app.columnar = {
+    json: 'application/vnd.scrum.columnar+json',
+    msgpack: 'application/vnd.scrum.columnar+msgpack',
+    /* back to the usual payload, a list of objects (or a page of them in results) with links and labels */
+    decode: function (response) {
+      if (!response || !response.fields || !response.values) {
+        return response;
+      }
+      let fields = response.fields,
+        values = response.values,
+        templates = response.links,
+        choices = _.mapObject(response.choices || {}, function (pairs) {
+          return _.object(pairs);
+        }),
+        length = values.length ? values[0].length : 0,
+        rows = [];
+      for (let index = 0; index < length; index++) {
+        let row = {};
+        for (let column = 0; column < fields.length; column++) {
+          row[fields[column]] = values[column][index];
+        }
+        _.each(choices, function (labels, name) {
+          row[name + '_display'] = labels[row[name]];
+        });
+        if (templates) {
+          row.links = _.mapObject(templates, function (template) {
+            let missing = false,
+              url = template.replace(/\{(\w+)\}/g, function (match, name) {
+                missing = missing || row[name] === null || row[name] === undefined;
+                return row[name];
+              });
+            return missing ? null : url;  /* e.g. no sprint link for a backlog task */
+          });
+        }
+        rows.push(row);
+      }
+      return _.extend(_.omit(response, 'fields', 'values', 'links', 'choices'), {results: rows});
+    }
+  };
+
+  /* minimal MessagePack decoder, for the types the columnar renderer writes (no extension types) */
+  app.columnar.unpack = function (buffer) {
+    let bytes = new Uint8Array(buffer),
+      view = new DataView(buffer),
+      utf8 = new TextDecoder('utf-8'),
+      offset = 0;
+
+    function str(length) {
+      let value = utf8.decode(bytes.subarray(offset, offset + length));
+      offset += length;
+      return value;
+    }
+    function array(length) {
+      let value = [];
+      for (let i = 0; i < length; i++) {
+        value.push(read());
+      }
+      return value;
+    }
+    function map(length) {
+      let value = {};
+      for (let i = 0; i < length; i++) {
+        let key = read();
+        value[key] = read();
+      }
+      return value;
+    }
+    function next(size, getter) {
+      let value = view[getter](offset);
+      offset += size;
+      return value;
+    }
+    function read() {
+      let type = bytes[offset++];
+      if (type < 0x80) { return type; }  /* positive fixint */
+      if (type < 0x90) { return map(type & 0x0f); }
+      if (type < 0xa0) { return array(type & 0x0f); }
+      if (type < 0xc0) { return str(type & 0x1f); }
+      if (type >= 0xe0) { return type - 0x100; }  /* negative fixint */
+      switch (type) {
+        case 0xc0: return null;
+        case 0xc2: return false;
+        case 0xc3: return true;
+        case 0xc4: return bytes.slice(offset, offset += next(1, 'getUint8'));
+        case 0xc5: return bytes.slice(offset, offset += next(2, 'getUint16'));
+        case 0xc6: return bytes.slice(offset, offset += next(4, 'getUint32'));
+        case 0xca: return next(4, 'getFloat32');
+        case 0xcb: return next(8, 'getFloat64');
+        case 0xcc: return next(1, 'getUint8');
+        case 0xcd: return next(2, 'getUint16');
+        case 0xce: return next(4, 'getUint32');
+        case 0xcf: return next(4, 'getUint32') * 4294967296 + next(4, 'getUint32');
+        case 0xd0: return next(1, 'getInt8');
+        case 0xd1: return next(2, 'getInt16');
+        case 0xd2: return next(4, 'getInt32');
+        case 0xd3: return next(4, 'getInt32') * 4294967296 + next(4, 'getUint32');
+        case 0xd9: return str(next(1, 'getUint8'));
+        case 0xda: return str(next(2, 'getUint16'));
+        case 0xdb: return str(next(4, 'getUint32'));
+        case 0xdc: return array(next(2, 'getUint16'));
+        case 0xdd: return array(next(4, 'getUint32'));
+        case 0xde: return map(next(2, 'getUint16'));
+        case 0xdf: return map(next(4, 'getUint32'));
+      }
+      throw new Error('Unsupported MessagePack type 0x' + type.toString(16));
+    }
+    return bytes.length ? read() : null;  /* a 304 has no body */
+  };
+
+  /* jQuery reads dataType 'msgpack' from the array buffer of the response */
+  $.ajaxSetup({
+    converters: {
+      'binary msgpack': app.columnar.unpack
+    }
+  });
+
+  /* fetch options of a columnar read: fetch({columnar: 'json'}) or fetch({columnar: 'msgpack'}) */
+  function columnarOptions(options) {
+    if (options.columnar === 'msgpack') {
+      options.dataType = 'msgpack';
+      options.xhrFields = _.extend({}, options.xhrFields, {responseType: 'arraybuffer'});
+    }
+    options.headers = _.extend({}, options.headers, {Accept: app.columnar[options.columnar]});
+  }
+
   /* define a base model for Sprint, Task, User */
   let BaseModel = Backbone.Model.extend({
+    sync: conditionalSync,
     /* use urls from links property of the models to build urls */
     url: function () {
       let links = this.get('links'),
@@ -95,7 +255,44 @@
   });
 
   /* models for each of the backend models */
-  app.models.Sprint = BaseModel.extend({});
+  app.models.Sprint = BaseModel.extend({
+    /* load the sprint, its tasks and their users with one request to the board end point */
+    fetchBoard: function () {
+      let self = this;
+      return $.getJSON(this.url() + '/board').then(function (data) {
+        self.set(data.sprint);
+        /* tasks come grouped by status, the shared collections keep their other models */
+        app.tasks.set(_.flatten(_.values(data.tasks), true), {remove: false});
+        app.users.set(data.users, {remove: false});
+        return self;
+      });
+    },
+    /* live updates instead of polling: the changed tasks of the sprint arrive as Server-Sent Events
+      and are merged into app.tasks in place, close the returned EventSource to stop */
+    listen: function () {
+      let self = this,
+        /* EventSource cannot set the Authorization header, the token goes in the query */
+        source = new EventSource(this.url() + '/events?token=' + encodeURIComponent(app.session.get('token')));
+      source.addEventListener('task.saved', function (event) {
+        let data = JSON.parse(event.data),
+          task = app.tasks.add(_.omit(data, 'partial'), {merge: true});
+        if (data.partial) { /* too large for the event, the rest is fetched */
+          task.fetch();
+        }
+      });
+      source.addEventListener('task.deleted', function (event) {
+        app.tasks.remove(JSON.parse(event.data).id);
+      });
+      source.addEventListener('sprint.saved', function (event) {
+        self.set(JSON.parse(event.data));
+      });
+      source.addEventListener('sprint.deleted', function () {
+        source.close();
+        self.trigger('deleted', self);
+      });
+      return source;
+    }
+  });
   app.models.Task = BaseModel.extend({});
   app.models.User = BaseModel.extend({
     idAttributemodel: 'username' /* user referred by username instead of id */
@@ -103,13 +300,21 @@
 
   /* customized pagination */
   let BaseCollection = Backbone.Collection.extend({
-    /* overrides the default pagination of backbone with response */
+    sync: conditionalSync,
+    /* overrides the default pagination of backbone with response, columnar payloads are decoded first */
     parse: function (response) {
+      response = app.columnar.decode(response);
       this._next = response.next;
       this._previous = response.previous;
       this._count = response.count;
       return response.results || [];
     },
+    /* incremental sync: merge a delta from the changes end point, changed models are added or updated in place
+      and deleted ones removed, the other models are left alone */
+    mergeChanges: function (changed, deleted) {
+      this.set(changed || [], {remove: false});
+      this.remove(deleted || []);
+    },
     /* use deferred obj to resolve model instance */
     getOrFetch: function (id) {
       let result = new $.Deferred(),
@@ -145,7 +350,19 @@
     app.sprints = new app.collections.Sprints();
     app.collections.Tasks = BaseCollection.extend({ /* use customized base collection */
       model: app.models.Task,
-      url: data.tasks
+      url: data.tasks,
+      /* save the changed attributes of many tasks (e.g. order and status after a drag) in one request */
+      saveMany: function (changes) {
+        let self = this;
+        return $.ajax({
+          url: this.url + '/bulk',
+          type: 'POST',
+          contentType: 'application/json',
+          data: JSON.stringify(changes)
+        }).done(function (tasks) {
+          self.set(tasks, {remove: false});
+        });
+      }
     });
     app.tasks = new app.collections.Tasks();
     app.collections.Users = BaseCollection.extend({ /* use customized base collection */
@@ -153,6 +370,40 @@
       url: data.users
     });
     app.users = new app.collections.Users();
+    /* delta sync of all the collections: start() takes a cursor before the views read their data, sync() merges
+      what changed since. When the server no longer has the changes since the cursor, a fresh one is taken and
+      'reload' tells the views to read their data again */
+    app.changes = _.extend({
+      cursor: null,
+      start: function () {
+        let self = this;
+        return $.getJSON(data.changes).done(function (response) {
+          self.cursor = response.cursor;
+        });
+      },
+      sync: function () {
+        let self = this;
+        if (self.cursor === null) {
+          return self.start();
+        }
+        return $.getJSON(data.changes, {since: self.cursor}).done(function (response) {
+          app.sprints.mergeChanges(response.sprints, response.deleted.sprints);
+          app.tasks.mergeChanges(response.tasks, response.deleted.tasks);
+          app.users.mergeChanges(response.users, response.deleted.users);
+          self.cursor = response.cursor;
+          if (response.more) {
+            self.sync();
+          }
+        }).fail(function (xhr) {
+          if (xhr.status === 410) {  /* the cursor is taken before the data is read again, no change is missed */
+            self.cursor = null;
+            self.start().done(function () {
+              self.trigger('reload');
+            });
+          }
+        });
+      }
+    }, Backbone.Events);
   });
 
 })(jQuery, Backbone, _, app); /* self-invoking js closure that uses jQ+Backbone+_+app.js */
@@ -155,23 +155,48 @@
         link.show();
       });
     },
-    /* render the sprints */
+    /* render the sprints, read once then kept up to date with the changes since */
     initialize: function (options) {
       let self = this;
       TemplateView.prototype.initialize.apply(this, arguments);
+      this.loaded = false;
       app.collections.ready.done(function () {
-        /* only sprints with end date of 7 days ago or greater */
-        let end = new Date();
-        end.setDate(end.getDate() - 7);
-        end = end.toISOString().replace(/T.*/g, '');
-        app.sprints.fetch({
-          data: {end_min: end},
-          success: $.proxy(self.render, self)
-        });
+        self.listenTo(app.changes, 'reload', self.load); /* the changes were lost, read the sprints again */
+        if (app.changes.cursor === null) { /* first visit, the cursor is taken before the sprints are read */
+          app.changes.start().always($.proxy(self.load, self));
+        } else { /* back on the page, only what changed since the last visit is read */
+          app.changes.sync().always(function () {
+            self.loaded = true;
+            self.render();
+          });
+        }
+      });
+    },
+    /* only sprints with end date of 7 days ago or greater */
+    endMin: function () {
+      let end = new Date();
+      end.setDate(end.getDate() - 7);
+      return end.toISOString().replace(/T.*/g, '');
+    },
+    load: function () {
+      let self = this;
+      app.sprints.fetch({
+        data: {end_min: this.endMin()},
+        success: function () {
+          self.loaded = true;
+          self.render();
+        }
       });
     },
     getContext: function () {
-      return {sprints: app.sprints || null}; /* get context from app collection */
+      let end = this.endMin();
+      if (!this.loaded) {
+        return {sprints: null};
+      }
+      /* the collection also holds sprints the changes or a sprint page brought in */
+      return {sprints: app.sprints.filter(function (sprint) {
+        return sprint.get('end') >= end;
+      })};
     }
   });
 
@@ -192,9 +217,33 @@
     }
   });
 
+  /* the board columns, as Task.STATUS_CHOICES */
+  let STATUSES = [[1, 'Not Started'], [2, 'In Progress'], [3, 'Testing'], [4, 'Done']],
+    TODO = 1,
+    DONE = 4;
+
+  /* the attributes of a task moved to another status, its dates follow as the API validates them */
+  function statusAttributes(task, status) {
+    let today = new Date().toISOString().replace(/T.*/g, '');
+    if (status === task.get('status')) {
+      return {};
+    }
+    return {
+      status: status,
+      started: status === TODO ? null : task.get('started') || today,
+      completed: status === DONE ? today : null
+    };
+  }
+
   /* sprint detail view, extended from base template view */
   let SprintView = TemplateView.extend({
     templateName: '#sprint-template',
+    /* tasks are dragged between and within the status columns */
+    events: {
+      'dragstart .task': 'dragStart',
+      'dragover .status': 'dragOver',
+      'drop .status': 'drop'
+    },
     initialize: function (options) {
       let self = this;
       TemplateView.prototype.initialize.apply(this, arguments);
@@ -203,12 +252,16 @@
       this.sprint = null;
       app.collections.ready.done(function () {
         /* app.sprint.push will put a model into client-side collection with only the id */
-        /* replace original fetch with get or fetch */
-        app.sprints.getOrFetch(self.sprintId).done(function (sprint) {
+        let sprint = app.sprints.get(self.sprintId) || app.sprints.push({id: self.sprintId});
+        /* sprint, tasks and users are hydrated from the single board response */
+        sprint.fetchBoard().done(function (sprint) {
           self.sprint = sprint;
-          console.log(sprint)
           self.render();
-        }).fail(function (sprint) { /* on fetch fails, error out */
+          self.events = sprint.listen(); /* teammates' changes are pushed from now on */
+          self.listenTo(sprint, 'change', self.render);
+          /* once per batch of task changes, a bulk save or a pushed event changes several */
+          self.listenTo(app.tasks, 'update change', _.debounce($.proxy(self.render, self), 0));
+        }).fail(function () { /* on fetch fails, error out */
           self.sprint = sprint;
           self.sprint.invalid = true;
           self.render();
@@ -216,7 +269,66 @@
       });
     },
     getContext: function () {
-      return {sprint: this.sprint};
+      let self = this;
+      return {
+        sprint: this.sprint,
+        statuses: _.map(STATUSES, function (status) {
+          return {code: status[0], label: status[1], tasks: self.getTasks(status[0])};
+        }),
+        /* the tasks of a closed sprint are not moved any more */
+        editable: this.sprint !== null && this.sprint.get('end') >= new Date().toISOString().replace(/T.*/g, '')
+      };
+    },
+    /* the tasks of the sprint in a status, in board order */
+    getTasks: function (status) {
+      let sprintId = parseInt(this.sprintId, 10),
+        tasks = app.tasks ? app.tasks.filter(function (task) {
+          return task.get('sprint') === sprintId && task.get('status') === status;
+        }) : [];
+      /* by order then id, the second sort keeps the order of the first among equals */
+      return _.sortBy(_.sortBy(tasks, 'id'), function (task) {
+        return task.get('order');
+      });
+    },
+    dragStart: function (event) {
+      event.originalEvent.dataTransfer.setData('text/plain', $(event.currentTarget).data('id'));
+    },
+    dragOver: function (event) {
+      event.preventDefault(); /* lets the column take the drop */
+    },
+    /* the dropped task goes before the task it is dropped on, or last, and the column is numbered again;
+      the tasks whose order or status changed are saved in one request */
+    drop: function (event) {
+      let status = parseInt($(event.currentTarget).data('status'), 10),
+        task = app.tasks.get(event.originalEvent.dataTransfer.getData('text/plain')),
+        target = app.tasks.get($(event.target).closest('.task').data('id')),
+        tasks = _.without(this.getTasks(status), task),
+        index = target ? _.indexOf(tasks, target) : tasks.length,
+        changes = [];
+      event.preventDefault();
+      if (!task || target === task) {
+        return;
+      }
+      tasks.splice(index, 0, task);
+      _.each(tasks, function (each, order) {
+        let attributes = each === task ? statusAttributes(task, status) : {};
+        if (each.get('order') !== order) {
+          attributes.order = order;
+        }
+        if (!_.isEmpty(attributes)) {
+          changes.push(_.extend({id: each.id}, attributes));
+        }
+      });
+      if (changes.length) {
+        app.tasks.saveMany(changes);
+      }
+    },
+    /* the router removes the view when leaving the sprint, stop listening to its events */
+    remove: function () {
+      if (this.events) {
+        this.events.close();
+      }
+      return TemplateView.prototype.remove.apply(this, arguments);
     }
   });
 
@@ -0,0 +1,178 @@
+"""
+sprint statistics computed with aggregate queries: burndown, status counts, throughput, cycle time and velocity
+"""
+import datetime
+import json
+from collections import Counter
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Avg, Case, Count, DurationField, ExpressionWrapper, F, IntegerField, Min, Sum, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ArchivedTask, CollectionVersion, Sprint, SprintStats, Task
+
+STATS_COLLECTIONS = (CollectionVersion.SPRINTS, CollectionVersion.TASKS)  # the stats show data from these
+
+
+def cycle_time(prefix=''):
+    """days from started to completed, null when either date is missing"""
+    return Case(When(  # the dates are only subtracted when both are set, sqlite cannot subtract a null
+        then=ExpressionWrapper(F(prefix + 'completed') - F(prefix + 'started'), output_field=DurationField()),
+        **{prefix + 'started__isnull': False, prefix + 'completed__isnull': False}), output_field=DurationField())
+
+
+def done(prefix=''):
+    """1 for a done task, to be summed"""
+    return Case(When(**{prefix + 'status': Task.STATUS_DONE, 'then': 1}), default=0, output_field=IntegerField())
+
+
+def days(duration):
+    return round(duration.total_seconds() / 86400, 2) if duration is not None else None
+
+
+def combine_averages(averages):
+    """the average of the union of several sets, from their (average, count) pairs"""
+    averages = [(average, count) for average, count in averages if count]
+    if not averages:
+        return None
+    if len(averages) == 1:
+        return averages[0][0]  # as the database computed it
+    return sum((average * count for average, count in averages), datetime.timedelta()) / sum(
+        count for average, count in averages)
+
+
+def task_models(sprint, today):
+    """the tables holding the tasks of a sprint: the archive too, once it is closed"""
+    return (Task, ArchivedTask) if sprint.end < today else (Task, )
+
+
+def compute_sprint_stats(sprint, today=None):
+    """the stats of a sprint, four aggregate queries per task table whatever the number of tasks"""
+    today = today or datetime.date.today()
+    totals = {'total': 0, 'first_started': None, 'first_completed': None}
+    statuses, completed_on, users, cycle_times = Counter(), Counter(), {}, []
+    for model in task_models(sprint, today):
+        tasks = model.objects.filter(sprint=sprint).order_by()
+        part = tasks.aggregate(
+            total=Count('id'), first_started=Min('started'), first_completed=Min('completed'),
+            cycle_time=Avg(cycle_time(), output_field=DurationField()), cycle_count=Count(cycle_time()))
+        totals['total'] += part['total']
+        for name in ('first_started', 'first_completed'):
+            totals[name] = min([day for day in (totals[name], part[name]) if day], default=None)
+        cycle_times.append((part['cycle_time'], part['cycle_count']))
+        statuses.update(dict(tasks.values_list('status').annotate(count=Count('id'))))
+        completed_on.update(dict(tasks.exclude(completed=None).values_list('completed').annotate(count=Count('id'))))
+        per_user = tasks.exclude(assigned=None).values_list('assigned__username').annotate(
+            total=Count('id'), done=Sum(done()), cycle_time=Avg(cycle_time(), output_field=DurationField()),
+            cycle_count=Count(cycle_time()))
+        for username, total, done_count, user_cycle_time, count in per_user:
+            user = users.setdefault(username, {'total': 0, 'done': 0, 'cycle_times': []})
+            user['total'] += total
+            user['done'] += done_count
+            user['cycle_times'].append((user_cycle_time, count))
+
+    # burndown, from the first started (or completed) day to the end of the sprint or today
+    last = min(sprint.end, today)
+    first = min([day for day in (totals['first_started'], totals['first_completed'], last) if day])
+    remaining, burndown = totals['total'], []
+    remaining -= sum(count for day, count in completed_on.items() if day < first)
+    for offset in range((last - first).days + 1):
+        day = first + datetime.timedelta(days=offset)
+        remaining -= completed_on.get(day, 0)
+        burndown.append({'date': day, 'remaining': remaining})
+
+    return {
+        'sprint': sprint.pk,
+        'total': totals['total'],
+        'statuses': [{'status': code, 'status_display': label, 'count': statuses.get(code, 0)}
+                     for code, label in Task.STATUS_CHOICES],
+        'cycle_time': days(combine_averages(cycle_times)),  # average days from started to completed
+        'burndown': burndown,
+        'users': [{'username': username, 'total': users[username]['total'], 'done': users[username]['done'],
+                   'cycle_time': days(combine_averages(users[username]['cycle_times']))}
+                  for username in sorted(users)],
+    }
+
+
+def get_sprint_stats(sprint, today=None):
+    """the stats of a sprint, read from the materialized copy once the sprint is closed"""
+    today = today or datetime.date.today()
+    if sprint.end >= today:  # still running
+        return json.loads(json.dumps(compute_sprint_stats(sprint, today), cls=DjangoJSONEncoder))
+    stored = SprintStats.objects.filter(sprint=sprint).values_list('data', flat=True).first()
+    if stored is None:
+        versions = CollectionVersion.get_versions(STATS_COLLECTIONS)
+        stored = json.dumps(compute_sprint_stats(sprint, today), cls=DjangoJSONEncoder)
+        store_sprint_stats(sprint, stored, versions)
+    return json.loads(stored)
+
+
+def store_sprint_stats(sprint, data, versions):
+    """store the stats unless a write committed since the versions were read. A write bumps the versions before
+    forgetting the stats and holds their rows until it commits, so the locked rows tell of every write the stats
+    may have missed"""
+    with transaction.atomic():
+        current = dict(CollectionVersion.objects.select_for_update().filter(
+            name__in=STATS_COLLECTIONS).values_list('name', 'version'))
+        if all(current.get(name, 0) == version for name, version, updated_at in versions):
+            SprintStats.objects.get_or_create(sprint=sprint, defaults={'data': data})
+
+
+def get_velocity(sprints):
+    """tasks done per sprint and their cycle time, one grouped query over the given sprints and one over
+    their archived tasks"""
+    rows = sprints.order_by('end').annotate(
+        total=Count('task'), done=Sum(done('task__')),
+        cycle_time=Avg(cycle_time('task__'), output_field=DurationField()), cycle_count=Count(cycle_time('task__'))
+    ).values_list('id', 'name', 'end', 'total', 'done', 'cycle_time', 'cycle_count')
+    archived = dict((sprint_id, row) for sprint_id, *row in ArchivedTask.objects.filter(
+        sprint__in=sprints.values('pk')).order_by().values_list('sprint').annotate(
+        total=Count('id'), done=Sum(done()), cycle_time=Avg(cycle_time(), output_field=DurationField()),
+        cycle_count=Count(cycle_time())))
+    today = datetime.date.today()
+    result = []
+    for pk, name, end, total, done_count, sprint_cycle_time, cycle_count in rows:
+        archived_total, archived_done, archived_cycle_time, archived_count = archived.get(pk, (0, 0, None, 0))
+        result.append({
+            'sprint': pk, 'name': name, 'end': end, 'closed': end < today, 'total': total + archived_total,
+            'done': (done_count or 0) + archived_done, 'cycle_time': days(combine_averages(
+                [(sprint_cycle_time, cycle_count), (archived_cycle_time, archived_count)]))})
+    closed = [row['done'] for row in result if row['closed']]
+    return {
+        'sprints': result,
+        'average': round(float(sum(closed)) / len(closed), 2) if closed else None,  # over the closed sprints
+    }
+
+
+def forget_sprint_stats(*sprint_ids):
+    """drop materialized stats, for the rare edit of a task in a closed sprint"""
+    sprint_ids = [sprint_id for sprint_id in sprint_ids if sprint_id is not None]
+    if sprint_ids:
+        SprintStats.objects.filter(sprint_id__in=sprint_ids).delete()
+
+
+def closed_sprint_ids(task):
+    """the closed sprints among the task's sprint and the one it was loaded in, the only ones with stats stored.
+    The sprint loaded with the task answers for itself, the others are read in one query"""
+    sprint_ids = set(sprint_id for sprint_id in (task.sprint_id, task.previous_sprint_id) if sprint_id is not None)
+    ends = {}
+    sprint = getattr(task, Task.sprint.cache_name, None) if Task.sprint.is_cached(task) else None
+    if sprint is not None and sprint.pk == task.sprint_id:
+        ends[sprint.pk] = sprint.end
+    if sprint_ids - set(ends):
+        ends.update(Sprint.objects.filter(pk__in=sprint_ids - set(ends)).values_list('pk', 'end'))
+    today = datetime.date.today()
+    return [sprint_id for sprint_id, end in ends.items() if end < today]
+
+
+@receiver([post_save, post_delete], sender=Task)
+def forget_task_sprint_stats(sender, instance, **kwargs):
+    """the tasks of running sprints are the ones edited, nothing is stored for them"""
+    forget_sprint_stats(*closed_sprint_ids(instance))
+
+
+@receiver(post_save, sender=Sprint)
+def forget_sprint_stats_on_save(sender, instance, **kwargs):
+    forget_sprint_stats(instance.pk)
@@ -1,3 +1,637 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import re
+from collections import OrderedDict
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import update_last_login
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import throttling as rest_throttling
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from scrum.processes import process_local_backends
+
+from . import (
+    archive, authentication, benchmark, cache as response_cache, events, renderers, replicas, stats, throttling)
+from .views import TaskViewSet
+from .models import ArchivedTask, Change, CollectionVersion, Sprint, SprintStats, Task
+
+User = get_user_model()
+
+
+class APITestCase(TestCase):
+    """A seeded board and a client signed in as its staff user, with an empty response cache."""
+
+    def setUp(self):
+        benchmark.seed(users=6, sprints=4, tasks=150)
+        self.user = User.objects.get(username='user0')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        cache.clear()
+
+    def get(self, url, queries):
+        """the response to url, asserting the queries it took"""
+        cache.clear()  # the cached lists would take fewer
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+
+class QueryCountTests(APITestCase):
+    """The queries of a read do not grow with the rows it shows, the related rows are joined."""
+
+    def test_task_list(self):
+        for page_size in (5, 100):
+            response = self.get('/api/tasks?page_size={}'.format(page_size), 2)  # versions, page
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def test_sprint_list(self):
+        for page_size in (2, 4):
+            response = self.get('/api/sprints?page_size={}'.format(page_size), 2)  # versions, page
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def test_user_list(self):
+        for page_size in (2, 6):
+            response = self.get('/api/users?page_size={}'.format(page_size), 3)  # versions, count, page
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def test_details(self):
+        self.get('/api/tasks/{}'.format(Task.objects.filter(assigned__isnull=False).first().pk), 2)  # versions, row
+        self.get('/api/sprints/{}'.format(Sprint.objects.first().pk), 2)
+        self.get('/api/users/user1', 2)
+
+
+class CollectionVersionTests(APITestCase):
+
+    def test_login_leaves_users_alone(self):
+        before = CollectionVersion.get_versions([CollectionVersion.USERS])
+        changes = Change.objects.count()
+        self.assertTrue(APIClient().login(username='user1', password='benchmark'))
+        self.assertEqual(CollectionVersion.get_versions([CollectionVersion.USERS]), before)
+        self.assertEqual(Change.objects.count(), changes)
+
+    def test_delete_moves_last_modified_forward(self):
+        old, edited = Task.objects.order_by('pk')[:2]
+        Task.objects.filter(pk=old.pk).update(updated_at=timezone.now() - datetime.timedelta(days=30))
+        edited.save()
+        saved = CollectionVersion.get_versions([CollectionVersion.TASKS])[0][2]
+        Task.objects.get(pk=old.pk).delete()
+        self.assertGreaterEqual(CollectionVersion.get_versions([CollectionVersion.TASKS])[0][2], saved)
+
+
+class SearchVectorTests(APITestCase):
+
+    def test_reads_leave_search_vector_out(self):
+        task = Task.objects.filter(sprint__isnull=False).first()
+        with CaptureQueriesContext(connection) as queries:
+            for url in ('/api/tasks/{}'.format(task.pk), '/api/sprints/{}'.format(task.sprint_id),
+                        '/api/sprints/{}/board'.format(task.sprint_id), '/api/changes?since=0'):
+                self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(b''.join(self.client.get('/api/tasks/export').streaming_content).count(b'\n'),
+                             Task.objects.count())
+            Task.objects.get(pk=task.pk).sprint
+        self.assertEqual([query['sql'] for query in queries.captured_queries if 'search_vector' in query['sql']], [])
+
+
+class ChangeTests(APITestCase):
+    """The changes cursor never passes a change that may still commit."""
+
+    def setUp(self):
+        super(ChangeTests, self).setUp()
+        self.tasks = list(Task.objects.order_by('pk')[:3])
+        for task in self.tasks:
+            task.save()
+        self.ids = list(Change.objects.order_by('id').values_list('id', flat=True))
+
+    def changes(self, since=None):
+        response = self.client.get('/api/changes', {} if since is None else {'since': since})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_held_below_uncommitted_change(self):
+        Change.objects.filter(id=self.ids[1]).delete()  # as another transaction sees a change not committed yet
+        with mock.patch('board.views.ChangeViewSet.get_open_since', return_value=timezone.now()):
+            self.assertEqual(self.changes()['cursor'], self.ids[0])
+            data = self.changes(self.ids[0])
+        self.assertEqual((data['cursor'], data['tasks'], data['more']), (self.ids[0], [], False))
+
+    def test_held_only_for_transactions_begun_before_the_change(self):
+        Change.objects.filter(id=self.ids[1]).delete()
+        begun = Change.objects.get(id=self.ids[2]).created_at + datetime.timedelta(minutes=1)
+        with mock.patch('board.views.ChangeViewSet.get_open_since', return_value=begun):
+            self.assertEqual(self.changes(self.ids[0])['cursor'], self.ids[-1])
+
+    def test_rolled_back_gap_is_skipped(self):
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            self.tasks[1].save()  # writes its change, then rolls back with it
+            raise DatabaseError
+        self.tasks[0].save()
+        latest = Change.objects.order_by('id').values_list('id', flat=True).last()
+        self.assertEqual(self.changes()['cursor'], latest)
+        data = self.changes(self.ids[-1])
+        self.assertEqual(data['cursor'], latest)
+        self.assertEqual([task['id'] for task in data['tasks']], [self.tasks[0].pk])
+
+    def test_deleted_gap_is_skipped(self):
+        Change.objects.filter(id=self.ids[1]).delete()  # no transaction is open, so it never commits
+        self.assertEqual(self.changes()['cursor'], self.ids[-1])
+        data = self.changes(self.ids[0])
+        self.assertEqual(data['cursor'], self.ids[-1])
+        self.assertEqual([task['id'] for task in data['tasks']], [self.tasks[2].pk])
+
+
+class BulkTests(APITestCase):
+
+    def post(self, items):
+        return self.client.post('/api/tasks/bulk', items, format='json')
+
+    def test_updates_take_the_same_queries_for_any_batch(self):
+        sprint = Sprint.objects.filter(end__gte=datetime.date.today()).first()
+        counts = []
+        for size in (2, 20):
+            tasks = Task.objects.filter(sprint=sprint)[:size]
+            items = [{'id': task.pk, 'order': index, 'status': Task.STATUS_IN_PROGRESS, 'started': str(sprint.end),
+                      'completed': None} for index, task in enumerate(tasks)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.post(items)
+            self.assertEqual(response.status_code, 200, response.content)
+            counts.append(len(queries.captured_queries))
+            self.assertEqual(set(Task.objects.filter(pk__in=[item['id'] for item in items]).values_list(
+                'status', flat=True)), {Task.STATUS_IN_PROGRESS})
+        self.assertEqual(counts[0], counts[1])
+
+    def test_invalid_item_writes_nothing(self):
+        task = Task.objects.filter(sprint__isnull=True).first()
+        before = list(Task.objects.order_by('pk').values_list('order', 'status'))
+        response = self.post([{'id': task.pk, 'order': 7}, {'id': task.pk, 'status': Task.STATUS_DONE}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('non_field_errors', response.data[1])  # backlog tasks stay not started
+        self.assertEqual(list(Task.objects.order_by('pk').values_list('order', 'status')), before)
+
+
+class PublishTests(TestCase):
+    """A saved task is serialized for the board events only while its sprint is listened to."""
+
+    def setUp(self):
+        benchmark.seed(users=2, sprints=2, tasks=10)
+        self.task = Task.objects.exclude(sprint=None).first()
+
+    def test_no_listener_no_payload(self):
+        with mock.patch('board.events.TaskSerializer') as serializer:
+            self.task.save()
+        serializer.assert_not_called()
+
+    def test_listened_sprint_gets_the_payload(self):
+        unsubscribe = events.broker.subscribe(events.sprint_channel(self.task.sprint_id), lambda message: None)
+        self.addCleanup(unsubscribe)
+        with mock.patch('board.events.TaskSerializer') as serializer:
+            self.task.save()
+        serializer.assert_called_once_with([self.task], many=True, omit=['links'])
+
+
+class ProcessLocalBackendTests(TestCase):
+
+    def test_defaults_are_kept_per_process(self):
+        self.assertEqual([setting for setting, problem in process_local_backends()], [
+            'CACHE_BACKEND', 'BOARD_EVENTS_BACKEND', 'BOARD_AUTH_SHARED_CACHE', 'BOARD_THROTTLE_CACHE'])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                           'LOCATION': '/tmp/board-tests'}},
+                       BOARD_EVENTS_BACKEND='board.events.PostgresBackend', BOARD_AUTH_SHARED_CACHE='default',
+                       BOARD_THROTTLE_CACHE='default')
+    def test_shared_backends(self):
+        self.assertEqual(process_local_backends(), [])
+
+
+class CredentialCacheTests(APITestCase):
+
+    def setUp(self):
+        super(CredentialCacheTests, self).setUp()
+        authentication.invalidate()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.url = '/api/tasks/{}'.format(Task.objects.first().pk)
+
+    def test_token_is_checked_once(self):
+        self.get(self.url, 3)  # token and user, versions, row
+        self.get(self.url, 2)
+
+    def test_deleted_token_is_refused_at_once(self):
+        self.get(self.url, 3)
+        self.token.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_not_remembered_by_one_of_several_workers(self):
+        with mock.patch.object(authentication, 'ENABLED', False):
+            self.get(self.url, 3)
+            self.get(self.url, 3)
+
+
+class ReplicaSettingsTests(TestCase):
+
+    @override_settings(WEB_CONCURRENCY=2)
+    def test_sticky_marks_must_be_shared_by_workers(self):
+        with mock.patch.object(replicas, 'REPLICAS', ['replica1']):
+            with self.assertRaises(ImproperlyConfigured):
+                replicas.check_settings()
+            with override_settings(CACHES=dict(settings.CACHES, shared={
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/board-tests'})):
+                with mock.patch.object(replicas, 'STICKY_CACHE', 'shared'):
+                    replicas.check_settings()
+
+
+class ThrottleTests(APITestCase):
+
+    def setUp(self):
+        super(ThrottleTests, self).setUp()
+        throttling.buckets.local.clear()
+        self.addCleanup(setattr, throttling.buckets, 'down_until', 0)
+        self.addCleanup(throttling.buckets.local.clear)
+
+    @override_settings(CACHES=dict(settings.CACHES, down={'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}))
+    def test_cache_answering_misses_is_failing(self):
+        with mock.patch.object(throttling.buckets, 'alias', 'down'), \
+                mock.patch.dict(throttling.BUCKETS, {'task.list': throttling.parse_rate('2/min')}):
+            codes = [self.client.get('/api/tasks').status_code for _ in range(3)]  # as memcached with its server down
+        self.assertEqual(codes, [200, 200, 429])
+        self.assertGreater(throttling.buckets.down_until, 0)
+
+    def test_anonymous_clients_behind_the_router(self):
+        factory = RequestFactory(REMOTE_ADDR='10.0.0.1')
+        with mock.patch.object(rest_throttling.api_settings, 'NUM_PROXIES', 1):
+            keys = [throttling.client_key(factory.get('/api/tasks', HTTP_X_FORWARDED_FOR=address))
+                    for address in ('203.0.113.1', '203.0.113.2')]
+        self.assertEqual(keys, ['203.0.113.1', '203.0.113.2'])
+
+
+class ArchiveTests(APITestCase):
+    """Archived tasks are moved, not deleted: the API reads them from the archive."""
+
+    def setUp(self):
+        super(ArchiveTests, self).setUp()
+        self.sprint = Sprint.objects.filter(end__lt=datetime.date.today()).order_by('end').first()
+        self.task = Task.objects.filter(sprint=self.sprint, status=Task.STATUS_DONE).first()
+
+    def test_changed_then_archived_is_not_deleted(self):
+        since = self.client.get('/api/changes').data['cursor']
+        self.task.save()
+        archive.archive_batch(datetime.date.today())
+        data = self.client.get('/api/changes', {'since': since}).data
+        self.assertEqual([task['id'] for task in data['tasks']], [self.task.pk])
+        self.assertEqual(data['deleted']['tasks'], [])
+
+    def test_edit_of_a_task_archived_meanwhile(self):
+        archive.archive_batch(datetime.date.today())
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            self.task.save()  # read before the move
+        with mock.patch.object(TaskViewSet, 'get_object', return_value=self.task):
+            response = self.client.patch('/api/tasks/{}'.format(self.task.pk), {'name': 'Edited'})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Task.objects.filter(pk=self.task.pk).exists())
+        self.assertNotEqual(ArchivedTask.objects.get(pk=self.task.pk).name, 'Edited')
+
+    def test_export_of_a_sprint_reads_the_archive(self):
+        expected = sorted(list(Task.objects.filter(sprint=self.sprint).values_list('order', 'id')))
+        archive.archive_batch(datetime.date.today())
+        self.assertTrue(ArchivedTask.objects.filter(sprint=self.sprint).exists())
+        response = self.client.get('/api/tasks/export', {'sprint': self.sprint.pk, 'format': 'csv'})
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()[1:]
+        self.assertEqual([int(line.split(',')[0]) for line in lines], [pk for order, pk in expected])
+
+
+class ExportTests(APITestCase):
+    """The exports stream the filtered list, their errors are rendered in the asked format."""
+
+    def export(self, params):
+        response = self.client.get('/api/tasks/export', params)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, content.decode('utf-8')
+
+    def test_ndjson_applies_the_filters(self):
+        params = {'status': Task.STATUS_TODO, 'assigned': 'user1'}
+        response, content = self.export(params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in content.splitlines()]
+        expected = Task.objects.filter(status=Task.STATUS_TODO, assigned__username='user1').order_by('order', 'id')
+        self.assertTrue(rows)
+        self.assertEqual([row['id'] for row in rows], list(expected.values_list('id', flat=True)))
+        self.assertEqual(set((row['assigned'], row['status_display']) for row in rows), {('user1', 'Not Started')})
+
+    def test_csv_applies_the_filters_and_ordering(self):
+        response, content = self.export({'backlog': 'True', 'ordering': '-name', 'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="tasks.csv"')
+        header, *rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(header[:3], ['id', 'name', 'description'])
+        self.assertEqual(sorted(int(row[0]) for row in rows),
+                         sorted(Task.objects.filter(sprint=None).values_list('id', flat=True)))
+        self.assertEqual([row[1] for row in rows], sorted((row[1] for row in rows), reverse=True))
+        self.assertEqual(set(row[3] for row in rows), {''})  # no sprint, an empty field
+
+    def test_errors_in_the_asked_format(self):
+        response, content = self.export({'ordering': 'due'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(json.loads(content)), ['ordering'])
+        response, content = self.export({'ordering': 'due', 'format': 'csv'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(csv.reader(io.StringIO(content))), [
+            ['ordering'], ['Cannot order by due, use one of: name, order.']])
+        self.client.force_authenticate(None)
+        response, content = self.export({'format': 'csv'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(content.splitlines(), ['detail', 'Authentication credentials were not provided.'])
+
+
+class SprintStatsTests(APITestCase):
+    """The stats stored for a closed sprint are dropped by the edits of its tasks only."""
+
+    def setUp(self):
+        super(SprintStatsTests, self).setUp()
+        today = datetime.date.today()
+        self.closed = Sprint.objects.filter(end__lt=today).first()
+        self.running = Task.objects.select_related('sprint').filter(sprint__end__gte=today).first()
+        stats.get_sprint_stats(self.closed)
+
+    def stats_queries(self, task):
+        with CaptureQueriesContext(connection) as queries:
+            task.save()
+        return [query['sql'] for query in queries.captured_queries if SprintStats._meta.db_table in query['sql']]
+
+    def test_running_sprint_edit_leaves_the_stats_alone(self):
+        self.assertEqual(self.stats_queries(self.running), [])
+        self.assertTrue(SprintStats.objects.filter(sprint=self.closed).exists())
+
+    def test_moves_to_and_edits_in_a_closed_sprint_forget(self):
+        self.running.sprint = self.closed
+        self.assertNotEqual(self.stats_queries(self.running), [])
+        self.assertFalse(SprintStats.objects.filter(sprint=self.closed).exists())
+
+    def test_write_during_the_compute_is_not_stored_over(self):
+        SprintStats.objects.all().delete()
+        task = Task.objects.filter(sprint=self.closed).first()
+        compute = stats.compute_sprint_stats
+
+        def compute_then_write(sprint, today=None):
+            data = compute(sprint, today)
+            task.status = Task.STATUS_TODO  # committed after the stats were read
+            task.save()
+            return data
+
+        with mock.patch('board.stats.compute_sprint_stats', side_effect=compute_then_write):
+            stats.get_sprint_stats(self.closed)
+        self.assertFalse(SprintStats.objects.filter(sprint=self.closed).exists())
+        stats.get_sprint_stats(self.closed)
+        self.assertTrue(SprintStats.objects.filter(sprint=self.closed).exists())
+
+
+class UserWriteTests(APITestCase):
+    """A user's profile is written only when its fields change, the last_login of a login writes nothing else."""
+
+    def patch(self, data, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.patch('/api/users/user1', data, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_login(self):
+        user = User.objects.select_related('profile').get(username='user1')
+        with self.assertNumQueries(1):  # the last_login column
+            update_last_login(None, user)
+        Token.objects.create(user=user)
+        with self.assertNumQueries(2):  # user, token
+            response = APIClient().post('/api/token/', {'username': 'user1', 'password': 'benchmark'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_patch(self):
+        self.patch({'city': 'Oslo'}, 9)  # user and profile, savepoint, user, profile, their versions and changes
+        self.patch({'city': 'Oslo'}, 6)  # user and profile, savepoint, user, its version and change
+        self.patch({'is_active': True}, 6)
+
+
+class SparseFieldsTests(APITestCase):
+    """?fields= and ?omit= shape the objects and the columns read for them."""
+
+    def get_sparse(self, url):
+        """the response and the SQL of its task queries"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, [query['sql'] for query in queries.captured_queries if 'FROM "board_task"' in query['sql']]
+
+    def test_fields_keeps_the_keys_and_columns(self):
+        response, queries = self.get_sparse('/api/tasks?fields=id,name')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([list(task) for task in response.data['results']], [['id', 'name']] * 25)
+        self.assertNotIn('"description"', queries[-1])
+        self.assertNotIn('"status"', queries[-1])
+
+    def test_omit_leaves_out_the_key_and_column(self):
+        task = Task.objects.first()
+        for url in ('/api/tasks?omit=description', '/api/tasks/{}?omit=description'.format(task.pk)):
+            response, queries = self.get_sparse(url)
+            self.assertEqual(response.status_code, 200)
+            for data in response.data.get('results', [response.data]):
+                self.assertNotIn('description', data)
+                self.assertIn('links', data)
+            self.assertNotIn('"description"', queries[-1])
+
+    def test_unknown_fields_are_refused(self):
+        task = Task.objects.first()
+        for url, param in (('/api/tasks?fields=id,nmae', 'fields'), ('/api/tasks?omit=descripton', 'omit'),
+                           ('/api/tasks/{}?fields=nmae'.format(task.pk), 'fields')):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(param, response.data)
+
+
+class ValuesListTests(APITestCase):
+    """The list pages read as values() rows show what the full serializer shows for the same objects."""
+
+    def assertSameAsSerializer(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        view = response.renderer_context['view']  # its request, action and sparse fields
+        page = view.paginate_queryset(view.filter_queryset(view.get_queryset()))
+        expected = view.get_serializer(page, many=True).data
+        self.assertTrue(expected)
+        self.assertEqual(json.loads(json.dumps(response.data['results'])), json.loads(json.dumps(expected)))
+
+    def test_tasks(self):
+        for url in ('/api/tasks', '/api/tasks?status={}'.format(Task.STATUS_DONE), '/api/tasks?fields=id,name,links',
+                    '/api/tasks?omit=description,status_display', '/api/tasks?search=board',
+                    '/api/tasks?search=board&fields=id,assigned'):
+            self.assertSameAsSerializer(url)
+
+    def test_sprints_and_users(self):
+        for url in ('/api/sprints', '/api/sprints?omit=description', '/api/users',
+                    '/api/users?fields=username,full_name,links'):
+            self.assertSameAsSerializer(url)
+
+    def test_search_rank_orders_the_rows_only(self):
+        response = self.client.get('/api/tasks?search=board')
+        view = response.renderer_context['view']
+        annotations = view.filter_queryset(view.get_queryset()).query.annotations
+        self.assertEqual('search_rank' in annotations, connection.vendor == 'postgresql')  # full text search
+        self.assertEqual(set(response.data['results'][0]), set(TaskViewSet.serializer_class.Meta.fields))
+        self.assertTrue(response.data['next'])
+        self.assertSameAsSerializer(response.data['next'])  # a page after a rank
+
+
+class ColumnarTests(APITestCase):
+    """The columnar formats carry the same lists as the JSON one, details and errors unchanged."""
+    columnar_json = 'application/vnd.scrum.columnar+json'
+    columnar_msgpack = 'application/vnd.scrum.columnar+msgpack'
+
+    def get_as(self, url, media_type):
+        response = self.client.get(url, HTTP_ACCEPT=media_type)
+        self.assertEqual(response['Content-Type'].split(';')[0], media_type)
+        return response
+
+    def to_rows(self, payload):
+        """the objects of a columnar payload, as the client rebuilds them"""
+        rows = [OrderedDict(zip(payload['fields'], values)) for values in zip(*payload['values'])]
+        for row in rows:
+            for name, choices in payload.get('choices', {}).items():
+                row[name + '_display'] = dict(choices)[row[name]]
+            row['links'] = dict((name, template.format(**row) if all(
+                row.get(field) is not None for field in re.findall(r'{(\w+)}', template)) else None)
+                for name, template in payload['links'].items())
+        return rows
+
+    def test_paged_list_round_trip(self):
+        url = '/api/tasks?status={}'.format(Task.STATUS_TODO)
+        expected = self.client.get(url).data
+        payload = json.loads(self.get_as(url, self.columnar_json).content.decode('utf-8'))
+        self.assertEqual((payload['next'], payload['previous']), (expected['next'], expected['previous']))
+        self.assertEqual(payload['choices']['status'], [[code, str(label)] for code, label in Task.STATUS_CHOICES])
+        self.assertEqual(set(payload['links']), {'self', 'sprint', 'assigned'})
+        self.assertNotIn('status_display', payload['fields'])
+        self.assertTrue(expected['results'])
+        self.assertEqual(self.to_rows(payload), json.loads(json.dumps(expected['results'])))
+
+    @skipIf(renderers.msgpack is None, 'msgpack is not installed')
+    def test_msgpack_matches_json(self):
+        url = '/api/sprints?fields=id,name,end,links'
+        payload = json.loads(self.get_as(url, self.columnar_json).content.decode('utf-8'))
+        unpacked = renderers.msgpack.unpackb(self.get_as(url, self.columnar_msgpack).content, encoding='utf-8')
+        self.assertEqual(unpacked, payload)
+        self.assertEqual(payload['fields'], ['id', 'name', 'end'])
+
+    def test_errors_are_left_as_they_are(self):
+        media_types = [self.columnar_json] + ([self.columnar_msgpack] if renderers.msgpack is not None else [])
+        for media_type in media_types:
+            response = self.get_as('/api/tasks/0', media_type)
+            self.assertEqual(response.status_code, 404)
+            content = response.content
+            data = renderers.msgpack.unpackb(content, encoding='utf-8') if media_type == self.columnar_msgpack \
+                else json.loads(content.decode('utf-8'))
+            self.assertEqual(list(data), ['detail'])
+
+
+class KeysetPaginationTests(APITestCase):
+    """Pages follow one another by cursor, forward and back, without counting the rows."""
+
+    def walk(self, url, link):
+        """the ids of each page from url on, following the link, and the url of the last one"""
+        pages = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual([query['sql'] for query in queries.captured_queries if 'COUNT(' in query['sql']], [])
+            pages.append([row['id'] for row in response.data['results']])
+            url, last = response.data[link], url
+        return pages, last
+
+    def test_tasks_forward_and_back(self):
+        expected = list(Task.objects.order_by('order', 'id').values_list('id', flat=True))
+        pages, last = self.walk('/api/tasks?page_size=40', 'next')
+        self.assertEqual([len(page) for page in pages], [40, 40, 40, 30])
+        self.assertEqual(sum(pages, []), expected)
+        pages, first = self.walk(last, 'previous')
+        self.assertEqual(sum(reversed(pages), []), expected)
+
+    def test_ordering(self):
+        pages, last = self.walk('/api/tasks?page_size=40&ordering=-name', 'next')
+        self.assertEqual(sum(pages, []), list(Task.objects.order_by('-name', '-id').values_list('id', flat=True)))
+        for field in ('due', '-started', 'completed', 'description'):  # null or not offered, not a keyset
+            response = self.client.get('/api/tasks', {'ordering': field})
+            self.assertEqual(response.status_code, 400, field)
+            self.assertIn('ordering', response.data)
+
+    def test_sprints(self):
+        pages, last = self.walk('/api/sprints?page_size=3', 'next')
+        self.assertEqual(sum(pages, []), list(Sprint.objects.order_by('end', 'id').values_list('id', flat=True)))
+
+
+class ResponseCacheTests(TransactionTestCase):
+    """Cached lists are dropped once a write commits, never before, and only a shared cache keeps them."""
+
+    def setUp(self):
+        benchmark.seed(users=3, sprints=2, tasks=20)
+        self.client = APIClient()
+        self.user = User.objects.get(username='user0')
+        self.client.force_authenticate(self.user)
+        self.task = Task.objects.exclude(sprint=None).first()
+        self.url = '/api/tasks?sprint={}'.format(self.task.sprint_id)
+        cache.clear()
+
+    def names(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return dict((task['id'], task['name']) for task in response.data['results'])
+
+    def hits(self):
+        return response_cache.get_stats()['hits']
+
+    def test_write_then_list_shows_the_write(self):
+        with mock.patch.object(response_cache, 'ENABLED', True):
+            self.names()
+            hits = self.hits()
+            self.assertEqual(self.names()[self.task.pk], self.task.name)
+            self.assertEqual(self.hits(), hits + 1)
+            response = self.client.patch('/api/tasks/{}'.format(self.task.pk), {'name': 'Renamed'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.names()[self.task.pk], 'Renamed')
+
+    def test_generations_rotate_on_commit(self):
+        scopes = [CollectionVersion.TASKS, response_cache.sprint_scope(self.task.sprint_id)]
+        with mock.patch.object(response_cache, 'ENABLED', True):
+            before = response_cache.get_generations(scopes)
+            with transaction.atomic():
+                self.task.save()
+                self.assertEqual(response_cache.get_generations(scopes), before)  # a read now sees the old rows
+            after = response_cache.get_generations(scopes)
+        self.assertNotEqual(after[0], before[0])
+        self.assertNotEqual(after[1], before[1])
+
+    def test_replica_reads_are_not_stored(self):
+        with mock.patch.object(response_cache, 'ENABLED', True), \
+                mock.patch.object(replicas, 'REPLICAS', [connection.alias]):  # the primary standing in for one
+            self.names()
+            self.names()
+            self.assertEqual(response_cache.get_stats()['hits'], 0)
+            response = self.client.patch('/api/tasks/{}'.format(self.task.pk), {'name': 'Renamed'})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(replicas.is_sticky(self.user))  # the writer reads the primary
+            self.assertEqual(self.names()[self.task.pk], 'Renamed')
+            self.assertEqual(self.names()[self.task.pk], 'Renamed')
+            self.assertEqual(response_cache.get_stats()['hits'], 1)
+
+    def test_process_local_cache_is_not_used(self):
+        self.assertFalse(response_cache.ENABLED)  # locmem, as in the settings by default
+        self.names()
+        self.names()
+        self.assertEqual(response_cache.get_stats(), {'hits': 0, 'misses': 0})
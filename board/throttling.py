@@ -0,0 +1,246 @@
+"""
+admission control: token bucket throttling of the API per user and view action, and a middleware capping
+the requests served at once, so a runaway client is turned away before it holds the workers and the database.
+
+A request takes tokens from the bucket of its user and action (task.list, sprint.board, ...), refilled at the rate
+of the action up to one period's worth. Requests reading more take more: a search ranks every match, a page larger
+than the default reads as many more rows. The buckets are kept in the process, or in the CACHE_ALIAS cache when
+it is set, shared by the workers, and in the process again while that cache fails. Anonymous clients are told apart
+by their address as forwarded by the NUM_PROXIES proxies in front of the app.
+"""
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+RATES = getattr(settings, 'BOARD_THROTTLE_RATES', {'default': '600/min'})  # per action, None leaves one unthrottled
+SEARCH_COST = getattr(settings, 'BOARD_THROTTLE_SEARCH_COST', 4)  # tokens a search takes on top of the request's
+CACHE_ALIAS = getattr(settings, 'BOARD_THROTTLE_CACHE', None)  # shared by the workers, None keeps the buckets local
+LOCAL_SIZE = getattr(settings, 'BOARD_THROTTLE_LOCAL_SIZE', 10000)  # buckets kept per process
+RETRY_AFTER = 30  # seconds the shared cache is left out after an error
+MAX_CONCURRENT = getattr(settings, 'BOARD_MAX_CONCURRENT_REQUESTS', 0)  # per process, 0 for no limit
+MAX_CONCURRENT_PER_CLIENT = getattr(settings, 'BOARD_MAX_CONCURRENT_PER_CLIENT', 0)  # per process, 0 for no limit
+EXEMPT_PATHS = re.compile('|'.join(getattr(settings, 'BOARD_ADMISSION_EXEMPT_PATHS', ())) or '$^')
+PREFIX = 'board:throttle'
+ALIVE_KEY = PREFIX + ':alive'  # never expires, missing only when the cache lost it or fails
+
+
+def parse_rate(rate):
+    """(bucket capacity, tokens per second) of a rate as DRF writes it, e.g. '600/min', None for no limit"""
+    if rate is None:
+        return None
+    count, period = rate.split('/')
+    return int(count), int(count) / float({'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]])
+
+
+BUCKETS = dict((scope, parse_rate(rate)) for scope, rate in RATES.items())
+
+
+def is_enabled():
+    """read per request, the benchmark turns the per client limits off as it does DEBUG"""
+    return getattr(settings, 'BOARD_THROTTLE_ENABLED', True)
+
+
+def take(state, cost, capacity, rate, now):
+    """(new state, seconds to wait or None) of taking cost tokens from a bucket state (tokens, time), None when full.
+    A request costing more than the bucket holds waits for it to be full"""
+    tokens, updated = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    cost = min(cost, capacity)
+    if tokens >= cost:
+        return (tokens - cost, now), None
+    return (tokens, now), (cost - tokens) / rate
+
+
+class LocalBuckets(object):
+    """The buckets of this process, bounded, the least recently used is dropped (it comes back full)."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.states = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, cost, capacity, rate):
+        with self.lock:
+            self.states[key], wait = take(self.states.get(key), cost, capacity, rate, time.time())
+            self.states.move_to_end(key)
+            while len(self.states) > self.max_entries:
+                self.states.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.states.clear()
+
+
+class SharedBuckets(object):
+    """The buckets in a cache shared by the workers, the local ones while it is unset or failing.
+
+    memcached answers a miss for a server it cannot reach, which would read as a full bucket on every request:
+    ALIVE_KEY is read along with the bucket, when it is missing and cannot be written back the cache is failing.
+    A bucket is read and written back without a lock: requests of one user running at once in two workers may
+    take the same tokens, a race lets a few more requests through, never fewer."""
+
+    def __init__(self, alias, local):
+        self.alias = alias
+        self.local = local
+        self.down_until = 0
+
+    def take(self, key, cost, capacity, rate):
+        if self.alias is None or self.down_until > time.time():
+            return self.local.take(key, cost, capacity, rate)
+        try:
+            cache = caches[self.alias]
+            values = cache.get_many([ALIVE_KEY, key])
+            if ALIVE_KEY not in values:  # evicted or first used, or the cache fails
+                cache.set(ALIVE_KEY, True, None)
+                if cache.get(ALIVE_KEY) is None:
+                    raise RuntimeError('the throttle cache dropped a key it was given')
+            state, wait = take(values.get(key), cost, capacity, rate, time.time())
+            cache.set(key, state, int(math.ceil(capacity / rate)) + 1)  # left alone, it is full again by then
+            return wait
+        except Exception:
+            logger.warning('Throttle cache %s failed, buckets kept in the process for %ss', self.alias, RETRY_AFTER,
+                           exc_info=True)
+            self.down_until = time.time() + RETRY_AFTER
+            return self.local.take(key, cost, capacity, rate)
+
+
+buckets = SharedBuckets(CACHE_ALIAS, LocalBuckets(LOCAL_SIZE))
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """A token bucket per user (or address) and view action, sized by BUCKETS for the action or by default."""
+
+    def allow_request(self, request, view):
+        if not is_enabled():
+            return True
+        scope = self.get_scope(request, view)
+        bucket = BUCKETS[scope] if scope in BUCKETS else BUCKETS.get('default')
+        if bucket is None:
+            return True
+        user = request.user
+        ident = 'user{}'.format(user.pk) if user and user.is_authenticated else self.get_ident(request)
+        key = '{}:{}:{}'.format(PREFIX, scope, ident)
+        self.wait_time = buckets.take(key, self.get_cost(request, view), *bucket)
+        return self.wait_time is None
+
+    def get_scope(self, request, view):
+        """e.g. task.list, sprint.board, the view's throttle_scope and action"""
+        action = getattr(view, 'action', None) or request.method.lower()
+        return '{}.{}'.format(getattr(view, 'throttle_scope', None) or type(view).__name__, action)
+
+    def get_cost(self, request, view):
+        """1 token, plus SEARCH_COST for a search, plus one per default page size above the default of a list"""
+        cost = 1.0
+        if request.query_params.get(api_settings.SEARCH_PARAM):
+            cost += SEARCH_COST
+        paginator = getattr(view, 'paginator', None) if getattr(view, 'action', None) == 'list' else None
+        if paginator is not None and paginator.page_size:
+            cost += max(0.0, float(paginator.get_page_size(request) or 0) / paginator.page_size - 1)
+        return cost
+
+    def wait(self):
+        return self.wait_time
+
+
+class ConcurrencyLimiter(object):
+    """The requests being served by this process, in all and per client."""
+
+    def __init__(self, limit, per_client):
+        self.limit = limit
+        self.per_client = per_client
+        self.lock = threading.Lock()
+        self.active = 0
+        self.clients = {}  # client -> requests being served
+
+    def acquire(self, client):
+        """None when the request may go on, else the status to turn it away with:
+        503 when the process serves its limit, 429 when the client does"""
+        with self.lock:
+            if self.limit and self.active >= self.limit:
+                return 503
+            if client is not None and self.per_client and self.clients.get(client, 0) >= self.per_client:
+                return 429
+            self.active += 1
+            if client is not None:
+                self.clients[client] = self.clients.get(client, 0) + 1
+        return None
+
+    def release(self, client):
+        with self.lock:
+            self.active -= 1
+            if client is not None:
+                count = self.clients.pop(client) - 1
+                if count:
+                    self.clients[client] = count
+
+
+limiter = ConcurrencyLimiter(MAX_CONCURRENT, MAX_CONCURRENT_PER_CLIENT)
+
+
+def client_key(request):
+    """who sends the request, without a query: a digest of its credentials or session, or its address"""
+    credentials = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if credentials:
+        return hashlib.sha1(credentials.encode('utf-8')).hexdigest()  # the credentials are not kept in memory
+    return BaseThrottle().get_ident(request)  # the client's address, not the proxy's
+
+
+class Slot(object):
+    """The place of a streamed response in the limiter, given back when the server closes the response."""
+
+    def __init__(self, client):
+        self.client = client
+        self.closed = False
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            limiter.release(self.client)
+
+
+class ConcurrencyLimitMiddleware(object):
+    """Turns requests away before the session, the authentication and the view are run, once this process serves
+    MAX_CONCURRENT requests (503) or the client MAX_CONCURRENT_PER_CLIENT (429). The long lived paths of
+    EXEMPT_PATHS (event streams, metrics scrapes) are not counted."""
+
+    messages = {
+        503: 'The server is busy, try again shortly.',
+        429: 'Too many requests at once, wait for the others to finish.',
+    }
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if EXEMPT_PATHS.match(request.path_info):
+            return self.get_response(request)
+        client = client_key(request) if is_enabled() else None
+        status = limiter.acquire(client)
+        if status is not None:
+            response = JsonResponse({'detail': self.messages[status]}, status=status)
+            response['Retry-After'] = '1'
+            return response
+        slot = Slot(client)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            slot.close()
+            raise
+        if response.streaming:
+            response._closable_objects.append(slot)  # exports read the database while they are sent
+        else:
+            slot.close()
+        return response
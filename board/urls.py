@@ -10,3 +10,5 @@ router = DefaultRouter(trailing_slash=False)  # for consistency with backbone's
 router.register(r'sprints', views.SprintViewSet)
 router.register(r'tasks', views.TaskViewSet)
 router.register(r'users', views.UserViewSet)
+router.register(r'changes', views.ChangeViewSet, base_name='change')  # delta sync
+router.register(r'stats', views.StatsViewSet, base_name='stats')  # sprint analytics
@@ -1,56 +1,615 @@
-from django.shortcuts import render
+import calendar  # timestamps for Last-Modified
+import datetime
+import functools
+import hashlib  # for building ETags
+import heapq  # merges the task table and archive exports
+from collections import OrderedDict  # keep the status groups in board order
 
-from rest_framework import authentication, permissions, viewsets, filters  # viewSets related libs for creating resource lists
+from django.conf import settings
+from django.db import (  # a lost replica connection
+    DatabaseError, InterfaceError, OperationalError, connections, transaction)
+from django.http import Http404, StreamingHttpResponse  # exports are written while they are read
+
+from django.shortcuts import get_object_or_404, render
+from django.utils.cache import get_conditional_response  # answers If-None-Match / If-Modified-Since
+from django.utils import timezone
+from django.utils.encoding import force_text
+from django.utils.http import http_date
+
+from rest_framework import exceptions, permissions, status, viewsets, filters  # viewSets related libs for creating
+# resource lists
+from rest_framework.decorators import detail_route, list_route  # extra end points on a resource
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import archive, bulk, cache, events, replicas, stats  # the task archive, batch writes, the response cache,
+# live events, read replicas and the sprint statistics
+from .authentication import CachedBasicAuthentication, CachedTokenAuthentication
 
 from django.contrib.auth import get_user_model  # for a uniformed user model
-from .models import Sprint, Task  # the Sprint model
+from .filters import (  # query parameters
+    ArchivedTaskFilter, FullTextSearchFilter, KeysetOrderingFilter, SprintFilter, TaskFilter)
+from .models import ArchivedTask, Change, CollectionVersion, Sprint, Task  # the Sprint model
+from .pagination import DefaultPagination, SprintPagination, TaskPagination  # page styles for the resources
+from .renderers import COLUMNAR_RENDERERS, CSVRenderer, EventStreamRenderer, NDJSONRenderer  # compact and streamed
+# formats
 from .serializers import SprintSerializer, TaskSerializer, UserSerializer  # the serializer
+from .throttling import TokenBucketThrottle  # token buckets per user and action
 
 User = get_user_model()  # the uniformed user model
 
 
 class DefaultsMixin(object):
     """Default settings for view authentication, permissions, filtering and pagination."""
-    authentication_classes = (  # authentication from rest-framework
-        authentication.BasicAuthentication,
-        authentication.TokenAuthentication,
+    authentication_classes = (  # authentication from rest-framework, remembering the checked credentials
+        CachedBasicAuthentication,
+        CachedTokenAuthentication,
     )
     permission_classes = (
         permissions.IsAuthenticated,
     )
-    paginate_by = 25
-    paginate_by_param = 'page_size'
-    max_paginate_by = 100
+    throttle_classes = (  # per user and action, throttle_scope names the resource
+        TokenBucketThrottle,
+    )
+    pagination_class = DefaultPagination  # page number pagination, page_size up to 100
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer, ) + COLUMNAR_RENDERERS  # columnar ones by Accept only
     filter_backends = (  # filters from rest-framework
         filters.DjangoFilterBackend,  # the base
-        filters.SearchFilter,  # need a search field in viewsets
-        filters.OrderingFilter,  # order field in viewsets
+        FullTextSearchFilter,  # need a search field in viewsets, ranked full text search on PostgreSQL
+        KeysetOrderingFilter,  # order field in viewsets, the keyset pages need fields that are never null
     )
 
 
-class SprintViewSet(DefaultsMixin, viewsets.ModelViewSet):
+class ReplicaReadsMixin(object):
+    """Safe reads of the replica_actions from a read replica (board.replicas), unless the user wrote in the last
+    replicas.STICKY seconds. A request whose replica fails is served again without it, by the primary at last."""
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super(ReplicaReadsMixin, self).initial(request, *args, **kwargs)  # the user is known from here
+        if (replicas.REPLICAS and request.method in permissions.SAFE_METHODS and self.action in self.replica_actions
+                and not replicas.is_sticky(request.user)):
+            replicas.use_replica(replicas.choose_replica())
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            while True:
+                try:
+                    response = super(ReplicaReadsMixin, self).dispatch(request, *args, **kwargs)
+                    break
+                except (OperationalError, InterfaceError):
+                    alias = replicas.get_replica()
+                    if alias is None:  # the primary failed
+                        raise
+                    replicas.health.mark_down(alias)  # a safe read, run it again on another one
+        finally:
+            replicas.use_replica(None)  # the thread serves other requests next
+        user = self.request.user  # authenticated by DRF's request, not the one of the middleware
+        if (replicas.REPLICAS and request.method not in permissions.SAFE_METHODS and response.status_code < 400
+                and user.is_authenticated):
+            replicas.stick(user)  # its next reads see the write
+        return response
+
+
+class ConditionalGetMixin(object):
+    """ETag and Last-Modified on list and detail responses, taken from the versions of the collections shown.
+
+    A request whose validators still match gets a 304 before the queryset is run or serialized."""
+    version_collections = ()  # the CollectionVersion names the representation depends on
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, self.version_collections,
+                                         super(ConditionalGetMixin, self).list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, self.version_collections,
+                                         super(ConditionalGetMixin, self).retrieve, *args, **kwargs)
+
+    def conditional_response(self, request, collections, view, *args, **kwargs):
+        """call the view only when the client copy is stale, then add the validators to the response"""
+        versions = CollectionVersion.get_versions(collections)
+        etag = self.get_etag(request, versions)
+        last_modified = max([updated_at for name, version, updated_at in versions if updated_at] or [None])
+        last_modified = last_modified and calendar.timegm(last_modified.utctimetuple())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = view(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def get_etag(self, request, versions):
+        """the same url, representation and user see the same data as long as the collections are unchanged"""
+        key = '|'.join([
+            request.get_full_path(),
+            request.accepted_media_type or '',  # browsable API and json differ
+            str(request.user.pk),
+        ] + ['{}:{}'.format(name, version) for name, version, updated_at in versions])
+        return '"{}"'.format(hashlib.md5(key.encode('utf-8')).hexdigest())
+
+
+class CachedListMixin(object):
+    """Serve repeated list requests from the response cache until a write to the collections they show."""
+
+    def list(self, request, *args, **kwargs):
+        if not cache.ENABLED:
+            return super(CachedListMixin, self).list(request, *args, **kwargs)
+        key = cache.get_key(request, request.resolver_match.url_name,
+                            self.get_cache_scope(request), self.get_cache_dependencies(request))
+        data = cache.get_response(key)
+        if data is not None:
+            return Response(data)
+        response = super(CachedListMixin, self).list(request, *args, **kwargs)
+        if response.status_code == 200 and replicas.get_replica() is None:
+            # read on a replica the data may predate the write that started this generation, served from the cache
+            # to the writer it would break the read your writes of the sticky reads
+            cache.set_response(key, response.data)
+        return response
+
+    def get_cache_scope(self, request):
+        """the permission scope, responses are only shared by users allowed to see the same data"""
+        return 'staff' if request.user.is_staff else 'user'
+
+    def get_cache_dependencies(self, request):
+        """the cache generations the list depends on"""
+        return self.version_collections
+
+
+class SparseFieldsMixin(object):
+    """?fields=id,name keeps only the given fields of the objects and ?omit=description leaves fields out.
+
+    On list and detail responses the queryset loads only the columns the kept fields read,
+    so an omitted description is neither fetched nor serialized."""
+
+    def get_sparse_fields(self):
+        """the fields and omit arguments of the serializer, None when the request asks for every field"""
+        if self.action not in ('list', 'retrieve') or self.request.method != 'GET':
+            return None
+        params = self.request.query_params
+        if 'fields' not in params and 'omit' not in params:
+            return None
+        sparse = dict((name, set(field.strip() for field in params[name].split(',') if field.strip())
+                       if name in params else None) for name in ('fields', 'omit'))
+        known = self.get_serializer_class().Meta.fields
+        unknown = dict((name, ['Unknown fields {}, use some of: {}.'.format(
+            ', '.join(sorted(names - set(known))), ', '.join(known))])
+            for name, names in sparse.items() if names is not None and names - set(known))
+        if unknown:  # a misspelt name would drop the field or every other one without a word
+            raise exceptions.ValidationError(unknown)
+        return sparse
+
+    def get_queryset(self):
+        queryset = super(SparseFieldsMixin, self).get_queryset()
+        sparse = self.get_sparse_fields()
+        if sparse is None:
+            return queryset
+        serializer_class = self.get_serializer_class()
+        columns = serializer_class.get_columns(serializer_class.select_fields(serializer_class.Meta.fields, **sparse))
+        relations = set(column.split('__')[0] for column in columns if '__' in column)
+        # joins the kept fields do not read are dropped, a deferred relation cannot be select_related
+        return queryset.select_related(None).select_related(*relations).only(*(columns | relations))
+
+    def get_serializer(self, *args, **kwargs):
+        sparse = self.get_sparse_fields()
+        if sparse is not None:
+            kwargs.update(sparse)
+        return super(SparseFieldsMixin, self).get_serializer(*args, **kwargs)
+
+
+class ValuesListMixin(object):
+    """List pages are read as values() rows and represented by the serializer's read-only fast path
+    (get_row_reader), no model instances and no per field serializer calls; the same JSON as the full serializer,
+    which the other actions keep."""
+
+    def list(self, request, *args, **kwargs):
+        columns, represent = self.get_serializer_class().get_row_reader(self.get_serializer_context(),
+                                                                        **(self.get_sparse_fields() or {}))
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.values(*(columns | set(queryset.query.annotations)))  # the search rank stays a key
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(represent(page))
+        return Response(represent(queryset))
+
+
+class ExportMixin(object):
+    """A streamed export of the whole filtered collection, as NDJSON (the default) or CSV with ?format=csv.
+
+    Rows are read as tuples with values_list() through iterator(), a server-side cursor on PostgreSQL,
+    and written in chunks as they arrive, so memory stays flat however many rows there are."""
+    export_fields = ()  # (column, lookup) pairs
+    export_ordering = ('id', )  # when the filters leave the queryset unordered
+
+    @list_route(methods=['get'], renderer_classes=(NDJSONRenderer, CSVRenderer))
+    def export(self, request, format=None):
+        queryset = self.filter_queryset(self.get_queryset())  # the same filters, search and ordering as the list
+        if not queryset.query.order_by:
+            queryset = queryset.order_by(*self.export_ordering)
+        rows = self.get_export_values(queryset)
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(self.get_export_columns(), self.get_export_rows(rows)),
+            content_type='{}; charset={}'.format(renderer.media_type, renderer.charset))
+        response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(
+            queryset.model._meta.verbose_name_plural, renderer.format)
+        return response
+
+    def get_export_columns(self):
+        return [column for column, lookup in self.export_fields]
+
+    def get_export_values(self, queryset):
+        """the rows of the ordered queryset, tuples of the export_fields lookups"""
+        return queryset.values_list(*[lookup for column, lookup in self.export_fields]).iterator()
+
+    def get_export_rows(self, rows):
+        """the rows as read, override to add computed values"""
+        return rows
+
+
+class SprintViewSet(DefaultsMixin, ReplicaReadsMixin, ConditionalGetMixin, CachedListMixin, ExportMixin,
+                    ValuesListMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     """API endpoint for listing and creating sprints."""
     queryset = Sprint.objects.order_by('end')  # sort by end date desc
     serializer_class = SprintSerializer  # appoint it's own serializer
+    pagination_class = SprintPagination  # keyset pages on (end, id), no count query
     # filtering options
+    filter_class = SprintFilter  # allow filter by end date range
     search_fields = ('name', )  # allow search by these fields
     ordering_fields = ('end', 'name', )  # allow order by these fields
+    version_collections = (CollectionVersion.SPRINTS, )
+    throttle_scope = 'sprint'
+    export_fields = (('id', 'id'), ('name', 'name'), ('description', 'description'), ('end', 'end'), )
+    export_ordering = ('end', 'id', )
+    replica_actions = ('list', 'retrieve', 'board', )  # the board is the sprint page's read
+
+    @detail_route(methods=['get'])
+    def board(self, request, pk=None):
+        """the sprint, its tasks grouped by status in board order and the users assigned to them, in one response"""
+        collections = (CollectionVersion.SPRINTS, CollectionVersion.TASKS, CollectionVersion.USERS)
+        return self.conditional_response(request, collections, self.render_board, pk=pk)
+
+    @detail_route(methods=['get'])
+    def stats(self, request, pk=None):
+        """burndown, status counts, per-user throughput and cycle time of the sprint"""
+        return Response(stats.get_sprint_stats(self.get_object()))
 
+    @detail_route(methods=['get'], url_path='events', authentication_classes=events.AUTHENTICATORS,
+                  renderer_classes=(EventStreamRenderer, JSONRenderer))
+    def event_stream(self, request, pk=None):
+        """changes to the sprint and its tasks as Server-Sent Events. The ASGI server (scrum.asgi) answers this path
+        itself without holding a thread, here a worker serves the stream until events.SYNC_TIMEOUT"""
+        sprint = self.get_object()
+        response = StreamingHttpResponse(events.stream(events.sprint_channel(sprint.pk)),
+                                         content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # proxies pass each event on at once
+        return response
 
-class TaskViewSet(DefaultsMixin, viewsets.ModelViewSet):
+    def render_board(self, request, pk=None):
+        """build the board response, only called when the client copy is stale"""
+        sprint = self.get_object()
+        tasks = list(Task.objects.filter(sprint=sprint).select_related(  # users and profiles come with the tasks
+            'assigned', 'assigned__profile').order_by('order', 'id'))
+        if sprint.end < datetime.date.today():  # a closed sprint, its done tasks may be archived
+            tasks.extend(ArchivedTask.objects.filter(sprint=sprint).select_related('assigned', 'assigned__profile'))
+            tasks.sort(key=lambda task: (task.order, task.id))
+        context = self.get_serializer_context()  # shared, so the link templates are built once
+        grouped = OrderedDict((code, []) for code, label in Task.STATUS_CHOICES)
+        users = OrderedDict()
+        for task in tasks:
+            grouped[task.status].append(task)
+            if task.assigned_id:
+                users[task.assigned_id] = task.assigned
+        return Response(OrderedDict([
+            ('sprint', SprintSerializer(sprint, context=context).data),
+            ('tasks', OrderedDict(
+                (code, TaskSerializer(group, many=True, context=context).data)
+                for code, group in grouped.items())),
+            ('users', UserSerializer(list(users.values()), many=True, context=context).data),
+        ]))
+
+
+class TaskViewSet(DefaultsMixin, ReplicaReadsMixin, ConditionalGetMixin, CachedListMixin, ExportMixin,
+                  ValuesListMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     """API endpoint for listing and creating tasks."""
-    queryset = Task.objects.all()
+    queryset = Task.objects.select_related('sprint', 'assigned')  # links need the related rows, load them in one join
     serializer_class = TaskSerializer
+    pagination_class = TaskPagination  # keyset pages on (order, id), no count query
     # filtering options
+    filter_class = TaskFilter  # allow filter by sprint, status, assigned user and backlog
     search_fields = ('name', 'description', )  # allow search by these fields
-    ordering_fields = ('name', 'order', 'started', 'due', 'completed', )  # allow order by these fields
+    ordering_fields = ('name', 'order', )  # allow order by these fields, the dates may be null
+    version_collections = (CollectionVersion.TASKS, CollectionVersion.USERS, )  # tasks show the assigned username
+    throttle_scope = 'task'
+    max_bulk_items = 500  # tasks per bulk request
+    export_fields = (
+        ('id', 'id'), ('name', 'name'), ('description', 'description'), ('sprint', 'sprint_id'),
+        ('status', 'status'), ('order', 'order'), ('assigned', 'assigned__' + User.USERNAME_FIELD),
+        ('started', 'started'), ('due', 'due'), ('completed', 'completed'),
+    )
+    export_ordering = ('order', 'id', )  # board order, as the list pages
+
+    def get_cache_dependencies(self, request):
+        """lists of one sprint or of the backlog only depend on the tasks in it"""
+        sprint = request.query_params.get('sprint', '')
+        if request.query_params.get('backlog') in ('True', 'true', '1'):
+            return (cache.sprint_scope(None), CollectionVersion.USERS, )
+        if sprint.isdigit():
+            return (cache.sprint_scope(int(sprint)), CollectionVersion.USERS, )
+        return self.version_collections
+
+    def get_object(self):
+        """an archived task is still found by its id, for reading"""
+        try:
+            return super(TaskViewSet, self).get_object()
+        except Http404:
+            if self.request.method not in permissions.SAFE_METHODS:
+                raise  # the archive is read only
+            task = get_object_or_404(ArchivedTask.objects.select_related('sprint', 'assigned'),
+                                     pk=self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+            self.check_object_permissions(self.request, task)
+            return task
+
+    def paginate_queryset(self, queryset):
+        """the list of a sprint with archived tasks reads the task table and the archive as one"""
+        archived = self.get_archived_queryset(queryset)
+        if archived is None:
+            return super(TaskViewSet, self).paginate_queryset(queryset)
+        return self.paginator.paginate_querysets([queryset, archived], self.request, view=self)
+
+    def get_archived_queryset(self, queryset):
+        """the archived tasks the list's filters, search and ordering select, None when the list is not
+        of a sprint with archived tasks"""
+        sprint = self.request.query_params.get('sprint', '')
+        if not sprint.isdigit() or not archive.has_archived_tasks(int(sprint)):
+            return None
+        archived = ArchivedTaskFilter(self.request.query_params, queryset=ArchivedTask.objects.select_related(
+            'sprint', 'assigned'), request=self.request).qs  # the filter set of the task table is for its model
+        for backend in self.filter_backends:
+            if not issubclass(backend, filters.DjangoFilterBackend):
+                archived = backend().filter_queryset(self.request, archived, self)
+        if queryset._fields is not None:  # values() rows, the same columns
+            archived = archived.values(*queryset._fields)
+        return archived
+
+    def perform_update(self, serializer):
+        """a task archived since it was read is gone for writes, Task.save does not insert it again"""
+        try:
+            with transaction.atomic():  # the failed save leaves an outer transaction usable
+                super(TaskViewSet, self).perform_update(serializer)
+        except DatabaseError:
+            if Task.objects.filter(pk=serializer.instance.pk).exists():
+                raise
+            raise Http404
+
+    def get_export_values(self, queryset):
+        """the export of a sprint with archived tasks reads the archive too, both tables read in the order of
+        the list pages (the keyset ordering) and merged as they stream"""
+        archived = self.get_archived_queryset(queryset)
+        if archived is None:
+            return super(TaskViewSet, self).get_export_values(queryset)
+        ordering = self.paginator.get_ordering(self.request, queryset, self)  # not null, comparable in Python
+        lookups = [lookup for column, lookup in self.export_fields]
+        width = len(lookups)
+
+        def compare(row, other):
+            for index, field in enumerate(ordering, width):
+                if row[index] != other[index]:
+                    return (-1 if row[index] < other[index] else 1) * (-1 if field.startswith('-') else 1)
+            return 0
 
+        keys = [field.lstrip('-') for field in ordering]  # read after the exported columns, left out once merged
+        tables = [rows.order_by(*ordering).values_list(*(lookups + keys)).iterator() for rows in (queryset, archived)]
+        return (row[:width] for row in heapq.merge(*tables, key=functools.cmp_to_key(compare)))
 
-class UserViewSet(DefaultsMixin, viewsets.ModelViewSet):  # allow modification to user in the API endpoints
+    def get_export_columns(self):
+        return super(TaskViewSet, self).get_export_columns() + ['status_display']
+
+    def get_export_rows(self, rows):
+        """add the status label, as the serializer shows it"""
+        labels = dict((code, force_text(label)) for code, label in Task.STATUS_CHOICES)
+        status_index = self.get_export_columns().index('status')
+        for row in rows:
+            yield row + (labels.get(row[status_index]), )
+
+    @list_route(methods=['post'])
+    def bulk(self, request):
+        """create and update many tasks in one request, items with an id are partial updates, the others creates.
+
+        All the items are validated first, with the tasks and sprints looked up once for the whole batch,
+        then written in one transaction, or not at all when an item is invalid."""
+        items = request.data
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise exceptions.ParseError('Expected a list of tasks.')
+        if len(items) > self.max_bulk_items:
+            raise exceptions.ParseError('At most {} tasks per request.'.format(self.max_bulk_items))
+
+        try:
+            ids = [int(item['id']) for item in items if 'id' in item]
+        except (TypeError, ValueError):
+            raise exceptions.ParseError('Task ids must be integers.')
+        instances = Task.objects.select_related('sprint', 'assigned').in_bulk(ids)
+        sprint_ids = set(item['sprint'] for item in items if str(item.get('sprint', '')).isdigit())
+        context = self.get_serializer_context()
+        context['sprints'] = Sprint.objects.in_bulk(sprint_ids)  # shared by every item's sprint field
+
+        pending, errors = [], []
+        for item in items:
+            instance = instances.get(int(item['id'])) if 'id' in item else None
+            if 'id' in item and instance is None:
+                errors.append({'id': ['Task {} does not exist.'.format(item['id'])]})
+                continue
+            serializer = TaskSerializer(instance, data=item, partial=instance is not None, context=context)
+            errors.append({} if serializer.is_valid() else serializer.errors)
+            pending.append(serializer)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        created, updated, fields, touched = [], [], set(), set()
+        now = timezone.now()
+        for serializer in pending:
+            data = serializer.validated_data
+            if serializer.instance is None:
+                created.append(Task(**data))
+            else:
+                touched.add(serializer.instance.sprint_id)
+                for name, value in data.items():
+                    setattr(serializer.instance, name, value)
+                serializer.instance.updated_at = now
+                fields.update(data)
+                updated.append(serializer.instance)
+        if fields:
+            fields.add('updated_at')
+        touched.update(task.sprint_id for task in created + updated)
+        with transaction.atomic():
+            bulk.bulk_create(created)
+            bulk.bulk_update(updated, fields)
+            bulk.record_task_writes(created, updated, touched)
+        created = iter(created)
+        tasks = [serializer.instance or next(created) for serializer in pending]
+        return Response(TaskSerializer(tasks, many=True, context=context).data)
+
+
+class UserViewSet(DefaultsMixin, ReplicaReadsMixin, ConditionalGetMixin, CachedListMixin, ValuesListMixin,
+                  SparseFieldsMixin, viewsets.ModelViewSet):  # allow modification to user in the API endpoints
     """API endpoint for listing users."""
+    throttle_scope = 'user'
     lookup_field = User.USERNAME_FIELD  # search user by username instead of key id
     lookup_url_kwarg = User.USERNAME_FIELD  # for consistency
-    queryset = User.objects.order_by(User.USERNAME_FIELD)
+    queryset = User.objects.select_related('profile').order_by(User.USERNAME_FIELD)  # profile fields in the same query
     serializer_class = UserSerializer
     # filtering options
     search_fields = (User.USERNAME_FIELD, )  # allow search by these fields
+    version_collections = (CollectionVersion.USERS, )
+
+
+class ChangeGone(exceptions.APIException):
+    status_code = 410
+    default_detail = 'The changes since this cursor are no longer kept, fetch the collections again.'
+
+
+class ChangeViewSet(DefaultsMixin, viewsets.ViewSet):
+    """API endpoint for delta sync, the rows of each collection created, updated or deleted since a cursor."""
+    throttle_scope = 'change'
+    max_changes = 1000  # change log rows read per response, the client asks again while more is true
+    # a missing id below a visible change is a write not committed yet, which the cursor waits for, or one rolled
+    # back, passed at once: the cursor waits while a transaction begun before the change after the gap is open.
+    # gap_timeout covers the clock differences between the app servers, which date the changes, and the database
+    gap_timeout = datetime.timedelta(seconds=getattr(settings, 'BOARD_CHANGES_GAP_TIMEOUT', 5))
+    collections = (  # name, queryset and serializer of each synced collection
+        (CollectionVersion.SPRINTS, Sprint.objects.all(), SprintSerializer),
+        (CollectionVersion.TASKS, Task.objects.select_related('sprint', 'assigned'), TaskSerializer),
+        (CollectionVersion.USERS, User.objects.select_related('profile'), UserSerializer),
+    )
+    archives = {  # rows moved out of a collection's table without a change, read from there instead
+        CollectionVersion.TASKS: ArchivedTask.objects.select_related('sprint', 'assigned'),
+    }
+
+    def list(self, request, format=None):
+        since = request.query_params.get('since')
+        if since is None:  # no cursor yet, the client reads the collections next
+            return Response(self.get_payload(self.get_committed_cursor(), False, {}, {}))
+        try:
+            since = int(since)
+        except ValueError:
+            raise exceptions.ParseError('since must be a cursor returned by this end point.')
+        first = Change.objects.order_by('id').values_list('id', flat=True).first()
+        if first is not None and since < first - 1:  # the log was pruned past the cursor
+            raise ChangeGone()
+
+        rows = list(Change.objects.filter(id__gt=since).order_by('id').values_list(
+            'id', 'collection', 'object_id', 'action', 'created_at')[:self.max_changes])
+        changes = self.get_committed(since, rows)
+        last_actions = dict(((collection, object_id), action) for _, collection, object_id, action, _ in changes)
+        changed, deleted = {}, {}
+        for (collection, object_id), action in last_actions.items():
+            target = deleted if action == Change.ACTION_DELETED else changed
+            target.setdefault(collection, set()).add(object_id)
+        cursor = changes[-1][0] if changes else since
+        more = len(changes) == self.max_changes  # not when held at a gap, asking again would not get past it
+        return Response(self.get_payload(cursor, more, changed, deleted))
+
+    def get_committed(self, since, rows):
+        """the change rows (id, ..., created_at) after since up to the first gap in the ids that may still commit"""
+        expected = since + 1
+        for index, row in enumerate(rows):
+            if row[0] != expected:
+                open_since = self.get_open_since()
+                if open_since is not None and open_since < row[-1] + self.gap_timeout:
+                    return rows[:index]
+            expected = row[0] + 1
+        return rows
+
+    def get_open_since(self):
+        """when the oldest transaction that may still commit a change began, None when none is open.
+
+        PostgreSQL tells from pg_stat_activity (the sessions of the app's database role). SQLite writes one
+        transaction at a time, a change visible above a gap was written after the gap's transaction ended. Other
+        databases are taken to have one just begun"""
+        if not hasattr(self, '_open_since'):  # once per request
+            connection = connections[Change.objects.db]
+            if connection.vendor == 'sqlite':
+                self._open_since = None
+            elif connection.vendor != 'postgresql':
+                self._open_since = timezone.now()
+            else:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT MIN(xact_start) FROM pg_stat_activity WHERE datname = current_database() '
+                                   'AND pid <> pg_backend_pid() AND xact_start IS NOT NULL')
+                    self._open_since = cursor.fetchone()[0]
+        return self._open_since
+
+    def get_committed_cursor(self):
+        """the cursor of a client about to read the collections, below every change that may still commit"""
+        open_since = self.get_open_since()
+        if open_since is None:  # every change is committed
+            cursor = Change.objects.order_by('-id').values_list('id', flat=True).first()
+        else:  # a change written before the oldest open transaction began is settled
+            cursor = Change.objects.filter(created_at__lt=open_since - self.gap_timeout).order_by(
+                '-id').values_list('id', flat=True).first()
+        if cursor is None:  # an empty log or all of it recent: from its first row, as the 410 check wants
+            cursor = (Change.objects.order_by('id').values_list('id', flat=True).first() or 1) - 1
+        recent = self.get_committed(cursor, list(
+            Change.objects.filter(id__gt=cursor).order_by('id').values_list('id', 'created_at')))
+        return recent[-1][0] if recent else cursor
+
+    def get_payload(self, cursor, more, changed, deleted):
+        """the current state of the changed rows, from the archive for the archived ones, rows gone in the
+        meantime are reported as deleted"""
+        context = {'request': self.request, 'format': self.format_kwarg, 'view': self}
+        payload = OrderedDict([('cursor', cursor), ('more', more)])
+        gone = OrderedDict()
+        for name, queryset, serializer_class in self.collections:
+            ids = changed.get(name, set())
+            rows = list(queryset.filter(pk__in=ids).order_by('pk')) if ids else []
+            missing = ids - set(row.pk for row in rows)
+            if missing and name in self.archives:
+                rows = sorted(rows + list(self.archives[name].filter(pk__in=missing)), key=lambda row: row.pk)
+            payload[name] = serializer_class(rows, many=True, context=context).data
+            gone[name] = sorted(deleted.get(name, set()) | (ids - set(row.pk for row in rows)))
+        payload['deleted'] = gone
+        return payload
+
+
+class StatsViewSet(DefaultsMixin, viewsets.ViewSet):
+    """API endpoint for statistics across sprints."""
+    throttle_scope = 'stats'
+
+    @list_route(methods=['get'])
+    def velocity(self, request, format=None):
+        """tasks done per sprint, the sprints can be narrowed with end_min and end_max"""
+        sprints = SprintFilter(request.query_params, queryset=Sprint.objects.all()).qs
+        return Response(stats.get_velocity(sprints))
+
+
+class ResponseCacheStatsView(DefaultsMixin, APIView):
+    """Hit and miss counts of the list response cache, for admins."""
+    permission_classes = (
+        permissions.IsAdminUser,
+    )
+
+    def get(self, request, format=None):
+        return Response(cache.get_stats())
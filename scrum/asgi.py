@@ -0,0 +1,230 @@
+"""
+ASGI config for scrum project.
+
+The board event streams (/api/sprints/<id>/events) are served here on the event loop, so an idle listener costs
+a socket and a queue instead of a worker. Every other request goes to the WSGI application of scrum.wsgi
+on a pool of ASGI_THREADS threads, once its body has been read. Run it with the settings of scrum.gunicorn_conf
+or any ASGI server, e.g. ``uvicorn scrum.asgi:application``. Beyond ASGI_MAX_QUEUED requests waiting for a thread,
+a request is answered 503 by the event loop, before it takes a thread or a database connection.
+
+The views never run on the event loop: a request is handed whole to one pool thread, which also iterates and closes
+the response, so the database connection and transaction Django keeps per thread stay with their request.
+The state the threads share (the metrics registry, the credential cache, the event broker) is locked.
+"""
+import asyncio
+import io
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "scrum.settings")
+
+from django.core.handlers.wsgi import WSGIRequest  # noqa: E402, once the settings are known
+from django.db import close_old_connections  # noqa: E402
+
+from scrum.wsgi import application as wsgi_application  # noqa: E402, sets Django up
+from board import events  # noqa: E402
+
+EVENTS_PATH = re.compile(r'^/api/sprints/(?P<pk>\d+)/events/?$')
+THREADS = int(os.environ.get('ASGI_THREADS', 10))  # WSGI requests served at once per process
+MAX_QUEUED = int(os.environ.get('ASGI_MAX_QUEUED', THREADS * 2))  # waiting for a thread, the others are turned away
+BUSY_HEADERS = [
+    (b'content-type', b'application/json'),
+    (b'retry-after', b'1'),
+]
+EVENT_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),  # proxies pass each event on at once
+]
+
+
+def build_environ(scope, body):
+    """the WSGI environ of an ASGI HTTP request"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),  # WSGI strings are bytes as latin-1
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        environ[name] = environ[name] + ',' + value if name in environ else value  # repeated headers are joined
+    return environ
+
+
+async def read_body(receive):
+    body = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(body)
+
+
+def run_with_connections(function, *args):
+    """call a function touching the database in a pool thread, its connections are looked after
+    as Django does around a request"""
+    close_old_connections()
+    try:
+        return function(*args)
+    finally:
+        close_old_connections()
+
+
+class WSGIBridge(object):
+    """Serves ASGI HTTP requests with a WSGI application on a pool of threads, streamed responses chunk by chunk.
+    Once the pool is busy and max_queued requests wait for it, the next ones are answered 503 at once."""
+
+    def __init__(self, application, threads, max_queued):
+        self.application = application
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='django')
+        self.limit = threads + max_queued
+        self.pending = 0  # requests handed to the pool and not done, only counted on the event loop
+
+    async def __call__(self, scope, receive, send):
+        if self.pending >= self.limit:
+            await send({'type': 'http.response.start', 'status': 503, 'headers': BUSY_HEADERS})
+            await send({'type': 'http.response.body', 'body': b'{"detail": "The server is busy, try again shortly."}'})
+            return
+        body = await read_body(receive)
+        if body is None:
+            return  # gone before sending the body
+        loop = asyncio.get_event_loop()
+        self.pending += 1
+        try:
+            status, headers, content = await loop.run_in_executor(self.executor, self.run,
+                                                                  build_environ(scope, body), send, loop)
+        finally:
+            self.pending -= 1
+        if content is not None:
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': content})
+
+    def run(self, environ, send, loop):
+        """the WSGI call, in a pool thread; the response is iterated and closed in the same thread,
+        the request_finished receivers hand back its database connections.
+
+        A plain response is returned whole, for the event loop to send. A streamed one (exports, event streams
+        under WSGI) is sent from here chunk by chunk, each chunk waiting for the loop, and None is returned."""
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [int(status.split(' ', 1)[0]),
+                          [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]]
+
+        def call(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        result = self.application(environ, start_response)
+        try:
+            if not getattr(result, 'streaming', False):
+                content = b''.join(result)
+                return started[0], started[1], content
+            sent = False
+            for chunk in result:
+                if not chunk:
+                    continue
+                if not sent:
+                    call({'type': 'http.response.start', 'status': started[0], 'headers': started[1]})
+                    sent = True
+                call({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not sent:
+                call({'type': 'http.response.start', 'status': started[0], 'headers': started[1]})
+            call({'type': 'http.response.body', 'body': b''})
+            return started[0], started[1], None
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+
+django = WSGIBridge(wsgi_application, THREADS, MAX_QUEUED)
+
+
+async def send_response(send, response):
+    """a Django response, for the errors of the event streams"""
+    headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.items()]
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': response.content})
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def event_stream(scope, receive, send, pk):
+    """the Server-Sent Events of a sprint, with the checks of the sprint end points run in a pool thread"""
+    loop = asyncio.get_event_loop()
+    request = WSGIRequest(build_environ(scope, b''))
+    error = await loop.run_in_executor(django.executor, run_with_connections, events.authorize, request, pk)
+    if error is not None:
+        await send_response(send, error)
+        return
+
+    messages = asyncio.Queue()
+    unsubscribe = events.broker.subscribe(events.sprint_channel(pk),
+                                          lambda message: loop.call_soon_threadsafe(messages.put_nowait, message))
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': EVENT_HEADERS})
+        await send({'type': 'http.response.body', 'body': 'retry: {}\n\n'.format(events.RETRY).encode('utf-8'),
+                    'more_body': True})
+        while True:
+            message = asyncio.ensure_future(messages.get())
+            done, pending = await asyncio.wait([message, disconnected], timeout=events.HEARTBEAT,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                message.cancel()
+                break
+            if message in done:
+                text = events.format_event(message.result())
+            else:
+                message.cancel()
+                text = ': keep-alive\n\n'
+            await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+    finally:
+        unsubscribe()
+        disconnected.cancel()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            django.executor.shutdown(wait=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        raise ValueError('Unsupported connection type {}.'.format(scope['type']))
+    match = EVENTS_PATH.match(scope['path'])
+    if match and scope['method'] == 'GET':
+        await event_stream(scope, receive, send, int(match.group('pk')))
+    else:
+        await django(scope, receive, send)
@@ -0,0 +1,57 @@
+"""
+gunicorn settings, as the Procfile uses them: gunicorn -c python:scrum.gunicorn_conf scrum.asgi:application
+
+GUNICORN_WORKER_CLASS picks one of two setups:
+
+- uvicorn.workers.UvicornWorker (the default) serves scrum.asgi. Each worker's event loop reads the requests
+  and serves the board event streams. The Django views run on that worker's pool of threads. A slow client or an idle
+  event listener costs a socket, not a thread. Past ASGI_MAX_QUEUED requests waiting for a thread, the loop answers
+  503 itself.
+- gthread serves scrum.wsgi (gunicorn -c python:scrum.gunicorn_conf scrum.wsgi). A request, or an open event stream,
+  holds one of the worker's threads for as long as it lasts, slow clients included.
+
+Workers default to 2 x CPUs + 1 once the settings share what the app coordinates between processes (the response
+cache, the board events, the credential and throttle caches, see scrum.processes), to 1 until then; gunicorn warns
+at start when WEB_CONCURRENCY asks for more with process local backends. Threads default to 2 x CPUs per worker.
+Either setup keeps up to workers x threads
+database connections open (CONN_MAX_AGE) on the primary and as many on each read replica, so lower WEB_CONCURRENCY
+or GUNICORN_THREADS when a database allows fewer connections than that.
+"""
+import multiprocessing
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scrum.settings')
+
+from django.conf import settings  # noqa: E402
+
+from scrum.processes import process_local_backends  # noqa: E402
+
+cpus = multiprocessing.cpu_count()
+local_backends = process_local_backends()
+
+bind = '0.0.0.0:' + os.environ.get('PORT', '8000')
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'uvicorn.workers.UvicornWorker')
+# processes, for the CPU bound part of the views
+workers = int(os.environ.get('WEB_CONCURRENCY', 1 if local_backends else cpus * 2 + 1))
+settings.WEB_CONCURRENCY = workers  # the app leaves its per process caches out when there are several
+threads = int(os.environ.get('GUNICORN_THREADS', cpus * 2))  # per worker, for the requests waiting on the database
+os.environ.setdefault('ASGI_THREADS', str(threads))  # the ASGI workers run the views on as many threads
+
+preload_app = True  # the app is imported once by the master, the workers share its memory after the fork
+keepalive = 5  # seconds, behind a router reusing its connections
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))  # restart workers after so many requests, 0 never
+max_requests_jitter = max_requests // 10
+
+
+def on_starting(server):
+    if workers > 1:
+        for setting, problem in local_backends:
+            server.log.warning('%s workers with %s kept per process: %s', workers, setting, problem)
+
+
+def pre_fork(server, worker):
+    """close the database connections the master may have opened while preloading,
+    a connection inherited by the workers would be shared between processes"""
+    from django.db import connections
+    for connection in connections.all():
+        connection.close()
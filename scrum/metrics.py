@@ -0,0 +1,235 @@
+"""
+request metrics per route: wall time, database queries and time, render time and response size,
+kept as histograms in memory and exposed to admins in the Prometheus text format
+"""
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+from rest_framework import permissions
+from rest_framework.renderers import BaseRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from board import cache  # the response cache counters
+from board.views import DefaultsMixin
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST = getattr(settings, 'METRICS_SLOW_REQUEST', 1.0)  # seconds, traced requests slower than this are logged
+TRACE_SAMPLE_RATE = getattr(settings, 'METRICS_TRACE_SAMPLE_RATE', 0.0)  # share of requests recording their SQL
+
+# name, help, buckets
+HISTOGRAMS = (
+    ('scrum_request_duration_seconds', 'Wall time of the requests.',
+     (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)),
+    ('scrum_request_queries', 'Database queries per request.',
+     (0, 1, 2, 3, 5, 10, 20, 50, 100)),
+    ('scrum_request_db_seconds', 'Database time per request.',
+     (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)),
+    ('scrum_request_render_seconds', 'Time rendering the response data into the body.',
+     (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)),
+    ('scrum_response_size_bytes', 'Size of the response bodies, streamed responses are left out.',
+     (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)),
+)
+
+CACHE_COUNTERS = (  # name, help, key of the response cache stats
+    ('board_response_cache_hits_total', 'List responses served from the response cache.', 'hits'),
+    ('board_response_cache_misses_total', 'List responses not found in the response cache.', 'misses'),
+)
+
+
+class Histogram(object):
+    """Counts of observations per bucket, with their sum."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry(object):
+    """The metrics of this process, a scrape of each worker gives its own."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = dict((name, {}) for name, help, buckets in HISTOGRAMS)  # name -> labels -> histogram
+        self.requests = defaultdict(int)  # (route, method, status) -> count
+
+    def observe(self, route, method, status, values):
+        """record one request, values maps histogram names to the observed values"""
+        labels = (('route', route), ('method', method))
+        with self.lock:
+            self.requests[labels + (('status', str(status)), )] += 1
+            for name, help, buckets in HISTOGRAMS:
+                if values.get(name) is None:
+                    continue
+                histogram = self.histograms[name].get(labels)
+                if histogram is None:
+                    histogram = self.histograms[name][labels] = Histogram(buckets)
+                histogram.observe(values[name])
+
+    def render(self):
+        """the metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            lines += ['# HELP scrum_requests_total Requests served.', '# TYPE scrum_requests_total counter']
+            lines += ['scrum_requests_total{} {}'.format(format_labels(labels), count)
+                      for labels, count in sorted(self.requests.items())]
+            for name, help, buckets in HISTOGRAMS:
+                lines += ['# HELP {} {}'.format(name, help), '# TYPE {} histogram'.format(name)]
+                for labels, histogram in sorted(self.histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf', ), histogram.counts):
+                        cumulative += count
+                        lines.append('{}_bucket{} {}'.format(name, format_labels(labels + (('le', str(bound)), )),
+                                                             cumulative))
+                    lines.append('{}_sum{} {!r}'.format(name, format_labels(labels), histogram.sum))
+                    lines.append('{}_count{} {}'.format(name, format_labels(labels), cumulative))
+        counts = cache.get_stats()
+        for name, help, key in CACHE_COUNTERS:
+            lines += ['# HELP {} {}'.format(name, help), '# TYPE {} counter'.format(name),
+                      '{} {}'.format(name, counts[key])]
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    escaped = [(key, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for key, value in labels]
+    return '{' + ','.join('{}="{}"'.format(key, value) for key, value in escaped) + '}'
+
+
+registry = Registry()
+
+
+class WrappedCursor(CursorWrapper):
+    """Cursor handing its statements to a wrapper, the execute_wrapper() hook of Django 2.0 for Django 1.11."""
+
+    def __init__(self, cursor, db, wrapper):
+        super(WrappedCursor, self).__init__(cursor, db)
+        self.wrapper = wrapper
+
+    def execute(self, sql, params=None):
+        return self.wrapper(self._execute, sql, params, False, {'connection': self.db, 'cursor': self})
+
+    def executemany(self, sql, param_list):
+        return self.wrapper(self._execute, sql, param_list, True, {'connection': self.db, 'cursor': self})
+
+    def _execute(self, sql, params, many, context):
+        if many:
+            return super(WrappedCursor, self).executemany(sql, params)
+        return super(WrappedCursor, self).execute(sql, params)
+
+
+@contextmanager
+def execute_wrapper(connection, wrapper):
+    """run every statement of the connection through wrapper(execute, sql, params, many, context) while active"""
+    if hasattr(connection, 'execute_wrapper'):  # Django 2.0 and later have the hook
+        with connection.execute_wrapper(wrapper):
+            yield
+        return
+    saved = dict((name, connection.__dict__.get(name)) for name in ('make_cursor', 'make_debug_cursor'))
+    make_cursor, make_debug_cursor = connection.make_cursor, connection.make_debug_cursor
+    connection.make_cursor = lambda cursor: WrappedCursor(make_cursor(cursor), connection, wrapper)
+    connection.make_debug_cursor = lambda cursor: WrappedCursor(make_debug_cursor(cursor), connection, wrapper)
+    try:
+        yield
+    finally:
+        for name, method in saved.items():
+            if method is None:
+                del connection.__dict__[name]  # back to the method of the class
+            else:
+                setattr(connection, name, method)
+
+
+class QueryTimer(object):
+    """Execute wrapper counting the statements of a request and their time, and keeping their SQL when tracing."""
+
+    def __init__(self, trace=False):
+        self.count = 0
+        self.time = 0.0
+        self.trace = [] if trace else None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.time()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.time() - start
+            self.count += 1
+            self.time += elapsed
+            if self.trace is not None:
+                self.trace.append((context['connection'].alias, elapsed, sql))
+
+
+class MetricsMiddleware(object):
+    """Records the metrics of every request under its route name, e.g. task-list or sprint-detail."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer(trace=TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE)
+        request._metrics_render_time = None
+        start = time.time()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(execute_wrapper(connection, timer))
+            response = self.get_response(request)
+        duration = time.time() - start
+
+        route = getattr(request.resolver_match, 'url_name', None) or 'unresolved'
+        registry.observe(route, request.method, response.status_code, {
+            'scrum_request_duration_seconds': duration,
+            'scrum_request_queries': timer.count,
+            'scrum_request_db_seconds': timer.time,
+            'scrum_request_render_seconds': request._metrics_render_time,
+            'scrum_response_size_bytes': None if response.streaming else len(response.content),
+        })
+        if timer.trace is not None and duration >= SLOW_REQUEST:
+            logger.warning('Slow request %s %s (%s) %.1fms, %d queries in %.1fms:\n%s',
+                           request.method, request.get_full_path(), route, duration * 1000, timer.count,
+                           timer.time * 1000, '\n'.join('[{}] {:.1f}ms {}'.format(alias, elapsed * 1000, sql)
+                                                        for alias, elapsed, sql in timer.trace))
+        return response
+
+    def process_template_response(self, request, response):
+        """time the rendering of DRF responses, done between this hook and the post render callbacks"""
+        start = time.time()
+
+        def rendered(response):
+            request._metrics_render_time = time.time() - start
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, str):  # an error detail
+            data = '\n'.join('# {}: {}'.format(key, value) for key, value in sorted(data.items())) + '\n'
+        return data.encode(self.charset)
+
+
+class MetricsView(DefaultsMixin, APIView):
+    """The request metrics of this process in the Prometheus text format, for admins."""
+    permission_classes = (
+        permissions.IsAdminUser,
+    )
+    renderer_classes = (PrometheusRenderer, )
+
+    def get(self, request, format=None):
+        return Response(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
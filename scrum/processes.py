@@ -0,0 +1,33 @@
+"""
+what the app keeps per process: with several worker processes (WEB_CONCURRENCY) the writes seen by one worker
+only reach the others through a shared cache and the PostgreSQL event backend
+"""
+from django.conf import settings
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared_cache(alias):
+    """whether the cache alias is seen by every worker, not only the process using it"""
+    return alias is not None and settings.CACHES[alias]['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+
+def process_local_backends():
+    """(setting, what goes wrong with several workers) of each coordination the settings keep in the process"""
+    local = []
+    if not is_shared_cache(getattr(settings, 'BOARD_CACHE_ALIAS', 'default')):
+        local.append(('CACHE_BACKEND', 'list responses are not cached'))
+    if getattr(settings, 'BOARD_EVENTS_BACKEND', 'board.events.LocalBackend') == 'board.events.LocalBackend':
+        local.append(('BOARD_EVENTS_BACKEND', 'board events reach the listeners of the writing worker only'))
+    if not is_shared_cache(getattr(settings, 'BOARD_AUTH_SHARED_CACHE', None)):
+        local.append(('BOARD_AUTH_SHARED_CACHE', 'credentials are checked against the database on every request'))
+    if not is_shared_cache(getattr(settings, 'BOARD_THROTTLE_CACHE', None)):
+        local.append(('BOARD_THROTTLE_CACHE', 'each worker has its own token buckets, a client gets every rate '
+                                              'once per worker'))
+    if getattr(settings, 'BOARD_DATABASE_REPLICAS', ()) and not is_shared_cache(
+            getattr(settings, 'BOARD_REPLICA_STICKY_CACHE', None) or getattr(settings, 'BOARD_CACHE_ALIAS', 'default')):
+        local.append(('BOARD_REPLICA_STICKY_CACHE', 'a client may read from a replica right after its write'))
+    return local
@@ -47,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'scrum.metrics.MetricsMiddleware',  # first, so the time of the whole stack is measured
+    'board.throttling.ConcurrencyLimitMiddleware',  # sheds load before the session and the views are run
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,9 +89,93 @@ DATABASES = {
     }
 }
 
-db_from_env = dj_database_url.config(conn_max_age=500)  # get db from env vars
+# connections are kept CONN_MAX_AGE seconds per thread and alias, long on the primary
+db_from_env = dj_database_url.config(conn_max_age=int(os.environ.get('DATABASE_CONN_MAX_AGE', 500)))  # get db from env
 DATABASES['default'].update(db_from_env)  # update DB
 
+# Read replicas, DATABASE_REPLICA_URLS is a comma separated list of database URLs added as replica1, replica2, ...
+# the list and detail reads of the API go to them (board.replicas), tests use default in their place.
+# Their connections are kept for a shorter time, so a replica taken out or failed over is let go of soon,
+# and a PostgreSQL replica that does not answer fails in seconds, the read goes to another one
+DATABASE_ROUTERS = ['board.replicas.ReplicaRouter']
+BOARD_DATABASE_REPLICAS = []
+for index, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    replica = dj_database_url.parse(url.strip(), conn_max_age=int(os.environ.get('DATABASE_REPLICA_CONN_MAX_AGE', 60)))
+    if 'postgresql' in replica['ENGINE']:
+        replica['OPTIONS'] = {'connect_timeout': int(os.environ.get('DATABASE_REPLICA_CONNECT_TIMEOUT', 2))}
+    replica['TEST'] = {'MIRROR': 'default'}
+    DATABASES['replica{}'.format(index)] = replica
+    BOARD_DATABASE_REPLICAS.append('replica{}'.format(index))
+BOARD_REPLICA_STICKY_SECONDS = 5  # a user reads from the primary so long after a write, above the replication lag
+# cache alias keeping who wrote in the last BOARD_REPLICA_STICKY_SECONDS, the response cache's by default;
+# with replicas and several workers it must be shared by them (memcached, redis), the app refuses to start otherwise
+BOARD_REPLICA_STICKY_CACHE = os.environ.get('BOARD_REPLICA_STICKY_CACHE') or None
+BOARD_REPLICA_RETRY_AFTER = 30  # seconds a replica whose connection failed is left out
+
+
+# Processes serving the app, as gunicorn runs them (scrum.gunicorn_conf), what the app coordinates through
+# process local backends (scrum.processes) only holds with one
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+
+# Cache, locmem per process by default, point it to a shared backend (memcached, redis) in production:
+# the list responses are only cached in a shared one, which the writes of every worker and command invalidate
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'scrum'),
+    }
+}
+BOARD_RESPONSE_CACHE_TIMEOUT = 300  # seconds a list response may be served from the cache at most
+BOARD_AUTH_CACHE_TTL = 60  # seconds a checked token or password is trusted without asking the database
+BOARD_AUTH_CACHE_SIZE = 10000  # credentials remembered per process
+# cache alias shared by the workers, revoked tokens reach every worker at once; without it the credentials are
+# remembered only while one process serves the app (WEB_CONCURRENCY), one could not tell the others of a revocation
+BOARD_AUTH_SHARED_CACHE = os.environ.get('BOARD_AUTH_SHARED_CACHE') or None
+
+
+# Request metrics per route, scraped by admins from /api/_metrics
+# a sample of the requests records its SQL, the ones slower than METRICS_SLOW_REQUEST seconds are logged
+METRICS_TRACE_SAMPLE_RATE = float(os.environ.get('METRICS_TRACE_SAMPLE_RATE', '0.01'))
+METRICS_SLOW_REQUEST = float(os.environ.get('METRICS_SLOW_REQUEST', '1.0'))
+
+
+# Admission control (board.throttling): each user has a token bucket per API action (task.list, sprint.board, ...)
+# refilled at its rate up to one period's worth, a search costs BOARD_THROTTLE_SEARCH_COST more tokens and a page
+# above the default size one more per default page, beyond that the API answers 429 with Retry-After.
+# The buckets are kept in each process, or in the BOARD_THROTTLE_CACHE alias when set to a cache shared by
+# the workers (redis, memcached), and in each process again while it fails. Each process also serves at most
+# BOARD_MAX_CONCURRENT_REQUESTS requests at once (503 beyond, 0 for no limit) and BOARD_MAX_CONCURRENT_PER_CLIENT
+# per client (429 beyond). Anonymous clients are told apart by the address the NUM_PROXIES proxies in front of the
+# app forwarded (X-Forwarded-For), the Heroku router is one.
+# Set BOARD_THROTTLE_ENABLED=0 for a server under benchmark, its clients all use one account
+BOARD_THROTTLE_ENABLED = os.environ.get('BOARD_THROTTLE_ENABLED', '1') == '1'
+BOARD_THROTTLE_RATES = {
+    'default': '600/min',
+    'task.export': '20/min',  # the whole collection each
+    'sprint.export': '20/min',
+}
+BOARD_THROTTLE_SEARCH_COST = 4
+BOARD_THROTTLE_CACHE = os.environ.get('BOARD_THROTTLE_CACHE') or None
+REST_FRAMEWORK = {
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 1 if 'DYNO' in os.environ else 0)),  # DYNO is set on Heroku
+}
+BOARD_MAX_CONCURRENT_REQUESTS = int(os.environ.get('BOARD_MAX_CONCURRENT_REQUESTS', 0))
+BOARD_MAX_CONCURRENT_PER_CLIENT = int(os.environ.get('BOARD_MAX_CONCURRENT_PER_CLIENT', 4))
+BOARD_ADMISSION_EXEMPT_PATHS = (  # long lived or needed under load, not counted
+    r'^/api/sprints/\d+/events/?$',
+    r'^/api/_metrics$',
+    r'^/static/',
+)
+
+
+# Live board events, streamed to the board tabs from /api/sprints/<id>/events by the ASGI server (scrum.asgi)
+# the local backend reaches the listeners of the same process only, with several workers use
+# board.events.PostgresBackend (LISTEN/NOTIFY) so every worker's listeners get every change
+BOARD_EVENTS_BACKEND = os.environ.get('BOARD_EVENTS_BACKEND', 'board.events.LocalBackend')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
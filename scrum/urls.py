@@ -18,11 +18,15 @@ from django.contrib import admin
 from rest_framework.authtoken.views import obtain_auth_token
 
 from board.urls import router  # django-rest routing
+from board.views import ResponseCacheStatsView  # cache counters for scraping
+from scrum.metrics import MetricsView  # request metrics for scraping
 
 from django.views.generic import TemplateView  # generic page view
 
 urlpatterns = [
     url(r'^api/token/', obtain_auth_token, name='api-token'),  # an API token getter
+    url(r'^api/_cache$', ResponseCacheStatsView.as_view(), name='response-cache-stats'),  # admins only
+    url(r'^api/_metrics$', MetricsView.as_view(), name='metrics'),  # admins only, Prometheus text format
     url(r'^api/', include(router.urls)),  # django rest routing, API end points view sets
     url(r'^$', TemplateView.as_view(template_name='board/index.html')),  # for the single page template
     url(r'^admin/', admin.site.urls),  # just for debugging